@@ -1,21 +1,39 @@
-from fastapi import FastAPI, File, UploadFile, Form, Request
+# Imported first: loads .env before any module below reads its configuration.
+import settings  # noqa: F401
+from fastapi import FastAPI, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-import sqlite3
-from sqlite3 import Error
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 import os
-from fastapi import FastAPI, HTTPException
+import json
+import time
+import mimetypes
 
-from step0 import download_static_map
-from step1 import generate_coverage_details
-from step2 import generate_final_report
+from pipeline import analyze_image_pipeline, analyze_location_pipeline, stream_location_pipeline
+from uploads import UploadError, receive_image_upload
+from heatmap import PALETTES, build_heatmap, render_png, to_geojson
+from coverage_grid import get_coverage_grid
+from media import MEDIA_ROOT, MediaError, MediaFiles, choose_format, file_response, get_variant_cache, resolve_media, snap_width
+from history import BUCKET_SECONDS, get_history
+from region import ORTHOPHOTO_MAX_MB, ORTHOPHOTO_TILE_PX, REGION_CONCURRENCY, analyze_orthophoto, analyze_region, parse_bbox
+from jobs import QueueFull, get_job_queue
+from batch import BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY, BATCH_MAX_POINTS, BatchRunner, parse_points_json, parse_points_upload
+from executor import run_blocking, shutdown_executor
+from tile_cache import get_tile_cache
+from coverage_cache import get_coverage_cache
+from clients import client_stats, close_clients
+from step1 import get_coverage_batcher
+from image_prep import prep_stats
+from step2 import get_recommendation_batcher, get_weather_cache
+from recommendation_cache import get_recommendation_cache
+from metrics import HTTP_DURATION, register_collector, render_prometheus
+from resilience import UPSTREAMS, get_upstream, upstream_stats
+from warmup import start_warm_up, warm_up_state
 
 app = FastAPI()
 app.mount("/static", StaticFiles(directory="public"), name="static")
-app.mount("/files", StaticFiles(directory="files"), name="files")
-FILES_DIR = os.path.dirname(__file__)
+app.mount("/files", MediaFiles(directory=MEDIA_ROOT), name="files")
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -24,19 +42,70 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.get("/get-image/{image_name}")
-async def get_image(image_name: str):
-    file_path = os.path.join(FILES_DIR, image_name)
+register_collector("tile_cache", lambda: get_tile_cache().stats())
+register_collector("coverage_cache", lambda: get_coverage_cache().stats())
+register_collector("weather_cache", lambda: get_weather_cache().stats())
+register_collector("recommendation_cache", lambda: get_recommendation_cache().stats())
+register_collector("coverage_grid", lambda: get_coverage_grid().stats())
+register_collector("clients", client_stats)
+register_collector("jobs", lambda: get_job_queue().stats())
+register_collector("llm_batch_coverage", lambda: get_coverage_batcher().stats())
+register_collector("llm_batch_recommendations", lambda: get_recommendation_batcher().stats())
+register_collector("vision_prep", prep_stats)
+register_collector("history", lambda: get_history().stats())
+register_collector("media_variants", lambda: get_variant_cache().stats())
+for _name in UPSTREAMS:
+    register_collector(f"upstream_{_name}", get_upstream(_name).stats)
 
-    # Ensure file is inside the expected directory to prevent path traversal
-    if not os.path.abspath(file_path).startswith(os.path.abspath(FILES_DIR)):
-        raise HTTPException(status_code=400, detail="Invalid file path.")
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_DURATION.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
 
-    # Check if file exists
-    if not os.path.isfile(file_path):
-        raise HTTPException(status_code=404, detail="Image not found.")
+@app.get("/metrics")
+async def metrics():
+    # Collectors read SQLite stats; keep them off the event loop.
+    body = await run_blocking(render_prometheus)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
 
-    return FileResponse(file_path, media_type="image/png")
+@app.get("/get-image/{image_name:path}")
+async def get_image(image_name: str, request: Request, w: int = None, format: str = "auto"):
+    """    Serve an image from MEDIA_ROOT, optionally as a thumbnail or WebP variant.
+
+    Args:
+        image_name (str): Path inside MEDIA_ROOT, with or without its "files/" prefix.
+        w (int): Thumbnail width, rounded up to one of MEDIA_WIDTHS.
+        format (str): "auto" (WebP when the client accepts it), "webp" or "original".
+    Returns:
+        The image with ETag, Last-Modified and Cache-Control; 304 when the client's copy
+        is current, 206 for Range requests.
+    """
+    try:
+        source = path = resolve_media(image_name)
+        source_type = media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        width = snap_width(w)
+        fmt = choose_format(format, request.headers.get("accept", ""), media_type)
+        if width is not None or fmt != "original":
+            path, media_type = await run_blocking(get_variant_cache().get, path, width, fmt)
+    except MediaError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    try:
+        return file_response(path, media_type, request.headers, vary=format == "auto")
+    except OSError:
+        # The variant was pruned between lookup and send; the original is always there.
+        return file_response(source, source_type, request.headers, vary=format == "auto")
 
 
 @app.get("/")
@@ -48,55 +117,333 @@ async def test():
 # async def serve_index():
 #     return FileResponse(os.path.join("publix", "index.html"))
 
+@app.get("/health")
+async def health():
+    """Ready as soon as the server accepts requests; model clients warm up in the background."""
+    return {
+        "status": "success",
+        "ready": True,
+        "warm_up": warm_up_state(),
+    }
+
 @app.post("/analyze-image/")
-async def analyze_image(request: Request, file: UploadFile = File(...)):
-    pass  # Placeholder for future image analysis logic
+async def analyze_image(request: Request):
+    """    Analyze an uploaded image (e.g. drone imagery) without writing it to disk.
+
+    Expects multipart/form-data with the image in `file` and optional form fields
+    city, country, latitude, longitude (for weather and plant recommendations),
+    coverage_backend and debug. The upload is read as a stream with a size cap
+    (UPLOAD_MAX_MB) and hashed as it arrives for the coverage cache.
+    Returns:
+        dict: Result with status, message, image details, coverage and optional final_report.
+    """
+    try:
+        upload = await receive_image_upload(request)
+        fields = upload.fields
+        latitude = float(fields["latitude"]) if fields.get("latitude") else None
+        longitude = float(fields["longitude"]) if fields.get("longitude") else None
+
+        return await analyze_image_pipeline(
+            upload.data,
+            upload.digest,
+            city=fields.get("city"),
+            country=fields.get("country"),
+            latitude=latitude,
+            longitude=longitude,
+            coverage_backend=fields.get("coverage_backend") or None,
+            debug=fields.get("debug", "").lower() in ("1", "true", "yes", "on"),
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid form field: {e}")
 
 @app.post("/analyze-location/")
-async def analyze_location(request: Request, city: str = Form(...),country: str = Form(...),latitude: float = Form(...), longitude: float = Form(...), zoom: int = Form(18)):
+async def analyze_location(request: Request, city: str = Form(...),country: str = Form(...),latitude: float = Form(...), longitude: float = Form(...), zoom: int = Form(18), coverage_backend: str = Form(None), debug: bool = Form(False)):
     """    Analyze a location by downloading a static map and generating a coverage report.
 
     Args:
         latitude (float): Latitude of the location.
         longitude (float): Longitude of the location.
         zoom (int): Zoom level for the static map.
+        coverage_backend (str): "llm", "local" or "crosscheck"; defaults to COVERAGE_BACKEND.
+        debug (bool): Include per-call timings and cache hits in the response.
     Returns:
         dict: Result with status, message, and analysis result.
     """
-    map_result = download_static_map(latitude, longitude, zoom=zoom)
+    return await analyze_location_pipeline(
+        city, country, latitude, longitude, zoom=zoom, coverage_backend=coverage_backend, debug=debug
+    )
+
+@app.post("/analyze-location/stream")
+async def analyze_location_stream(request: Request, city: str = Form(...),country: str = Form(...),latitude: float = Form(...), longitude: float = Form(...), zoom: int = Form(18), coverage_backend: str = Form(None)):
+    """    Analyze a location, streaming partial results as soon as each is known.
+
+    Emits weather, static_map, coverage and season events, then one plant event per
+    recommendation while the model is still generating, and a final done event with the
+    full result. Sent as Server-Sent Events when the client accepts text/event-stream,
+    otherwise as NDJSON lines of {"event": ..., "data": ...}.
+    """
+    events = stream_location_pipeline(city, country, latitude, longitude, zoom=zoom, coverage_backend=coverage_backend)
+
+    if "text/event-stream" in request.headers.get("accept", ""):
+        async def sse():
+            async for event in events:
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+        return StreamingResponse(sse(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    async def ndjson():
+        async for event in events:
+            yield json.dumps(event, default=str) + "\n"
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.post("/jobs/analyze-location/", status_code=202)
+async def submit_location_job(request: Request, city: str = Form(...),country: str = Form(...),latitude: float = Form(...), longitude: float = Form(...), zoom: int = Form(18), coverage_backend: str = Form(None)):
+    """    Queue a location analysis and return a job id immediately.
+
+    Poll GET /jobs/{job_id} for status, timings and the result.
+    Returns:
+        dict: Job id and status URL, or 429 if the queue is full.
+    """
+    params = {
+        "city": city,
+        "country": country,
+        "latitude": latitude,
+        "longitude": longitude,
+        "zoom": zoom,
+        "coverage_backend": coverage_backend,
+    }
+    try:
+        job_id = await get_job_queue().submit(params)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return {
+        "status": "queued",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+    }
+
+@app.get("/jobs/stats")
+async def job_stats():
+    return {
+        "status": "success",
+        "jobs": await run_blocking(get_job_queue().stats),
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@app.post("/analyze-batch/")
+async def analyze_batch(request: Request):
+    """    Analyze many points in one call, streaming one NDJSON result per point as it finishes.
+
+    Accepts either a JSON body ({"points": [...], "zoom": 18, "concurrency": 8,
+    "coverage_backend": "local"} or a GeoJSON FeatureCollection) or a multipart upload
+    with a CSV/GeoJSON `file` plus the same options as form fields.
+    Returns:
+        StreamingResponse: application/x-ndjson lines, followed by a summary line.
+    """
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            options = {key: value for key, value in form.items() if key != "file"}
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise ValueError("Upload a CSV or GeoJSON file in the 'file' field.")
+            points = parse_points_upload(upload.filename or "", await upload.read(), int(options.get("zoom") or 18))
+        else:
+            payload = await request.json()
+            options = payload if isinstance(payload, dict) else {}
+            points = parse_points_json(payload, int(options.get("zoom") or 18))
+        concurrency = int(options.get("concurrency") or BATCH_CONCURRENCY)
+    except (ValueError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not points:
+        raise HTTPException(status_code=400, detail="No points provided.")
+    if len(points) > BATCH_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"Too many points ({len(points)}); the limit is {BATCH_MAX_POINTS}.")
+
+    runner = BatchRunner(concurrency=concurrency, coverage_backend=options.get("coverage_backend"))
+    return StreamingResponse(runner.stream(points), media_type="application/x-ndjson")
+
+@app.post("/analyze-region/")
+async def analyze_region_endpoint(request: Request):
+    """    Analyze every static-map tile inside a bounding box and aggregate the coverage.
+
+    Expects a JSON body {"bbox": [south, west, north, east], "zoom": 18,
+    "coverage_backend": "local", "concurrency": 8}.
+    Returns:
+        dict: Area-weighted coverage, covered areas in m² and the per-tile grid.
+    """
+    try:
+        payload = await request.json()
+        if not isinstance(payload, dict) or "bbox" not in payload:
+            raise ValueError("Provide a bbox as [south, west, north, east].")
+        bbox = parse_bbox(payload["bbox"])
+        return await analyze_region(
+            bbox,
+            zoom=int(payload.get("zoom") or 18),
+            coverage_backend=payload.get("coverage_backend"),
+            concurrency=min(int(payload.get("concurrency") or REGION_CONCURRENCY), BATCH_MAX_CONCURRENCY),
+        )
+    except (ValueError, json.JSONDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/analyze-orthophoto/")
+async def analyze_orthophoto_endpoint(request: Request):
+    """    Split a large uploaded image (orthophoto, drone mosaic) into tiles and aggregate their coverage.
 
-    print(city, country, latitude, longitude)
+    Expects multipart/form-data with the image in `file` and optional form fields
+    tile_px, bbox ("south,west,north,east" of a north-up image), coverage_backend and concurrency.
+    Returns:
+        dict: Pixel-weighted coverage and the per-tile grid.
+    """
+    try:
+        upload = await receive_image_upload(request, max_bytes=int(ORTHOPHOTO_MAX_MB * 1024 * 1024))
+        fields = upload.fields
+        return await analyze_orthophoto(
+            upload.data,
+            tile_px=int(fields.get("tile_px") or ORTHOPHOTO_TILE_PX),
+            bbox=parse_bbox(fields["bbox"]) if fields.get("bbox") else None,
+            coverage_backend=fields.get("coverage_backend") or None,
+            concurrency=min(int(fields.get("concurrency") or REGION_CONCURRENCY), BATCH_MAX_CONCURRENCY),
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/heatmap")
+async def heatmap(bbox: str, zoom: int = 18, metric: str = "vegetation_coverage", format: str = "png",
+                  fill: bool = False, coverage_backend: str = None, cell_px: int = 16):
+    """    Render a coverage heatmap for a region from per-tile results.
 
-    if map_result["status"] == "error":
-        return {
-            "status": "error",
-            "message": map_result["message"],
-            "file_path": None
-        }
+    Args:
+        bbox (str): "south,west,north,east".
+        zoom (int): Grid zoom level.
+        metric (str): Coverage field to color by (png only).
+        format (str): "png" or "geojson".
+        fill (bool): Also analyze cells that have no stored result yet (up to HEATMAP_MAX_NEW_CELLS);
+            off by default, since every new cell is a map download and, with "llm", a model call.
+        coverage_backend (str): "local" or "llm"; defaults to REGION_COVERAGE_BACKEND.
+        cell_px (int): Pixels per cell in the PNG.
+    Returns:
+        PNG image (bounds in the X-Heatmap-Bounds header) or a GeoJSON FeatureCollection.
+    """
+    if metric not in PALETTES:
+        raise HTTPException(status_code=400, detail=f"Unknown metric '{metric}'. Supported: {', '.join(PALETTES)}")
+    if format not in ("png", "geojson"):
+        raise HTTPException(status_code=400, detail="format must be 'png' or 'geojson'.")
+    try:
+        result = await build_heatmap(parse_bbox(bbox), zoom, coverage_backend, fill)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "geojson":
+        return await run_blocking(to_geojson, result)
+    png = await run_blocking(render_png, result, metric, max(1, min(cell_px, 64)))
+    headers = {
+        "X-Heatmap-Bounds": ",".join(f"{v:.7f}" for v in result.bounds),
+        **{f"X-Heatmap-{key.replace('_', '-').title()}": str(value) for key, value in result.stats.items()},
+    }
+    return Response(png, media_type="image/png", headers=headers)
+
+@app.get("/history/trend")
+async def history_trend(latitude: float, longitude: float, radius_m: float = 50, days: float = 365,
+                        bucket: str = "month", metric: str = "vegetation_coverage"):
+    """    Coverage over time around a point, from every recorded analysis.
+
+    Args:
+        latitude, longitude (float): Center of the site.
+        radius_m (float): Records within this distance belong to the site.
+        days (float): How far back to look.
+        bucket (str): "day", "week" or "month".
+        metric (str): Coverage field used for the change and slope.
+    Returns:
+        Per-bucket averages, the change between the first and last bucket and the slope per year.
+    """
+    if bucket not in BUCKET_SECONDS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(BUCKET_SECONDS)}.")
     try:
-        coverage_details = generate_coverage_details(map_result["file_path"])
-        if coverage_details["status"] == "error":
-            return {
-                "status": "error",
-                "message": coverage_details["message"],
-                "file_path": map_result["file_path"]
-            }
-        final_report = generate_final_report(coverage_details["caption"], city, country ,latitude, longitude)
-        print(final_report)
-        return {
-            "status": "success",
-            "message": "Location analyzed successfully.",
-            "file_path": map_result["file_path"],
-            "final_report": final_report
-        }
-    except Exception as e:
-        return {
-            "status": "error",
-            "message": str(e),
-            "file_path": map_result["file_path"]
-        }
-    
+        trend = await run_blocking(get_history().trend, latitude, longitude, min(radius_m, 5000), days, bucket, metric)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", **trend}
+
+@app.get("/history/drops")
+async def history_drops(threshold: float = 10, days: float = 90, metric: str = "vegetation_coverage",
+                        relative: bool = False, bbox: str = None, limit: int = 100):
+    """    Sites whose coverage fell by at least threshold between their first and latest record.
+
+    Args:
+        threshold (float): Minimum drop in percentage points (percent of the first value if relative).
+        days (float): Window to compare within.
+        metric (str): Coverage field to compare.
+        relative (bool): Use relative instead of absolute change.
+        bbox (str): Optional "south,west,north,east" filter.
+        limit (int): Most sites to return.
+    """
+    try:
+        bounds = parse_bbox(bbox) if bbox else None
+        sites = await run_blocking(
+            get_history().drops, threshold, days, metric, relative, bounds, max(1, min(limit, 1000))
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "count": len(sites), "sites": sites}
+
+def _cache_stats():
+    return {
+        "status": "success",
+        "tiles": get_tile_cache().stats(),
+        "coverage": get_coverage_cache().stats(),
+        "weather": get_weather_cache().stats(),
+        "recommendations": get_recommendation_cache().stats(),
+        "coverage_grid": get_coverage_grid().stats(),
+    }
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return await run_blocking(_cache_stats)
+
+@app.delete("/cache/recommendations")
+async def invalidate_recommendations():
+    removed = await run_blocking(get_recommendation_cache().invalidate)
+    return {
+        "status": "success",
+        "message": f"Removed {removed} cached recommendation sets.",
+    }
+
+@app.get("/clients/stats")
+async def clients_stats():
+    return {
+        "status": "success",
+        "clients": client_stats(),
+        "upstreams": upstream_stats(),
+        "llm_batching": {
+            "coverage": get_coverage_batcher().stats(),
+            "recommendations": get_recommendation_batcher().stats(),
+        },
+        "vision_prep": prep_stats(),
+    }
+
+@app.on_event("startup")
+async def startup():
+    await get_job_queue().start()
+    app.state.warm_up_task = start_warm_up()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await get_job_queue().stop()
+    await close_clients()
+    shutdown_executor()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run("app:app", host="0.0.0.0", port=port, reload=True)
@@ -0,0 +1,212 @@
+import io
+import os
+import csv
+import json
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+
+from pipeline import analyze_location_pipeline, default_fetch_weather
+from step0 import download_static_map_async
+from step1 import generate_coverage_details_async
+from tile_cache import quantize
+from region import check_zoom
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+BATCH_MAX_POINTS = int(os.getenv("BATCH_MAX_POINTS", "1000"))
+MAP_SIZE = "640x640"
+
+
+@dataclass
+class BatchPoint:
+    latitude: float
+    longitude: float
+    city: str
+    country: str
+    zoom: int = 18
+    id: Optional[str] = None
+
+
+def _make_point(values: Dict, default_zoom: int) -> BatchPoint:
+    try:
+        latitude = float(values["latitude"])
+        longitude = float(values["longitude"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Point is missing a numeric latitude/longitude: {values}")
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValueError(f"Point coordinates out of range: {latitude}, {longitude}")
+    city = str(values.get("city") or "").strip()
+    country = str(values.get("country") or "").strip()
+    if not city or not country:
+        raise ValueError(f"Point at {latitude}, {longitude} needs both city and country.")
+    try:
+        zoom = check_zoom(int(values.get("zoom") or default_zoom))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Point at {latitude}, {longitude}: {e}")
+    point_id = values.get("id")
+    return BatchPoint(
+        latitude=latitude,
+        longitude=longitude,
+        city=city,
+        country=country,
+        zoom=zoom,
+        id=str(point_id) if point_id not in (None, "") else None,
+    )
+
+
+def parse_points_json(payload, default_zoom: int = 18) -> List[BatchPoint]:
+    """Accepts a list of point objects, {"points": [...]}, or a GeoJSON FeatureCollection."""
+    if isinstance(payload, dict) and payload.get("type") in ("FeatureCollection", "Feature"):
+        return parse_points_geojson(payload, default_zoom)
+    if isinstance(payload, dict):
+        payload = payload.get("points")
+    if not isinstance(payload, list):
+        raise ValueError("Expected a list of points.")
+    return [_make_point(item, default_zoom) for item in payload]
+
+
+def parse_points_csv(text: str, default_zoom: int = 18) -> List[BatchPoint]:
+    """Parses a CSV with latitude, longitude, city and country columns (zoom and id optional)."""
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames:
+        raise ValueError("CSV file is empty.")
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    aliases = {"lat": "latitude", "lon": "longitude", "lng": "longitude"}
+    points = []
+    for row in reader:
+        row = {aliases.get(key, key): value for key, value in row.items()}
+        points.append(_make_point(row, default_zoom))
+    return points
+
+
+def parse_points_geojson(payload: Dict, default_zoom: int = 18) -> List[BatchPoint]:
+    """Parses Point features; city, country, zoom and id are read from the feature properties."""
+    features = payload.get("features", []) if payload.get("type") == "FeatureCollection" else [payload]
+    points = []
+    if not isinstance(features, list):
+        raise ValueError("GeoJSON features must be a list.")
+    for feature in features:
+        if not isinstance(feature, dict):
+            raise ValueError(f"GeoJSON feature must be an object, got {type(feature).__name__}.")
+        geometry = feature.get("geometry") or {}
+        if not isinstance(geometry, dict) or geometry.get("type") != "Point":
+            kind = geometry.get("type") if isinstance(geometry, dict) else type(geometry).__name__
+            raise ValueError(f"Only Point geometries are supported, got {kind}.")
+        coordinates = geometry.get("coordinates")
+        if not isinstance(coordinates, (list, tuple)) or len(coordinates) < 2:
+            raise ValueError(f"Point geometry needs [longitude, latitude] coordinates, got {coordinates}.")
+        longitude, latitude = coordinates[:2]
+        properties = feature.get("properties") or {}
+        if not isinstance(properties, dict):
+            raise ValueError("GeoJSON feature properties must be an object.")
+        points.append(_make_point(
+            {**properties, "latitude": latitude, "longitude": longitude, "id": feature.get("id", properties.get("id"))},
+            default_zoom,
+        ))
+    return points
+
+
+def parse_points_upload(filename: str, content: bytes, default_zoom: int = 18) -> List[BatchPoint]:
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".csv"):
+        return parse_points_csv(text, default_zoom)
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError:
+        return parse_points_csv(text, default_zoom)
+    return parse_points_json(payload, default_zoom)
+
+
+class BatchRunner:
+    """
+    Analyses many points while sharing upstream work between them.
+
+    Within one batch there is one weather lookup per city, one map download per tile
+    cell and one coverage estimate per tile image; points run under a concurrency limit.
+    """
+
+    def __init__(self, concurrency: int = BATCH_CONCURRENCY, coverage_backend: Optional[str] = None):
+        self.concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+        self.coverage_backend = coverage_backend
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._weather: Dict[str, asyncio.Task] = {}
+        self._maps: Dict[tuple, asyncio.Task] = {}
+        self._coverage: Dict[tuple, asyncio.Task] = {}
+
+    @staticmethod
+    def _shared(tasks: Dict, key, factory) -> asyncio.Task:
+        task = tasks.get(key)
+        if task is None:
+            task = tasks[key] = asyncio.ensure_future(factory())
+        return task
+
+    async def _fetch_weather(self, city: str):
+        return await asyncio.shield(
+            self._shared(self._weather, city.strip().lower(), lambda: default_fetch_weather(city))
+        )
+
+    async def _fetch_map(self, latitude: float, longitude: float, zoom: int = 18):
+        key = (*quantize(latitude, longitude, zoom, MAP_SIZE), zoom)
+        result = await asyncio.shield(self._shared(
+            self._maps, key, lambda: download_static_map_async(latitude, longitude, zoom=zoom, size=MAP_SIZE)
+        ))
+        return {**result, "latitude": latitude, "longitude": longitude}
+
+    async def _fetch_coverage(self, file_path: str, backend: Optional[str] = None):
+        return await asyncio.shield(self._shared(
+            self._coverage, (file_path, backend), lambda: generate_coverage_details_async(file_path, backend=backend)
+        ))
+
+    async def analyze_point(self, index: int, point: BatchPoint) -> Dict:
+        try:
+            async with self._semaphore:
+                result = await analyze_location_pipeline(
+                    point.city,
+                    point.country,
+                    point.latitude,
+                    point.longitude,
+                    zoom=point.zoom,
+                    coverage_backend=self.coverage_backend,
+                    fetch_map=self._fetch_map,
+                    fetch_weather=self._fetch_weather,
+                    fetch_coverage=self._fetch_coverage,
+                )
+        except Exception as e:
+            # One failing point is reported on its own line; the rest of the stream carries on.
+            result = {"status": "error", "message": f"Analysis failed: {e}"}
+        return {
+            "index": index,
+            "id": point.id,
+            "latitude": point.latitude,
+            "longitude": point.longitude,
+            **result,
+        }
+
+    async def stream(self, points: List[BatchPoint]) -> AsyncIterator[str]:
+        """Yields one NDJSON line per point as it finishes, then a summary line."""
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(self.analyze_point(i, point)) for i, point in enumerate(points)]
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                succeeded += result["status"] == "success"
+                yield json.dumps(result, default=str) + "\n"
+        finally:
+            for task in tasks + list(self._weather.values()) + list(self._maps.values()) + list(self._coverage.values()):
+                task.cancel()
+
+        yield json.dumps({
+            "summary": {
+                "points": len(points),
+                "succeeded": succeeded,
+                "failed": len(points) - succeeded,
+                "weather_lookups": len(self._weather),
+                "map_fetches": len(self._maps),
+                "coverage_estimates": len(self._coverage),
+                "concurrency": self.concurrency,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+        }) + "\n"
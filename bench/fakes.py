@@ -0,0 +1,228 @@
+"""
+Local stand-ins for Google Static Maps, WeatherAPI and Gemini.
+
+One Starlette app serves all three so the API can be benchmarked without API quota:
+
+    python -m bench.fakes --port 9100 --maps-latency 0.2 --gemini-latency 1.5 --failure-rate 0.02
+
+and point the API at it with GOOGLE_MAPS_BASE_URL, WEATHERAPI_BASE_URL and
+GEMINI_API_ENDPOINT (see bench/run.py, which does this for you). Latency and failure
+injection can also be changed at runtime with POST /__config.
+"""
+import io
+import re
+import json
+import random
+import asyncio
+import argparse
+import hashlib
+from functools import lru_cache
+from typing import Dict
+
+import numpy as np
+import uvicorn
+from PIL import Image
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+PROVIDERS = ("maps", "weather", "gemini")
+
+# Typical satellite colors per land-cover class (vegetation, building, road, bare land, water).
+CLASS_COLORS = np.array(
+    [[52, 92, 45], [196, 190, 184], [118, 118, 116], [176, 140, 100], [40, 70, 110]], dtype=np.uint8
+)
+
+CONFIG = {
+    "latency": {"maps": 0.2, "weather": 0.15, "gemini": 1.5},
+    "jitter": 0.2,
+    "failure_rate": {"maps": 0.0, "weather": 0.0, "gemini": 0.0},
+    "failure_status": 503,
+}
+STATS = {provider: {"requests": 0, "failures": 0} for provider in PROVIDERS}
+
+
+async def _simulate(provider: str):
+    """Sleeps for the configured latency and returns an error response if a failure is injected."""
+    STATS[provider]["requests"] += 1
+    base = CONFIG["latency"][provider]
+    jitter = CONFIG["jitter"]
+    await asyncio.sleep(max(0.0, base * random.uniform(1 - jitter, 1 + jitter)))
+    if random.random() < CONFIG["failure_rate"][provider]:
+        STATS[provider]["failures"] += 1
+        return JSONResponse({"error": {"message": f"Injected {provider} failure"}}, status_code=CONFIG["failure_status"])
+    return None
+
+
+@lru_cache(maxsize=256)
+def render_tile(center: str, size: str) -> bytes:
+    """Deterministic synthetic satellite tile: a random block mosaic seeded by the map center."""
+    width, height = (int(v) for v in size.lower().split("x"))
+    rng = np.random.default_rng(int(hashlib.sha256(center.encode()).hexdigest()[:8], 16))
+    weights = rng.dirichlet(np.ones(len(CLASS_COLORS)))
+    blocks = rng.choice(len(CLASS_COLORS), size=(height // 16 + 1, width // 16 + 1), p=weights)
+    labels = blocks.repeat(16, axis=0).repeat(16, axis=1)[:height, :width]
+    pixels = CLASS_COLORS[labels].astype(np.int16) + rng.integers(-12, 13, size=(height, width, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def static_map(request: Request):
+    failure = await _simulate("maps")
+    if failure:
+        return failure
+    center = request.query_params.get("center", "0,0")
+    size = request.query_params.get("size", "640x640")
+    return Response(render_tile(center, size), media_type="image/png")
+
+
+async def weather(request: Request):
+    failure = await _simulate("weather")
+    if failure:
+        return failure
+    city = request.query_params.get("q", "Unknown")
+    rng = random.Random(city.lower())
+    return JSONResponse({
+        "location": {"name": city, "localtime": "2025-06-15 12:00", "tz_id": "Asia/Kolkata"},
+        "current": {
+            "temp_c": round(rng.uniform(12, 38), 1),
+            "feelslike_c": round(rng.uniform(12, 42), 1),
+            "humidity": rng.randint(20, 95),
+            "pressure_mb": rng.randint(995, 1025),
+            "condition": {"text": rng.choice(["Sunny", "Partly cloudy", "Mist", "Light rain"])},
+            "wind_kph": round(rng.uniform(0, 30), 1),
+            "precip_mm": round(rng.uniform(0, 5), 1),
+            "uv": rng.randint(1, 11),
+            "vis_km": rng.randint(2, 10),
+        },
+    })
+
+
+def _coverage_values(seed: str) -> Dict:
+    rng = np.random.default_rng(int(hashlib.sha256(seed.encode()).hexdigest()[:8], 16))
+    values = np.round(rng.dirichlet(np.ones(5)) * 100, 1)
+    values[0] = round(100 - values[1:].sum(), 1)
+    fields = ("vegetation_coverage", "building_coverage", "road_coverage", "empty_land", "water_body")
+    return dict(zip(fields, values.tolist()))
+
+
+def _json_block(value) -> str:
+    return "```json\n" + json.dumps(value) + "\n```"
+
+
+RECOMMENDATIONS = """Plant: Neem (Azadirachta indica)
+Reason: Tolerates heat, drought and poor urban soils.
+Care: Water weekly until established; prune lightly after the monsoon.
+
+Plant: Bougainvillea
+Reason: Thrives in full sun and needs little water once established.
+Care: Plant in well-drained soil and prune after flowering.
+
+Plant: Vetiver grass
+Reason: Deep roots stabilise bare soil and cope with both drought and waterlogging.
+Care: Plant slips at the start of the rains and cut back twice a year.
+"""
+
+
+BATCH_REQUEST = re.compile(r"^=== REQUEST (\d+) ===$", re.MULTILINE)
+
+
+def _reply_text(body: Dict) -> str:
+    """Answers like Gemini would, including the multi-image and multi-request prompts of LLM_BATCHING."""
+    parts = [part for content in body.get("contents", []) for part in content.get("parts", [])]
+    images = [part.get("inlineData") or part.get("inline_data") for part in parts
+              if part.get("inlineData") or part.get("inline_data")]
+    if len(images) > 1:
+        return _json_block([{"image": index, **_coverage_values(image["data"][:256])}
+                            for index, image in enumerate(images, 1)])
+    if images:
+        return _json_block(_coverage_values(images[0]["data"][:256]))
+    requests = BATCH_REQUEST.findall(" ".join(part.get("text", "") for part in parts))
+    if requests:
+        return "\n".join(f"=== RESPONSE {index} ===\n{RECOMMENDATIONS}" for index in requests)
+    return RECOMMENDATIONS
+
+
+def _candidate(text: str, finished: bool = True) -> Dict:
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finished:
+        candidate["finishReason"] = "STOP"
+    return {"candidates": [candidate]}
+
+
+async def generate_content(request: Request):
+    failure = await _simulate("gemini")
+    if failure:
+        return failure
+    return JSONResponse({
+        **_candidate(_reply_text(await request.json())),
+        "usageMetadata": {"promptTokenCount": 1, "candidatesTokenCount": 1, "totalTokenCount": 2},
+    })
+
+
+STREAM_CHUNK_CHARS = 40
+
+
+async def stream_generate_content(request: Request):
+    """Streams the reply as a JSON array of chunks; the configured latency is spread over them."""
+    STATS["gemini"]["requests"] += 1
+    if random.random() < CONFIG["failure_rate"]["gemini"]:
+        STATS["gemini"]["failures"] += 1
+        return JSONResponse({"error": {"message": "Injected gemini failure"}}, status_code=CONFIG["failure_status"])
+    text = _reply_text(await request.json())
+    pieces = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+    delay = CONFIG["latency"]["gemini"] / (len(pieces) + 1)
+
+    async def body():
+        yield "["
+        for i, piece in enumerate(pieces):
+            await asyncio.sleep(delay * random.uniform(1 - CONFIG["jitter"], 1 + CONFIG["jitter"]))
+            yield ("," if i else "") + json.dumps(_candidate(piece, finished=i == len(pieces) - 1))
+        yield "]"
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
+async def config(request: Request):
+    if request.method == "POST":
+        updates = await request.json()
+        for key in ("latency", "failure_rate"):
+            CONFIG[key].update({k: float(v) for k, v in updates.get(key, {}).items() if k in PROVIDERS})
+        for key in ("jitter", "failure_status"):
+            if key in updates:
+                CONFIG[key] = type(CONFIG[key])(updates[key])
+    return JSONResponse({"config": CONFIG, "stats": STATS})
+
+
+app = Starlette(routes=[
+    Route("/maps/api/staticmap", static_map),
+    Route("/v1/current.json", weather),
+    Route("/v1beta/models/{model}:generateContent", generate_content, methods=["POST"]),
+    Route("/v1beta/models/{model}:streamGenerateContent", stream_generate_content, methods=["POST"]),
+    Route("/__config", config, methods=["GET", "POST"]),
+])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run fake Google Maps, WeatherAPI and Gemini upstreams.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    for provider in PROVIDERS:
+        parser.add_argument(f"--{provider}-latency", type=float, default=CONFIG["latency"][provider])
+    parser.add_argument("--jitter", type=float, default=CONFIG["jitter"], help="Relative latency jitter (0.2 = ±20%%).")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability each upstream call fails.")
+    parser.add_argument("--failure-status", type=int, default=CONFIG["failure_status"])
+    args = parser.parse_args()
+
+    for provider in PROVIDERS:
+        CONFIG["latency"][provider] = getattr(args, f"{provider}_latency")
+        CONFIG["failure_rate"][provider] = args.failure_rate
+    CONFIG["jitter"] = args.jitter
+    CONFIG["failure_status"] = args.failure_status
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
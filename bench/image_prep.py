@@ -0,0 +1,131 @@
+"""
+Vision preprocessing benchmark: bytes sent to the model, time spent preparing them, and how
+far coverage moves, for several VISION_* settings.
+
+    python -m bench.image_prep --images files files/tiles --tolerance 5
+
+Every image is prepared with each setting and both the original and the prepared image are
+run through the local coverage engine; the largest per-class difference (percentage points)
+stands in for how much information the model loses. The setting configured by the VISION_*
+environment variables is always measured first, and the command exits with status 1 if its
+worst difference is over --tolerance (other settings over it are only flagged). No upstream
+is contacted.
+
+--synthetic adds the block mosaics bench.fakes serves. Their per-pixel noise is independent
+from pixel to pixel, which lossy codecs smooth away and the local engine reads as texture,
+so they show a worst case rather than what real satellite tiles lose.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from bench.fakes import render_tile
+from bench.load import _git_commit, save_result, summarize
+from coverage_engine import compare_coverage, estimate_coverage
+from image_prep import PrepOptions, prepare_for_vision
+from tile_cache import TILE_CACHE_DIR
+
+# format:quality:max_side[:view]
+DEFAULT_SETTINGS = (
+    "original:0:640",
+    "jpeg:85:640",
+    "jpeg:75:640",
+    "jpeg:85:512",
+    "webp:80:640",
+    "webp:80:512",
+    "jpeg:85:640:palette",
+    "jpeg:85:640:gray",
+)
+MIME_BY_EXTENSION = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+
+def parse_setting(text: str) -> PrepOptions:
+    parts = text.split(":")
+    options = PrepOptions(format=parts[0], quality=int(parts[1]), max_side=int(parts[2]), target_kb=0)
+    if len(parts) > 3:
+        options.view = parts[3]
+    options.validate()
+    return options
+
+
+def load_images(paths: List[str], synthetic: int) -> List[Tuple[str, bytes, str]]:
+    images = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, "*"))) if os.path.isdir(path) else [path]
+        for file_path in files:
+            mime_type = MIME_BY_EXTENSION.get(os.path.splitext(file_path)[1].lower())
+            if mime_type:
+                with open(file_path, "rb") as f:
+                    images.append((file_path, f.read(), mime_type))
+    for index in range(synthetic):
+        images.append((f"synthetic-{index}", render_tile(f"synthetic-{index}", "640x640"), "image/png"))
+    return images
+
+
+def measure(setting: str, options: PrepOptions, images: List[Tuple[str, bytes, str]], baselines: List[Dict]) -> Dict:
+    bytes_in = bytes_out = 0
+    latencies, diffs = [], []
+    for (_, data, mime_type), baseline in zip(images, baselines):
+        started = time.perf_counter()
+        vision = prepare_for_vision(data, mime_type, options)
+        latencies.append((time.perf_counter() - started) * 1000)
+        bytes_in += len(data)
+        bytes_out += len(vision.data)
+        diffs.append(compare_coverage(baseline, estimate_coverage(vision.data))["max_abs_diff"])
+    return {
+        "setting": setting,
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "saved_ratio": round(1 - bytes_out / bytes_in, 4) if bytes_in else 0.0,
+        "prepare": summarize(latencies),
+        "coverage_max_abs_diff": round(max(diffs), 2) if diffs else 0.0,
+        "coverage_mean_max_abs_diff": round(sum(diffs) / len(diffs), 2) if diffs else 0.0,
+    }
+
+
+def print_report(result: Dict):
+    print(f"{len(result['images'])} images, tolerance {result['params']['tolerance']} pp\n")
+    print(f"{'setting':24s} {'KB in':>9s} {'KB out':>9s} {'saved':>7s} {'p50 ms':>8s} {'max pp':>7s} {'mean pp':>8s}")
+    for row in result["settings"]:
+        flag = "" if row["coverage_max_abs_diff"] <= result["params"]["tolerance"] else "  over tolerance"
+        print(f"{row['setting']:24s} {row['bytes_in'] / 1024:9.1f} {row['bytes_out'] / 1024:9.1f} "
+              f"{row['saved_ratio'] * 100:6.1f}% {row['prepare'].get('p50_ms', 0):8.1f} "
+              f"{row['coverage_max_abs_diff']:7.2f} {row['coverage_mean_max_abs_diff']:8.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure vision preprocessing size, latency and coverage drift.")
+    parser.add_argument("--images", nargs="*", default=["files", TILE_CACHE_DIR], help="Image files or directories.")
+    parser.add_argument("--synthetic", type=int, default=0, help="Synthetic tiles (as served by bench.fakes) to add.")
+    parser.add_argument("--settings", nargs="*", default=list(DEFAULT_SETTINGS), help="format:quality:max_side[:view]")
+    parser.add_argument("--tolerance", type=float, default=5.0, help="Largest acceptable coverage change, in points.")
+    parser.add_argument("--output", default=None, help="Where to save the JSON results (default bench/results/image-prep-<timestamp>.json).")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.synthetic)
+    if not images:
+        parser.error("no images found")
+    baselines = [estimate_coverage(data) for _, data, _ in images]
+    configured = PrepOptions()
+    configured.validate()
+    settings = [("configured", configured)] + [(setting, parse_setting(setting)) for setting in args.settings]
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "params": {"tolerance": args.tolerance, "python": sys.version.split()[0]},
+        "images": [name for name, _, _ in images],
+        "settings": [measure(setting, options, images, baselines) for setting, options in settings],
+    }
+    print_report(result)
+    output = args.output or os.path.join("bench", "results", f"image-prep-{datetime.now():%Y%m%d-%H%M%S}.json")
+    save_result(result, output)
+    if result["settings"][0]["coverage_max_abs_diff"] > args.tolerance:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Load driver for /analyze-location/.
+
+    python -m bench.load --url http://127.0.0.1:8000 --concurrency 16 --requests 200 \
+        --output bench/results/baseline.json --compare bench/results/previous.json
+
+Each request is sent with debug=true so the per-stage timings and upstream spans can be
+aggregated. Points are spread over a few cities and jittered so tile caches see a mix
+of hits and misses (use --unique-points to make every request a miss).
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+CITIES = [
+    ("Lucknow", "India", 26.8467, 80.9462),
+    ("Delhi", "India", 28.6139, 77.2090),
+    ("Mumbai", "India", 19.0760, 72.8777),
+    ("Bengaluru", "India", 12.9716, 77.5946),
+    ("Chennai", "India", 13.0827, 80.2707),
+    ("Kolkata", "India", 22.5726, 88.3639),
+]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile; None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return round(ordered[index], 1)
+
+
+def summarize(values: List[float]) -> Dict:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(statistics.fmean(values), 1),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": round(max(values), 1),
+    }
+
+
+def make_points(count: int, unique: bool, seed: int) -> List[Dict]:
+    rng = random.Random(seed)
+    points = []
+    for i in range(count):
+        city, country, lat, lon = CITIES[i % len(CITIES)]
+        # Without --unique-points, offsets repeat so later requests can hit the caches.
+        spread = i if unique else rng.randrange(20)
+        points.append({
+            "city": city,
+            "country": country,
+            "latitude": round(lat + (spread % 7) * 0.003 + (i * 1e-5 if unique else 0), 6),
+            "longitude": round(lon + (spread // 7) * 0.003, 6),
+        })
+    return points
+
+
+async def _send(client: httpx.AsyncClient, url: str, point: Dict, coverage_backend: Optional[str]) -> Dict:
+    form = {**{k: str(v) for k, v in point.items()}, "debug": "true"}
+    if coverage_backend:
+        form["coverage_backend"] = coverage_backend
+    started = time.perf_counter()
+    try:
+        response = await client.post(f"{url}/analyze-location/", data=form)
+        elapsed = (time.perf_counter() - started) * 1000
+        body = response.json()
+        ok = response.status_code == 200 and body.get("status") == "success"
+        return {"ok": ok, "latency_ms": elapsed, "status_code": response.status_code, "body": body}
+    except (httpx.HTTPError, ValueError) as e:
+        return {"ok": False, "latency_ms": (time.perf_counter() - started) * 1000, "error": str(e), "body": {}}
+
+
+async def run_load(
+    url: str,
+    concurrency: int,
+    total: int,
+    unique_points: bool = False,
+    coverage_backend: Optional[str] = None,
+    timeout: float = 120.0,
+    seed: int = 7,
+) -> Dict:
+    """Sends total requests with at most concurrency in flight and returns the aggregated results."""
+    points = make_points(total, unique_points, seed)
+    queue: asyncio.Queue = asyncio.Queue()
+    for point in points:
+        queue.put_nowait(point)
+    outcomes = []
+
+    async with httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def worker():
+            while not queue.empty():
+                outcomes.append(await _send(client, url, queue.get_nowait(), coverage_backend))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall_seconds = time.perf_counter() - started
+
+    return aggregate(outcomes, wall_seconds, {
+        "url": url,
+        "concurrency": concurrency,
+        "requests": total,
+        "unique_points": unique_points,
+        "coverage_backend": coverage_backend,
+    })
+
+
+def aggregate(outcomes: List[Dict], wall_seconds: float, params: Dict) -> Dict:
+    latencies = [o["latency_ms"] for o in outcomes if o["ok"]]
+    stages: Dict[str, List[float]] = {}
+    spans: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    for outcome in outcomes:
+        body = outcome["body"]
+        if not outcome["ok"]:
+            reason = outcome.get("error") or body.get("message") or f"HTTP {outcome.get('status_code')}"
+            errors[reason] = errors.get(reason, 0) + 1
+            continue
+        for stage, timing in (body.get("timings") or {}).items():
+            stages.setdefault(stage, []).append(timing["duration_ms"])
+        for span in (body.get("debug") or {}).get("spans", []):
+            spans.setdefault(span["stage"], []).append(span["duration_ms"])
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "params": params,
+        "summary": {
+            "completed": len(outcomes),
+            "succeeded": len(latencies),
+            "failed": len(outcomes) - len(latencies),
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_rps": round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+            "latency": summarize(latencies),
+        },
+        "stages": {name: summarize(values) for name, values in sorted(stages.items())},
+        "spans": {name: summarize(values) for name, values in sorted(spans.items())},
+        "errors": errors,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _delta(new: Optional[float], old: Optional[float]) -> str:
+    if new is None:
+        return "n/a"
+    if not old:
+        return f"{new}"
+    return f"{new} ({(new - old) / old * 100:+.1f}%)"
+
+
+def print_report(result: Dict, previous: Optional[Dict] = None):
+    summary = result["summary"]
+    prev_summary = (previous or {}).get("summary", {})
+    print(f"Requests: {summary['succeeded']}/{summary['completed']} succeeded in {summary['wall_seconds']} s")
+    print(f"Throughput: {_delta(summary['throughput_rps'], prev_summary.get('throughput_rps'))} req/s")
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        old = prev_summary.get("latency", {}).get(key)
+        print(f"Latency {key[:-3]}: {_delta(summary['latency'].get(key), old)} ms")
+
+    for section in ("stages", "spans"):
+        if not result[section]:
+            continue
+        print(f"\n{section.capitalize()} (p50 / p95 ms):")
+        for name, stats in result[section].items():
+            old = (previous or {}).get(section, {}).get(name, {})
+            print(f"  {name:28s} {_delta(stats.get('p50_ms'), old.get('p50_ms')):>22s} / "
+                  f"{_delta(stats.get('p95_ms'), old.get('p95_ms'))}")
+    if result["errors"]:
+        print("\nErrors:")
+        for reason, count in result["errors"].items():
+            print(f"  {count:5d}  {reason}")
+
+
+def save_result(result: Dict, output: str):
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nSaved results to {output}")
+
+
+def add_load_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--unique-points", action="store_true", help="Never repeat a point, so tile caches always miss.")
+    parser.add_argument("--coverage-backend", choices=["llm", "local", "crosscheck"])
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", default=None, help="Where to save the JSON results (default bench/results/<timestamp>.json).")
+    parser.add_argument("--compare", default=None, help="Previous results file to compare against.")
+
+
+def default_output() -> str:
+    return os.path.join("bench", "results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+
+
+def report_and_save(result: Dict, args):
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(result, previous)
+    save_result(result, args.output or default_output())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /analyze-location/.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    add_load_arguments(parser)
+    args = parser.parse_args()
+    result = asyncio.run(run_load(
+        args.url, args.concurrency, args.requests, args.unique_points, args.coverage_backend, args.timeout
+    ))
+    report_and_save(result, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+End-to-end benchmark: starts the fake upstreams and the API, runs the load driver, stops both.
+
+    python -m bench.run --concurrency 16 --requests 200 --gemini-latency 1.5 --failure-rate 0.01
+
+The API runs in a subprocess with its upstream URLs pointed at bench.fakes, dummy API
+keys and a throwaway database and tile cache directory, so runs don't touch real
+quota or the local caches.
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from bench.load import add_load_arguments, report_and_save, run_load
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout} s")
+
+
+def stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /analyze-location/ against local fake upstreams.")
+    parser.add_argument("--app-port", type=int, default=8765)
+    parser.add_argument("--fakes-port", type=int, default=9100)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes for the API.")
+    parser.add_argument("--maps-latency", type=float, default=0.2)
+    parser.add_argument("--weather-latency", type=float, default=0.15)
+    parser.add_argument("--gemini-latency", type=float, default=1.5)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--keep-caches", action="store_true", help="Reuse the tile/coverage caches between runs.")
+    add_load_arguments(parser)
+    args = parser.parse_args()
+
+    fakes_url = f"http://127.0.0.1:{args.fakes_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    workdir = os.path.join(ROOT, "bench", "results", ".cache") if args.keep_caches else tempfile.mkdtemp(prefix="greenery-bench-")
+    os.makedirs(workdir, exist_ok=True)
+
+    env = {
+        **os.environ,
+        "GOOGLE_MAPS_BASE_URL": f"{fakes_url}/maps/api/staticmap",
+        "WEATHERAPI_BASE_URL": f"{fakes_url}/v1/current.json",
+        "GEMINI_API_ENDPOINT": fakes_url,
+        "GEMINI_TRANSPORT": "rest",
+        "GOOGLE_MAPS_API_KEY": "bench",
+        "GOOGLE_API_KEY": "bench",
+        "WEATHERAPI_KEY": "bench",
+        "GREENERY_DB_PATH": os.path.join(workdir, "greenery.db"),
+        "TILE_CACHE_DIR": os.path.join(workdir, "tiles"),
+    }
+    fakes_cmd = [
+        sys.executable, "-m", "bench.fakes", "--port", str(args.fakes_port),
+        "--maps-latency", str(args.maps_latency), "--weather-latency", str(args.weather_latency),
+        "--gemini-latency", str(args.gemini_latency), "--jitter", str(args.jitter),
+        "--failure-rate", str(args.failure_rate),
+    ]
+    app_cmd = [
+        sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.app_port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ]
+
+    fakes = subprocess.Popen(fakes_cmd, cwd=ROOT, env=env)
+    api = None
+    try:
+        wait_until_ready(f"{fakes_url}/__config", fakes)
+        api = subprocess.Popen(app_cmd, cwd=ROOT, env=env)
+        wait_until_ready(f"{app_url}/", api)
+        result = asyncio.run(run_load(
+            app_url, args.concurrency, args.requests, args.unique_points, args.coverage_backend, args.timeout
+        ))
+        result["params"].update({
+            "workers": args.workers,
+            "upstream_latency_s": {
+                "maps": args.maps_latency, "weather": args.weather_latency, "gemini": args.gemini_latency,
+            },
+            "jitter": args.jitter,
+            "failure_rate": args.failure_rate,
+        })
+        result["upstream"] = httpx.get(f"{fakes_url}/__config").json()["stats"]
+        report_and_save(result, args)
+    finally:
+        if api is not None:
+            stop(api)
+        stop(fakes)
+        if not args.keep_caches:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
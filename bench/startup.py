@@ -0,0 +1,150 @@
+"""
+Startup benchmark: how long the API takes to import, to become ready and to finish warming up.
+
+    python -m bench.startup --runs 5 --compare bench/results/startup-previous.json
+
+Each run uses a fresh interpreter (so nothing is already imported) with dummy API keys and
+a throwaway database; no upstream is contacted.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Dict, List
+
+import httpx
+
+from bench.load import _delta, _git_commit, save_result, summarize
+from bench.run import ROOT, stop, wait_until_ready
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)"
+
+
+def bench_env(workdir: str) -> Dict[str, str]:
+    return {
+        **os.environ,
+        "GOOGLE_MAPS_API_KEY": "bench",
+        "GOOGLE_API_KEY": "bench",
+        "WEATHERAPI_KEY": "bench",
+        "GREENERY_DB_PATH": os.path.join(workdir, "greenery.db"),
+        "TILE_CACHE_DIR": os.path.join(workdir, "tiles"),
+        "GAZETTEER_CACHE_DIR": os.path.join(workdir, "gazetteer"),
+    }
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env: Dict[str, str], top: int) -> List[Dict]:
+    """Modules imported directly by app with the largest cumulative import time, from python -X importtime."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=env, capture_output=True, text=True
+    ).stderr
+    modules: List[Dict] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # A module is listed after everything it imported, indented two spaces per level.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == "app":
+                break
+            modules = []
+        elif depth == 1:
+            modules.append({"module": name.strip(), "cumulative_ms": int(cumulative) / 1000})
+    return sorted(modules, key=lambda m: -m["cumulative_ms"])[:top]
+
+
+def measure_server(env: Dict[str, str], port: int, timeout: float) -> Dict:
+    """Seconds from launching uvicorn until /health answers, and until warm-up has finished."""
+    url = f"http://127.0.0.1:{port}/health"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    try:
+        wait_until_ready(url, process, timeout)
+        ready = time.perf_counter() - started
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            warm_up = httpx.get(url, timeout=5.0).json()["warm_up"]
+            if warm_up["status"] not in ("pending", "running"):
+                break
+            time.sleep(0.05)
+        return {
+            "ready_s": round(ready, 3),
+            "warm_s": round(time.perf_counter() - started, 3),
+            "warm_up": warm_up,
+        }
+    finally:
+        stop(process)
+
+
+def print_report(result: Dict, previous: Dict = None):
+    previous = previous or {}
+    for section, label in (("import", "import app"), ("ready", "ready"), ("warm", "warmed up")):
+        stats, old = result[section], previous.get(section, {})
+        print(f"{label:12s} p50 {_delta(stats.get('p50_ms'), old.get('p50_ms'))} ms, "
+              f"max {_delta(stats.get('max_ms'), old.get('max_ms'))} ms")
+    if result["warm_up_steps_ms"]:
+        print("\nWarm-up steps (ms, last run):")
+        for name, ms in result["warm_up_steps_ms"].items():
+            print(f"  {name:36s} {ms}")
+    if result["slowest_imports"]:
+        print("\nSlowest imports (cumulative ms):")
+        for entry in result["slowest_imports"]:
+            print(f"  {entry['module']:36s} {entry['cumulative_ms']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API import, readiness and warm-up times.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list (0 to skip).")
+    parser.add_argument("--output", default=None, help="Where to save the JSON results (default bench/results/startup-<timestamp>.json).")
+    parser.add_argument("--compare", default=None, help="Previous results file to compare against.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="greenery-startup-")
+    try:
+        env = bench_env(workdir)
+        # One untimed import compiles bytecode and the gazetteer so runs measure a normal restart.
+        measure_import(env)
+        imports = [measure_import(env) for _ in range(args.runs)]
+        servers = [measure_server(env, args.port, args.timeout) for _ in range(args.runs)]
+        result = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "params": {"runs": args.runs, "python": sys.version.split()[0]},
+            "import": summarize([seconds * 1000 for seconds in imports]),
+            "ready": summarize([s["ready_s"] * 1000 for s in servers]),
+            "warm": summarize([s["warm_s"] * 1000 for s in servers]),
+            "warm_up_steps_ms": servers[-1]["warm_up"]["steps"],
+            "slowest_imports": slowest_imports(env, args.top) if args.top else [],
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(result, previous)
+    output = args.output or os.path.join("bench", "results", f"startup-{datetime.now():%Y%m%d-%H%M%S}.json")
+    save_result(result, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import os
+import asyncio
+import threading
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional
+
+from executor import run_blocking
+from settings import get_settings
+
+# httpx, requests and especially google.generativeai (about a second) are imported on first
+# use rather than here, so the API process starts serving before they are loaded.
+if TYPE_CHECKING:
+    import httpx
+    import requests
+    import google.generativeai as genai
+
+# One set of clients per process: keep-alive HTTP pools and configured Gemini models are
+# created on first use and shared by every request afterwards.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "64"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+
+_lock = threading.Lock()
+_session = None
+_async_client = None
+_async_client_loop = None
+_models: Dict[str, "genai.GenerativeModel"] = {}
+_configured_key = None
+
+_stats = {
+    "sync_requests": 0,
+    "async_requests": 0,
+    "async_connections_opened": 0,
+    "async_tls_handshakes": 0,
+    "models_created": 0,
+    "model_reuses": 0,
+}
+
+
+def _count(name: str, amount: int = 1):
+    with _lock:
+        _stats[name] += amount
+
+
+def get_http_session() -> "requests.Session":
+    """Returns the shared requests.Session with a keep-alive connection pool."""
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.hooks["response"].append(lambda response, *args, **kwargs: _count("sync_requests"))
+                _session = session
+    return _session
+
+
+async def _on_async_request(request: "httpx.Request"):
+    _count("async_requests")
+
+    async def trace(event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            _count("async_connections_opened")
+        elif event_name == "connection.start_tls.complete":
+            _count("async_tls_handshakes")
+
+    request.extensions["trace"] = trace
+
+
+def get_async_client() -> "httpx.AsyncClient":
+    """
+    Returns the shared httpx.AsyncClient for the running event loop.
+
+    The client's connection pool is bound to the loop it was created on, so a new client
+    is created if called from a different loop (e.g. a script calling asyncio.run twice).
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop or _async_client.is_closed:
+        import httpx
+
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_SIZE,
+                max_keepalive_connections=HTTP_POOL_SIZE,
+                keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+            ),
+            event_hooks={"request": [_on_async_request]},
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+def get_genai_model(model_name: str, api_key: str) -> "genai.GenerativeModel":
+    """
+    Returns a cached GenerativeModel, configuring the SDK only when the API key changes.
+
+    Args:
+        model_name (str): Gemini model name.
+        api_key (str): Google API key.
+
+    Returns:
+        genai.GenerativeModel: Shared model instance.
+    """
+    global _configured_key
+    import google.generativeai as genai
+
+    settings = get_settings()
+    with _lock:
+        if api_key != _configured_key:
+            options = {}
+            if settings.gemini_transport:
+                options["transport"] = settings.gemini_transport
+            if settings.gemini_api_endpoint:
+                options["client_options"] = {"api_endpoint": settings.gemini_api_endpoint}
+            genai.configure(api_key=api_key, **options)
+            _configured_key = api_key
+            _models.clear()
+        model = _models.get(model_name)
+        if model is None:
+            model = _models[model_name] = genai.GenerativeModel(model_name)
+            _stats["models_created"] += 1
+        else:
+            _stats["model_reuses"] += 1
+    return model
+
+
+async def generate_content_async(model: "genai.GenerativeModel", contents, request_options: Optional[Dict] = None):
+    """
+    Awaits model.generate_content, using the SDK's async client where it works.
+
+    The SDK's async client only supports gRPC; with the REST transport the blocking
+    call is run on the shared executor instead.
+    """
+    if get_settings().gemini_transport == "rest":
+        return await run_blocking(model.generate_content, contents, request_options=request_options)
+    return await model.generate_content_async(contents, request_options=request_options)
+
+
+async def stream_content_async(
+    model: "genai.GenerativeModel", contents, request_options: Optional[Dict] = None
+) -> AsyncIterator[str]:
+    """
+    Yields the text of each chunk as the model streams its response.
+
+    With the REST transport the blocking stream is consumed on the shared executor and
+    its chunks are handed back to the event loop through a queue.
+    """
+    if get_settings().gemini_transport != "rest":
+        response = await model.generate_content_async(contents, stream=True, request_options=request_options)
+        async for chunk in response:
+            yield chunk.text
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stopped = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for chunk in model.generate_content(contents, stream=True, request_options=request_options):
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, chunk.text)
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    asyncio.ensure_future(run_blocking(produce))
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Let the worker thread stop early if the consumer went away; it reports its own
+        # errors through the queue, so the future is not awaited here.
+        stopped.set()
+
+
+def _sync_connections_opened() -> int:
+    if _session is None:
+        return 0
+    opened = 0
+    for adapter in set(_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+    return opened
+
+
+def client_stats() -> Dict:
+    with _lock:
+        stats = dict(_stats)
+    sync_opened = _sync_connections_opened()
+    async_opened = stats["async_connections_opened"]
+    return {
+        "pool_size": HTTP_POOL_SIZE,
+        "sync_requests": stats["sync_requests"],
+        "sync_connections_opened": sync_opened,
+        "sync_connection_reuses": max(stats["sync_requests"] - sync_opened, 0),
+        "async_requests": stats["async_requests"],
+        "async_connections_opened": async_opened,
+        "async_tls_handshakes": stats["async_tls_handshakes"],
+        "async_connection_reuses": max(stats["async_requests"] - async_opened, 0),
+        "models_cached": len(_models),
+        "models_created": stats["models_created"],
+        "model_reuses": stats["model_reuses"],
+    }
+
+
+async def close_clients():
+    global _session, _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _session is not None:
+        _session.close()
+        _session = None
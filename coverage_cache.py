@@ -0,0 +1,90 @@
+import time
+import hashlib
+import threading
+from typing import Dict, Optional
+
+from storage import get_connection
+from coverage_engine import CLASS_FIELDS
+
+# The LandCoverageData fields, taken from the coverage engine so this module stays free of step2.
+COVERAGE_FIELDS = CLASS_FIELDS
+
+
+def image_hash(image_data: bytes) -> str:
+    return hashlib.sha256(image_data).hexdigest()
+
+
+class CoverageCache:
+    """
+    Persistent memo of coverage estimates keyed by image content hash and prompt version.
+
+    Only complete results (every coverage field present and numeric) are stored,
+    so a hit can be used exactly like a fresh model response.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if not self._schema_ready:
+            columns = ",\n".join(f"{name} REAL NOT NULL" for name in COVERAGE_FIELDS)
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS coverage_cache (
+                    image_hash TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    {columns},
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (image_hash, prompt_version)
+                )
+            """)
+            self._schema_ready = True
+        return conn
+
+    def get(self, digest: str, prompt_version: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            f"SELECT {', '.join(COVERAGE_FIELDS)} FROM coverage_cache WHERE image_hash = ? AND prompt_version = ?",
+            (digest, prompt_version),
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {name: row[name] for name in COVERAGE_FIELDS}
+
+    def put(self, digest: str, prompt_version: str, coverage: Dict) -> bool:
+        try:
+            values = [float(coverage[name]) for name in COVERAGE_FIELDS]
+        except (KeyError, TypeError, ValueError):
+            return False
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO coverage_cache(image_hash, prompt_version, {', '.join(COVERAGE_FIELDS)}, created_at) "
+            f"VALUES(?, ?, {', '.join('?' for _ in COVERAGE_FIELDS)}, ?)",
+            (digest, prompt_version, *values, time.time()),
+        )
+        return True
+
+    def stats(self) -> Dict:
+        entries = self._conn().execute("SELECT COUNT(*) FROM coverage_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_coverage_cache = None
+
+
+def get_coverage_cache() -> CoverageCache:
+    global _coverage_cache
+    if _coverage_cache is None:
+        _coverage_cache = CoverageCache()
+    return _coverage_cache
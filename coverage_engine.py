@@ -0,0 +1,165 @@
+import io
+from typing import Dict, Sequence, Union
+
+import numpy as np
+from PIL import Image
+
+# Bumped whenever the classification rules change, so cached local results can be told apart.
+LOCAL_ENGINE_VERSION = "local-v1"
+
+VEGETATION, BUILDING, ROAD, EMPTY_LAND, WATER = range(5)
+CLASS_FIELDS = ("vegetation_coverage", "building_coverage", "road_coverage", "empty_land", "water_body")
+
+# Largest side the classifier works on. Coverage is a ratio, so downsampling barely
+# changes the result but keeps large uploads in the tens of milliseconds.
+MAX_SIDE = 640
+
+
+def load_rgb(image: Union[bytes, Image.Image], max_side: int = MAX_SIDE) -> np.ndarray:
+    """Decodes an image into a float32 HxWx3 array in [0, 1], downscaling large inputs."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = Image.open(io.BytesIO(image))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def normalize_colors(rgb: np.ndarray) -> np.ndarray:
+    """
+    Removes haze and color cast so fixed thresholds work across tiles.
+
+    Dark-object subtraction removes the per-channel atmospheric offset (satellite tiles
+    often have a blue haze), then a gray-world gain equalizes the channel medians.
+    Statistics are taken on a strided sample to keep this cheap.
+    """
+    sample = rgb[::4, ::4].reshape(-1, 3)
+    offset = np.minimum(np.percentile(sample, 1, axis=0), 0.15).astype(np.float32)
+    medians = np.maximum(np.median(np.clip(sample - offset, 0.0, None), axis=0), 1e-3)
+    gains = np.clip(medians.mean() / medians, 0.8, 1.25).astype(np.float32)
+    return np.clip((rgb - offset) * gains, 0.0, 1.0)
+
+
+def local_std(values: np.ndarray, window: int = 7) -> np.ndarray:
+    """
+    Standard deviation over a square window, computed with integral images.
+
+    Texture is a neighbourhood measure, so it is computed on a 2x downsampled grid
+    (with a matching half-size window) and expanded back, which is 4x cheaper.
+    """
+    height, width = values.shape
+    if height < 2 or width < 2:
+        # Too thin to downsample; a single row or column carries no usable texture.
+        return np.zeros((height, width), dtype=np.float32)
+    values = values[: height - height % 2, : width - width % 2]
+    values = values.reshape(height // 2, 2, width // 2, 2).mean(axis=(1, 3))
+    window = max(window // 2, 2)
+    pad = window // 2
+    area = window * window
+
+    def box_mean(x):
+        padded = np.pad(x, pad, mode="edge")
+        integral = np.pad(padded.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+        return (
+            integral[window:, window:] - integral[:-window, window:]
+            - integral[window:, :-window] + integral[:-window, :-window]
+        ) / area
+
+    values = values.astype(np.float64)
+    mean = box_mean(values)
+    std = np.sqrt(np.maximum(box_mean(values * values) - mean * mean, 0.0)).astype(np.float32)
+    std = std.repeat(2, axis=0).repeat(2, axis=1)
+    return np.pad(std, ((0, height - std.shape[0]), (0, width - std.shape[1])), mode="edge")
+
+
+def classify_pixels(rgb: np.ndarray) -> np.ndarray:
+    """
+    Labels every pixel of an RGB array with a land-cover class.
+
+    Rules are applied in priority order: water, vegetation, bare land, road, and
+    everything else (roofs, shadows, mixed pixels) counts as building.
+
+    Args:
+        rgb (np.ndarray): HxWx3 float array in [0, 1].
+
+    Returns:
+        np.ndarray: HxW uint8 array of class ids.
+    """
+    # Work on contiguous channel planes; reductions over the last axis of HxWx3 are slow.
+    r, g, b = np.ascontiguousarray(normalize_colors(rgb).transpose(2, 0, 1))
+    luminance = (r + g + b) / 3
+    brightness = np.maximum(np.maximum(r, g), b)
+    saturation = (brightness - np.minimum(np.minimum(r, g), b)) / np.maximum(brightness, 1e-3)
+    texture = local_std(luminance)
+
+    # Excess-green index stands in for NDVI, which needs a near-infrared band that
+    # satellite RGB tiles don't have. Dense canopy is often too dark to look green, so
+    # dark, textured pixels without a red/brown cast also count as vegetation.
+    exg = 2 * g - r - b
+    green = (exg > 0.06) & (g > r + 0.02) & (g >= b - 0.02) & (luminance < 0.55)
+    canopy = (luminance < 0.3) & (texture >= 0.03) & (g >= r - 0.005) & (b >= r - 0.01)
+
+    # Water is dark, smooth and blue-dominant.
+    water = (luminance < 0.3) & (texture < 0.02) & (b > r + 0.05) & (b >= g)
+    vegetation = ~water & (green | canopy)
+    empty_land = ~water & ~vegetation & (r > b + 0.05) & (r >= g) & (saturation > 0.12) & (luminance > 0.28)
+    road = ~water & ~vegetation & ~empty_land & (saturation < 0.2) & (luminance >= 0.25) & (luminance < 0.6)
+
+    labels = np.full(r.shape, BUILDING, dtype=np.uint8)
+    labels[road] = ROAD
+    labels[empty_land] = EMPTY_LAND
+    labels[vegetation] = VEGETATION
+    labels[water] = WATER
+    return labels
+
+
+def _to_percentages(counts: np.ndarray) -> Dict[str, float]:
+    # Largest-remainder rounding to one decimal place keeps the total at exactly 100.
+    total = counts.sum()
+    if total == 0:
+        return {name: 0.0 for name in CLASS_FIELDS}
+    tenths = counts * 1000.0 / total
+    floored = np.floor(tenths)
+    remainder = int(1000 - floored.sum())
+    for index in np.argsort(-(tenths - floored))[:remainder]:
+        floored[index] += 1
+    return {name: float(value) / 10 for name, value in zip(CLASS_FIELDS, floored)}
+
+
+def estimate_coverage(image: Union[bytes, Image.Image]) -> Dict[str, float]:
+    """
+    Estimates land coverage locally, returning the same fields as LandCoverageData.
+
+    Args:
+        image (bytes | PIL.Image.Image): Encoded image bytes or an opened image.
+
+    Returns:
+        dict: Coverage percentages per class, summing to 100.
+    """
+    labels = classify_pixels(load_rgb(image))
+    counts = np.bincount(labels.ravel(), minlength=len(CLASS_FIELDS))
+    return _to_percentages(counts)
+
+
+def aggregate_coverage(coverages: Sequence[Dict], weights: Sequence[float]) -> Dict[str, float]:
+    """
+    Weighted mean of several coverage results (e.g. tiles weighted by ground area).
+
+    Returns:
+        dict: Coverage percentages per class, summing to 100.
+    """
+    if not coverages:
+        return _to_percentages(np.zeros(len(CLASS_FIELDS)))
+    values = np.array([[float(c.get(name, 0.0)) for name in CLASS_FIELDS] for c in coverages], dtype=np.float64)
+    return _to_percentages((values * np.asarray(weights, dtype=np.float64)[:, None]).sum(axis=0))
+
+
+def compare_coverage(primary: Dict, secondary: Dict) -> Dict:
+    """Per-field absolute difference between two coverage results, in percentage points."""
+    diff = {
+        name: round(abs(float(primary.get(name, 0.0)) - float(secondary.get(name, 0.0))), 2)
+        for name in CLASS_FIELDS
+    }
+    return {"abs_diff": diff, "max_abs_diff": max(diff.values())}
@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from storage import get_connection
+from coverage_engine import CLASS_FIELDS, LOCAL_ENGINE_VERSION
+
+# Imagery changes slowly; per-cell estimates are reused for this long.
+COVERAGE_GRID_TTL_HOURS = float(os.getenv("COVERAGE_GRID_TTL_HOURS", "720"))
+
+Cell = Tuple[int, int]
+
+
+def engine_version(backend: str) -> str:
+    """Version of the estimator behind a backend, so results from older rules or prompts are not reused."""
+    if backend == "local":
+        return LOCAL_ENGINE_VERSION
+    from step1 import COVERAGE_PROMPT_VERSION
+    return COVERAGE_PROMPT_VERSION
+
+
+class CoverageGrid:
+    """
+    Per-cell coverage results on the global Web Mercator tile grid.
+
+    A cell (x, y) at a given zoom and tile size is the tile whose pixel bounds are
+    [x * width, (x + 1) * width) by [y * height, (y + 1) * height) in world pixels, so
+    every region analysis and heatmap over the same area addresses the same cells.
+    """
+
+    def __init__(self, ttl_seconds: float = COVERAGE_GRID_TTL_HOURS * 3600, db_path: Optional[str] = None):
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if not self._schema_ready:
+            columns = ",\n".join(f"{name} REAL NOT NULL" for name in CLASS_FIELDS)
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS coverage_grid (
+                    zoom INTEGER NOT NULL,
+                    size TEXT NOT NULL,
+                    backend TEXT NOT NULL,
+                    x INTEGER NOT NULL,
+                    y INTEGER NOT NULL,
+                    version TEXT NOT NULL,
+                    {columns},
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (zoom, size, backend, x, y)
+                )
+            """)
+            self._schema_ready = True
+        return conn
+
+    def get_range(self, zoom: int, size: str, backend: str, x0: int, x1: int, y0: int, y1: int) -> np.ndarray:
+        """
+        Fresh results for every cell with x0 <= x <= x1 and y0 <= y <= y1, in one query.
+
+        Returns:
+            np.ndarray: N x (2 + len(CLASS_FIELDS)) array of x, y and the coverage fields.
+        """
+        rows = self._conn().execute(
+            f"SELECT x, y, {', '.join(CLASS_FIELDS)} FROM coverage_grid "
+            "WHERE zoom = ? AND size = ? AND backend = ? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ? "
+            "AND version = ? AND updated_at >= ?",
+            (zoom, size, backend, x0, x1, y0, y1, engine_version(backend), time.time() - self.ttl_seconds),
+        ).fetchall()
+        return np.array([tuple(row) for row in rows], dtype=np.float64).reshape(-1, 2 + len(CLASS_FIELDS))
+
+    def get_cells(self, zoom: int, size: str, backend: str, cells: Iterable[Cell]) -> Dict[Cell, Dict]:
+        """Cached results for the given cells, keyed by (x, y); missing cells are left out."""
+        cells = set(cells)
+        if not cells:
+            return {}
+        xs, ys = zip(*cells)
+        found = {}
+        for row in self.get_range(zoom, size, backend, min(xs), max(xs), min(ys), max(ys)):
+            cell = (int(row[0]), int(row[1]))
+            if cell in cells:
+                found[cell] = {name: float(value) for name, value in zip(CLASS_FIELDS, row[2:])}
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(cells) - len(found)
+        return found
+
+    def put_cells(self, zoom: int, size: str, backend: str, results: Dict[Cell, Dict]):
+        now = time.time()
+        version = engine_version(backend)
+        rows = [
+            (zoom, size, backend, x, y, version, *(float(coverage[name]) for name in CLASS_FIELDS), now)
+            for (x, y), coverage in results.items()
+        ]
+        if not rows:
+            return
+        conn = self._conn()
+        # One transaction for the batch instead of one commit per row.
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO coverage_grid(zoom, size, backend, x, y, version, "
+                f"{', '.join(CLASS_FIELDS)}, updated_at) VALUES({', '.join('?' for _ in range(7 + len(CLASS_FIELDS)))})",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> Dict:
+        entries = self._conn().execute("SELECT COUNT(*) FROM coverage_grid").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_coverage_grid = None
+
+
+def get_coverage_grid() -> CoverageGrid:
+    global _coverage_grid
+    if _coverage_grid is None:
+        _coverage_grid = CoverageGrid()
+    return _coverage_grid
@@ -0,0 +1,75 @@
+import os
+import asyncio
+import functools
+import contextvars
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Shared, bounded pool for the blocking work that is still left on the request path
+# (file I/O, sync SDK calls). Keeping it bounded stops a burst of requests from
+# spawning an unbounded number of threads.
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "32"))
+# CPU-bound work (local coverage estimation over many tiles) runs in worker processes.
+PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", "0")) or os.cpu_count() or 1
+
+_executor = None
+_process_pool = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking callable on the shared executor without stalling the event loop.
+
+    Args:
+        func (callable): Function to run.
+        *args, **kwargs: Arguments forwarded to the function.
+
+    Returns:
+        Any: The function's return value.
+    """
+    loop = asyncio.get_running_loop()
+    # Carry context variables (e.g. the request trace) into the worker thread.
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # spawn rather than fork: the server process has running threads and an event loop.
+        _process_pool = ProcessPoolExecutor(
+            max_workers=PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+async def run_in_process(func, *args):
+    """
+    Runs a CPU-bound, picklable callable in the shared process pool.
+
+    Args:
+        func (callable): Module-level function to run.
+        *args: Picklable arguments.
+
+    Returns:
+        Any: The function's return value.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), func, *args)
+
+
+def shutdown_executor():
+    global _executor, _process_pool
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
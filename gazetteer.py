@@ -0,0 +1,361 @@
+import os
+import csv
+import math
+import hashlib
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Bundled city list with climate data; compiled once to .npy files that are memory-mapped.
+GAZETTEER_CSV = os.getenv(
+    "GAZETTEER_CSV", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.csv")
+)
+GAZETTEER_CACHE_DIR = os.getenv("GAZETTEER_CACHE_DIR", "cache")
+# Beyond this distance from every known city, climate falls back to latitude bands.
+CLIMATE_MAX_DISTANCE_KM = float(os.getenv("CLIMATE_MAX_DISTANCE_KM", "300"))
+
+EARTH_RADIUS_KM = 6371.0088
+
+CITY_DTYPE = np.dtype([
+    ("name", "U48"),
+    ("country", "U40"),
+    ("country_code", "U2"),
+    ("latitude", "f8"),
+    ("longitude", "f8"),
+    ("population", "i8"),
+    ("koppen", "U3"),
+    ("wet_start", "i1"),
+    ("wet_end", "i1"),
+    # Unit vector of the location and the k-d tree split axis of the node stored at this row.
+    ("x", "f8"),
+    ("y", "f8"),
+    ("z", "f8"),
+    ("axis", "i1"),
+])
+NAME_DTYPE = np.dtype([("key", "U48"), ("row", "i4")])
+
+KOPPEN_ZONES = {"A": "tropical", "B": "arid", "C": "temperate", "D": "continental", "E": "polar"}
+
+# Spellings people type (and WeatherAPI returns) for countries whose dataset name differs.
+COUNTRY_ALIASES = {
+    "usa": "US",
+    "us": "US",
+    "united states of america": "US",
+    "america": "US",
+    "uk": "GB",
+    "great britain": "GB",
+    "england": "GB",
+    "scotland": "GB",
+    "czech republic": "CZ",
+    "uae": "AE",
+    "korea": "KR",
+    "republic of korea": "KR",
+    "viet nam": "VN",
+    "burma": "MM",
+    "cote d'ivoire": "CI",
+    "democratic republic of the congo": "CD",
+    "congo": "CG",
+    "russian federation": "RU",
+    "turkiye": "TR",
+}
+
+
+@dataclass
+class City:
+    name: str
+    country: str
+    country_code: str
+    latitude: float
+    longitude: float
+    population: int
+    koppen: str
+    wet_season: Optional[Tuple[int, int]]
+
+
+@dataclass
+class Climate:
+    zone: str
+    hemisphere: str
+    koppen: Optional[str] = None
+    wet_season: Optional[Tuple[int, int]] = None
+    nearest_city: Optional[str] = None
+    distance_km: Optional[float] = None
+
+    def is_wet_month(self, month: int) -> bool:
+        """Whether month falls in the wet season, which may wrap past December (e.g. 11-3)."""
+        if not self.wet_season:
+            return False
+        start, end = self.wet_season
+        if start <= end:
+            return start <= month <= end
+        return month >= start or month <= end
+
+
+def normalize_name(name: str) -> str:
+    """Case-, accent- and punctuation-insensitive key for city and country names."""
+    text = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode("ascii").lower()
+    text = "".join(ch if ch.isalnum() else " " for ch in text.replace("'", ""))
+    return " ".join(text.split())
+
+
+def hemisphere(latitude: float) -> str:
+    return "southern" if latitude < 0 else "northern"
+
+
+def latitude_zone(latitude: float) -> str:
+    """Rough climate zone from latitude alone, for places far from any listed city."""
+    latitude = abs(latitude)
+    if latitude < 23.44:
+        return "tropical"
+    if latitude < 35:
+        return "subtropical"
+    if latitude < 55:
+        return "temperate"
+    if latitude < 66.56:
+        return "continental"
+    return "polar"
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _unit_vector(latitude: float, longitude: float) -> Tuple[float, float, float]:
+    phi, lam = math.radians(latitude), math.radians(longitude)
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+
+def _chord_to_km(chord: float) -> float:
+    # Straight-line distance between unit vectors grows monotonically with arc length.
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def _km_to_chord(km: float) -> float:
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+def _build_kdtree(points: np.ndarray, rows: np.ndarray) -> Tuple[List[int], List[int]]:
+    """
+    Lays rows out as an implicit k-d tree: each slice's node is its middle element,
+    split on the widest axis, with the two halves of the slice as its subtrees.
+
+    Returns:
+        Tuple[List[int], List[int]]: The row order and the split axis of each position.
+    """
+    if len(rows) == 0:
+        return [], []
+    axis = int(np.argmax(np.ptp(points[rows], axis=0)))
+    rows = rows[np.argsort(points[rows, axis], kind="stable")]
+    mid = len(rows) // 2
+    left_order, left_axes = _build_kdtree(points, rows[:mid])
+    right_order, right_axes = _build_kdtree(points, rows[mid + 1:])
+    return left_order + [int(rows[mid])] + right_order, left_axes + [axis] + right_axes
+
+
+def _parse_wet_season(value: str) -> Tuple[int, int]:
+    if not value:
+        return 0, 0
+    start, end = (int(month) for month in value.split("-"))
+    if not (1 <= start <= 12 and 1 <= end <= 12):
+        raise ValueError(f"Invalid wet season '{value}'")
+    return start, end
+
+
+def compile_gazetteer(csv_path: str, cities_path: str, names_path: str):
+    """
+    Compiles the gazetteer CSV into two .npy files.
+
+    The cities array is laid out as an implicit k-d tree over the unit vectors of
+    their locations; the names array maps every normalized name and alias to its
+    city row, sorted by key for binary search.
+    """
+    rows: List[tuple] = []
+    aliases: List[List[str]] = []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for record in csv.DictReader(f):
+            latitude, longitude = float(record["latitude"]), float(record["longitude"])
+            rows.append((
+                record["name"], record["country"], record["country_code"], latitude, longitude,
+                int(record["population"] or 0), record["koppen"], *_parse_wet_season(record["wet_season"]),
+                *_unit_vector(latitude, longitude), -1,
+            ))
+            aliases.append([record["name"], *filter(None, record["alt_names"].split("|"))])
+
+    cities = np.array(rows, dtype=CITY_DTYPE)
+    points = np.stack([cities["x"], cities["y"], cities["z"]], axis=1)
+    order, axes = _build_kdtree(points, np.arange(len(cities)))
+    cities = cities[order]
+    cities["axis"] = axes
+
+    names = sorted(
+        {(normalize_name(alias), int(new_row)) for new_row, old_row in enumerate(order) for alias in aliases[old_row]}
+    )
+    _save_atomic(cities_path, cities)
+    _save_atomic(names_path, np.array(names, dtype=NAME_DTYPE))
+
+
+def _save_atomic(path: str, array: np.ndarray):
+    # Several workers may compile at once; each writes its own temp file and renames it.
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class Gazetteer:
+    """
+    City and climate lookups over the compiled gazetteer, without any network calls.
+
+    Coordinates are resolved to the nearest city by a k-d tree search over unit
+    vectors (so distances are right across the antimeridian and near the poles);
+    city names are resolved by binary search over the sorted name index. Both
+    arrays are memory-mapped, so only the pages a lookup touches are read.
+    """
+
+    def __init__(self, cities: np.ndarray, names: np.ndarray):
+        self.cities = cities
+        self.names = names
+        # The tree walk touches a handful of numbers per node; plain floats are several
+        # times faster to do arithmetic on than numpy scalars read from the map.
+        self._coords = (cities["x"].tolist(), cities["y"].tolist(), cities["z"].tolist())
+        self._axes = cities["axis"].tolist()
+        self._keys = names["key"]
+
+    @classmethod
+    def load(cls, csv_path: str = GAZETTEER_CSV, cache_dir: str = GAZETTEER_CACHE_DIR) -> "Gazetteer":
+        """Memory-maps the compiled gazetteer, compiling it first if the CSV has changed."""
+        with open(csv_path, "rb") as f:
+            version = hashlib.sha256(f.read()).hexdigest()[:16]
+        os.makedirs(cache_dir, exist_ok=True)
+        cities_path = os.path.join(cache_dir, f"gazetteer-{version}.cities.npy")
+        names_path = os.path.join(cache_dir, f"gazetteer-{version}.names.npy")
+        if not (os.path.exists(cities_path) and os.path.exists(names_path)):
+            compile_gazetteer(csv_path, cities_path, names_path)
+        return cls(np.load(cities_path, mmap_mode="r"), np.load(names_path, mmap_mode="r"))
+
+    def __len__(self) -> int:
+        return len(self.cities)
+
+    def _city(self, row: int) -> City:
+        record = self.cities[row]
+        wet_start, wet_end = int(record["wet_start"]), int(record["wet_end"])
+        return City(
+            name=str(record["name"]),
+            country=str(record["country"]),
+            country_code=str(record["country_code"]),
+            latitude=float(record["latitude"]),
+            longitude=float(record["longitude"]),
+            population=int(record["population"]),
+            koppen=str(record["koppen"]),
+            wet_season=(wet_start, wet_end) if wet_start else None,
+        )
+
+    def lookup(self, city: str, country: Optional[str] = None) -> Optional[City]:
+        """
+        Finds a city by name or alias.
+
+        When several cities share the name, the one in the given country (matched by
+        name, ISO code or a common alias) wins, then the most populous.
+
+        Returns:
+            Optional[City]: The city, or None if the name is not in the gazetteer.
+        """
+        key = normalize_name(city)
+        if not key:
+            return None
+        start = int(np.searchsorted(self._keys, key, side="left"))
+        end = int(np.searchsorted(self._keys, key, side="right"))
+        if start == end:
+            return None
+        candidates = [self._city(int(self.names[i]["row"])) for i in range(start, end)]
+        if country:
+            wanted = normalize_name(country)
+            code = COUNTRY_ALIASES.get(wanted, wanted.upper())
+            matching = [c for c in candidates if normalize_name(c.country) == wanted or c.country_code == code]
+            candidates = matching or candidates
+        return max(candidates, key=lambda c: c.population)
+
+    def nearest(self, latitude: float, longitude: float, max_km: Optional[float] = None) -> Optional[Tuple[City, float]]:
+        """
+        Finds the closest city to a point.
+
+        Returns:
+            Optional[Tuple[City, float]]: The city and its great-circle distance in km,
+                or None if no city lies within max_km.
+        """
+        query = _unit_vector(latitude, longitude)
+        xs, ys, zs = self._coords
+        best_row = -1
+        best = math.inf if max_km is None else _km_to_chord(max_km) ** 2
+        # Slices still to visit, with the squared distance from the query to their side
+        # of the splitting plane; a slice is skipped once that exceeds the best so far.
+        stack = [(0, len(self.cities), 0.0)]
+        while stack:
+            lo, hi, bound = stack.pop()
+            if lo >= hi or bound > best:
+                continue
+            mid = (lo + hi) // 2
+            dx, dy, dz = query[0] - xs[mid], query[1] - ys[mid], query[2] - zs[mid]
+            distance = dx * dx + dy * dy + dz * dz
+            if distance <= best:
+                best_row, best = mid, distance
+            offset = (dx, dy, dz)[self._axes[mid]]
+            near, far = ((lo, mid), (mid + 1, hi)) if offset < 0 else ((mid + 1, hi), (lo, mid))
+            stack.append((*far, offset * offset))
+            stack.append((*near, 0.0))
+        if best_row < 0:
+            return None
+        return self._city(best_row), _chord_to_km(math.sqrt(best))
+
+    def climate_at(self, latitude: float, longitude: float) -> Climate:
+        """Climate of the nearest city within CLIMATE_MAX_DISTANCE_KM, else a latitude-band estimate."""
+        found = self.nearest(latitude, longitude, CLIMATE_MAX_DISTANCE_KM)
+        if found is None:
+            return Climate(zone=latitude_zone(latitude), hemisphere=hemisphere(latitude))
+        city, distance = found
+        return Climate(
+            zone=KOPPEN_ZONES.get(city.koppen[:1], latitude_zone(latitude)),
+            hemisphere=hemisphere(latitude),
+            koppen=city.koppen,
+            wet_season=city.wet_season,
+            nearest_city=city.name,
+            distance_km=round(distance, 1),
+        )
+
+    def climate_for(
+        self,
+        city: str = "",
+        country: str = "",
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+    ) -> Climate:
+        """Climate of a place, preferring its coordinates and falling back to its name."""
+        if latitude is not None and longitude is not None:
+            return self.climate_at(latitude, longitude)
+        place = self.lookup(city, country) if city else None
+        if place is not None:
+            return self.climate_at(place.latitude, place.longitude)
+        latitude = latitude or 0.0
+        return Climate(zone=latitude_zone(latitude), hemisphere=hemisphere(latitude))
+
+    def stats(self) -> Dict:
+        return {"cities": len(self.cities), "names": len(self.names)}
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer.load()
+    return _gazetteer
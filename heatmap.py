@@ -0,0 +1,160 @@
+import io
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+from executor import run_blocking
+from coverage_engine import CLASS_FIELDS
+from coverage_grid import get_coverage_grid
+from region import (
+    REGION_CONCURRENCY, REGION_COVERAGE_BACKEND, REGION_MAX_TILES, REGION_TILE_SIZE, BBox,
+    analyze_cells, cell_bounds, cell_range, cell_tile,
+)
+
+HEATMAP_MAX_CELLS = int(os.getenv("HEATMAP_MAX_CELLS", "20000"))
+# Cells analyzed per request when filling gaps; the rest stay empty until a later request.
+HEATMAP_MAX_NEW_CELLS = int(os.getenv("HEATMAP_MAX_NEW_CELLS", str(REGION_MAX_TILES)))
+HEATMAP_MAX_PX = int(os.getenv("HEATMAP_MAX_PX", "2048"))
+
+# Low and high colors per metric; values in between are interpolated.
+PALETTES = {
+    "vegetation_coverage": ((255, 255, 204), (0, 104, 55)),
+    "building_coverage": ((255, 245, 235), (165, 15, 21)),
+    "road_coverage": ((247, 247, 247), (37, 37, 37)),
+    "empty_land": ((255, 247, 236), (140, 81, 10)),
+    "water_body": ((247, 251, 255), (8, 48, 107)),
+}
+CELL_ALPHA = 200
+
+
+@dataclass
+class Heatmap:
+    """Coverage rasterized over a block of grid cells; NaN where a cell has no result."""
+    values: np.ndarray
+    x0: int
+    y0: int
+    zoom: int
+    size: str
+    backend: str
+    stats: Dict
+
+    @property
+    def bounds(self) -> BBox:
+        rows, cols = self.values.shape[:2]
+        south, _, _, east = cell_bounds(self.x0 + cols - 1, self.y0 + rows - 1, self.zoom, self.size)
+        _, west, north, _ = cell_bounds(self.x0, self.y0, self.zoom, self.size)
+        return float(south), float(west), float(north), float(east)
+
+
+def rasterize(cells: np.ndarray, x0: int, y0: int, rows: int, cols: int) -> np.ndarray:
+    """Scatters N x (2 + fields) cell rows (x, y, coverage...) into a rows x cols x fields grid."""
+    grid = np.full((rows, cols, len(CLASS_FIELDS)), np.nan, dtype=np.float32)
+    if len(cells):
+        grid[cells[:, 1].astype(np.int64) - y0, cells[:, 0].astype(np.int64) - x0] = cells[:, 2:]
+    return grid
+
+
+async def build_heatmap(
+    bbox: BBox,
+    zoom: int = 18,
+    coverage_backend: Optional[str] = None,
+    fill_missing: bool = True,
+    concurrency: int = REGION_CONCURRENCY,
+) -> Heatmap:
+    """
+    Collects per-cell coverage for a region from the coverage grid.
+
+    Stored cells are read with one range query and rasterized with NumPy; only cells
+    with no stored result are analyzed (up to HEATMAP_MAX_NEW_CELLS per call), and
+    those results are stored for the next request.
+    """
+    backend = coverage_backend or REGION_COVERAGE_BACKEND
+    size = REGION_TILE_SIZE
+    started = time.perf_counter()
+    x0, x1, y0, y1 = cell_range(bbox, zoom, size)
+    rows, cols = y1 - y0 + 1, x1 - x0 + 1
+    if rows * cols > HEATMAP_MAX_CELLS:
+        raise ValueError(
+            f"The heatmap needs {rows * cols} cells at zoom {zoom}; the limit is {HEATMAP_MAX_CELLS}. "
+            "Use a smaller box or a lower zoom."
+        )
+
+    stored = await run_blocking(get_coverage_grid().get_range, zoom, size, backend, x0, x1, y0, y1)
+    values = rasterize(stored, x0, y0, rows, cols)
+    missing = np.argwhere(np.isnan(values[:, :, 0]))
+    computed = failed = 0
+    if fill_missing and len(missing):
+        tiles = [
+            cell_tile((int(x0 + col), int(y0 + row)), zoom, size, int(row), int(col))
+            for row, col in missing[:HEATMAP_MAX_NEW_CELLS]
+        ]
+        for tile, result in zip(tiles, await analyze_cells(tiles, zoom, backend, concurrency, size)):
+            if "coverage" in result:
+                values[tile.row, tile.col] = [result["coverage"][name] for name in CLASS_FIELDS]
+                computed += 1
+            else:
+                failed += 1
+
+    return Heatmap(values, x0, y0, zoom, size, backend, {
+        "rows": rows,
+        "cols": cols,
+        "cells_total": rows * cols,
+        "cells_cached": int(len(stored)),
+        "cells_computed": computed,
+        "cells_failed": failed,
+        "cells_missing": int(np.isnan(values[:, :, 0]).sum()),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+
+
+def render_png(heatmap: Heatmap, metric: str = "vegetation_coverage", cell_px: int = 16) -> bytes:
+    """
+    Renders one metric as an RGBA PNG, one square block per cell, transparent where missing.
+
+    Cells are squares in Web Mercator, so the image can be overlaid on a web map at
+    heatmap.bounds without reprojection.
+    """
+    low, high = PALETTES[metric]
+    lut = np.linspace(low, high, 256).round().astype(np.uint8)
+    values = heatmap.values[:, :, CLASS_FIELDS.index(metric)]
+    missing = np.isnan(values)
+    index = np.clip(np.nan_to_num(values) * 2.55, 0, 255).astype(np.uint8)
+
+    rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+    rgba[:, :, :3] = lut[index]
+    rgba[:, :, 3] = np.where(missing, 0, CELL_ALPHA)
+    scale = max(1, min(cell_px, HEATMAP_MAX_PX // max(values.shape)))
+    rgba = rgba.repeat(scale, axis=0).repeat(scale, axis=1)
+
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, mode="RGBA").save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def to_geojson(heatmap: Heatmap) -> Dict:
+    """One polygon feature per cell with a result, carrying every coverage field."""
+    rows, cols = np.nonzero(~np.isnan(heatmap.values[:, :, 0]))
+    xs, ys = cols + heatmap.x0, rows + heatmap.y0
+    south, west, north, east = (np.round(v, 7).tolist() for v in cell_bounds(xs, ys, heatmap.zoom, heatmap.size))
+    coverage = np.round(heatmap.values[rows, cols].astype(np.float64), 1).tolist()
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[w, s], [e, s], [e, n], [w, n], [w, s]]],
+            },
+            "properties": {"cell": [int(x), int(y)], **dict(zip(CLASS_FIELDS, values))},
+        }
+        for x, y, s, w, n, e, values in zip(xs.tolist(), ys.tolist(), south, west, north, east, coverage)
+    ]
+    return {
+        "type": "FeatureCollection",
+        "bbox": [heatmap.bounds[1], heatmap.bounds[0], heatmap.bounds[3], heatmap.bounds[2]],
+        "properties": {"zoom": heatmap.zoom, "coverage_backend": heatmap.backend, **heatmap.stats},
+        "features": features,
+    }
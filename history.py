@@ -0,0 +1,353 @@
+import os
+import json
+import math
+import time
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from storage import get_connection
+from coverage_engine import CLASS_FIELDS
+from gazetteer import haversine_km
+
+# Every successful /analyze-location/ result is recorded; HISTORY_ENABLED=0 turns this off.
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "1").lower() in ("1", "true", "yes")
+# A repeat request for the same point, zoom and coverage backend within this many seconds is
+# answered from the store (0 disables reuse).
+HISTORY_REUSE_SECONDS = float(os.getenv("HISTORY_REUSE_SECONDS", "600"))
+HISTORY_REUSE_RADIUS_M = float(os.getenv("HISTORY_REUSE_RADIUS_M", "20"))
+# Records older than this are pruned (0 keeps everything).
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", "365"))
+
+# Precision of the stored geohash. An 8-character cell is about 38 x 19 m, and records in
+# the same cell count as the same site for change detection.
+GEOHASH_PRECISION = 8
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+METERS_PER_DEGREE = 111_320.0
+BUCKET_SECONDS = {"day": 86400, "week": 7 * 86400, "month": 30 * 86400}
+SECONDS_PER_YEAR = 365.25 * 86400
+PRUNE_INTERVAL_SECONDS = 3600
+# Rows with every coverage field at 0 were written without a coverage estimate by older
+# versions (failed reports); they are kept for history but left out of trends and drops.
+RECORDED_COVERAGE = f"({' + '.join(CLASS_FIELDS)}) > 0"
+
+
+def encode_geohash(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Standard base-32 geohash; nearby points share a prefix, so a prefix is an index range."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (interval[0] + interval[1]) / 2
+        if coordinate >= mid:
+            value = (value << 1) | 1
+            interval[0] = mid
+        else:
+            value <<= 1
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def _cell_size(precision: int) -> Tuple[float, float]:
+    """Height and width in degrees of a geohash cell."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def covering_prefixes(latitude: float, longitude: float, radius_m: float) -> List[str]:
+    """
+    Geohash prefixes whose cells together cover a circle, at most four of them.
+
+    The precision is the finest at which one cell is at least as large as the circle's
+    bounding box, so the box's corners fall in at most four cells.
+    """
+    lat_delta = radius_m / METERS_PER_DEGREE
+    lon_delta = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+    precision = 1
+    while precision < GEOHASH_PRECISION:
+        height, width = _cell_size(precision + 1)
+        if height < 2 * lat_delta or width < 2 * lon_delta:
+            break
+        precision += 1
+    corners = [
+        (min(max(latitude + dy, -90.0), 90.0), ((longitude + dx + 180.0) % 360.0) - 180.0)
+        for dy in (-lat_delta, lat_delta) for dx in (-lon_delta, lon_delta)
+    ]
+    return sorted({encode_geohash(lat, lon, precision) for lat, lon in corners})
+
+
+def _distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    return haversine_km(lat1, lon1, lat2, lon2) * 1000
+
+
+class HistoryStore:
+    """
+    Every analysed location with its coverage, weather snapshot and recommendations.
+
+    Rows are indexed by geohash and time, so a point's history is a few index range
+    scans (one per covering geohash prefix) and change detection scans only the rows in
+    the requested time window.
+    """
+
+    def __init__(
+        self,
+        reuse_seconds: float = HISTORY_REUSE_SECONDS,
+        reuse_radius_m: float = HISTORY_REUSE_RADIUS_M,
+        retention_days: float = HISTORY_RETENTION_DAYS,
+        db_path: Optional[str] = None,
+    ):
+        self.reuse_seconds = reuse_seconds
+        self.reuse_radius_m = reuse_radius_m
+        self.retention_days = retention_days
+        self.db_path = db_path
+        self.recorded = 0
+        self.reused = 0
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if not self._schema_ready:
+            columns = ",\n".join(f"{name} REAL NOT NULL" for name in CLASS_FIELDS)
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS location_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    geohash TEXT NOT NULL,
+                    latitude REAL NOT NULL,
+                    longitude REAL NOT NULL,
+                    zoom INTEGER NOT NULL,
+                    city TEXT NOT NULL,
+                    country TEXT NOT NULL,
+                    coverage_backend TEXT NOT NULL,
+                    {columns},
+                    temperature REAL,
+                    humidity REAL,
+                    season TEXT,
+                    weather TEXT,
+                    recommendations TEXT,
+                    result TEXT NOT NULL,
+                    reusable INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS location_history_geohash ON location_history(geohash, created_at)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS location_history_created ON location_history(created_at)")
+            self._schema_ready = True
+        return conn
+
+    def record(
+        self,
+        latitude: float,
+        longitude: float,
+        zoom: int,
+        city: str,
+        country: str,
+        coverage_backend: str,
+        result: Dict,
+        reusable: bool = True,
+        coverage: Optional[Dict] = None,
+    ):
+        """
+        Stores a successful location analysis.
+
+        Results built from fallbacks (a stale tile or recommendation, a local coverage
+        estimate standing in for the LLM) should pass reusable=False: they are kept for
+        history but never served to a repeat request.
+
+        coverage is the coverage estimate itself, which exists even when the report
+        failed; without it the report's land_coverage is used. A result with neither is
+        not recorded, since trend and drops would read its missing fields as 0%.
+        """
+        report = result.get("final_report") or {}
+        response = report.get("response") or {}
+        coverage = coverage or response.get("land_coverage") or {}
+        try:
+            values = [float(coverage[name]) for name in CLASS_FIELDS]
+        except (KeyError, TypeError, ValueError):
+            return
+        weather = response.get("weather_data") or {}
+        reusable = reusable and report.get("status") == "success" and not report.get("stale")
+        now = time.time()
+        stored = {key: value for key, value in result.items() if key not in ("debug", "timings")}
+        self._conn().execute(
+            f"INSERT INTO location_history(geohash, latitude, longitude, zoom, city, country, coverage_backend, "
+            f"{', '.join(CLASS_FIELDS)}, temperature, humidity, season, weather, recommendations, result, "
+            f"reusable, created_at) VALUES({', '.join('?' for _ in range(15 + len(CLASS_FIELDS)))})",
+            (
+                encode_geohash(latitude, longitude), latitude, longitude, zoom, city, country, coverage_backend,
+                *values,
+                weather.get("temperature"), weather.get("humidity"), (response.get("season") or {}).get("season"),
+                json.dumps(weather) if weather else None,
+                json.dumps(response.get("recommendations")) if "recommendations" in response else None,
+                json.dumps(stored, default=str), int(bool(reusable)), now,
+            ),
+        )
+        with self._lock:
+            self.recorded += 1
+            prune = self.retention_days > 0 and now - self._last_prune > PRUNE_INTERVAL_SECONDS
+            if prune:
+                self._last_prune = now
+        if prune:
+            self._conn().execute(
+                "DELETE FROM location_history WHERE created_at < ?", (now - self.retention_days * 86400,)
+            )
+
+    def _near(
+        self, latitude: float, longitude: float, radius_m: float, where: str = "", params: Sequence = ()
+    ) -> List:
+        """Rows within radius_m of a point, newest first; where/params add conditions on the same rows."""
+        rows = []
+        conn = self._conn()
+        for prefix in covering_prefixes(latitude, longitude, radius_m):
+            rows += conn.execute(
+                f"SELECT * FROM location_history WHERE geohash >= ? AND geohash < ? {where}",
+                (prefix, prefix + "~", *params),
+            ).fetchall()
+        rows = [row for row in rows if _distance_m(latitude, longitude, row["latitude"], row["longitude"]) <= radius_m]
+        return sorted(rows, key=lambda row: -row["created_at"])
+
+    def recent(
+        self, latitude: float, longitude: float, zoom: int, city: str, country: str, coverage_backend: str
+    ) -> Optional[Dict]:
+        """The latest reusable result for the same point and request settings within the reuse window."""
+        if self.reuse_seconds <= 0:
+            return None
+        rows = self._near(
+            latitude, longitude, self.reuse_radius_m,
+            "AND created_at >= ? AND reusable = 1 AND zoom = ? AND coverage_backend = ? "
+            "AND lower(city) = lower(?) AND lower(country) = lower(?)",
+            (time.time() - self.reuse_seconds, zoom, coverage_backend, city, country),
+        )
+        if not rows:
+            return None
+        with self._lock:
+            self.reused += 1
+        return {**json.loads(rows[0]["result"]), "recorded_at": rows[0]["created_at"]}
+
+    def trend(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_m: float = 50.0,
+        days: float = 365.0,
+        bucket: str = "month",
+        metric: str = "vegetation_coverage",
+    ) -> Dict:
+        """
+        Coverage over time around a point.
+
+        Returns:
+            Dict: Per-bucket averages of every coverage field (oldest first), the change
+                of metric between the first and last bucket, and its least-squares slope
+                in percentage points per year.
+        """
+        if bucket not in BUCKET_SECONDS:
+            raise ValueError(f"Unknown bucket '{bucket}'. Supported buckets: {', '.join(BUCKET_SECONDS)}")
+        if metric not in CLASS_FIELDS:
+            raise ValueError(f"Unknown metric '{metric}'. Supported metrics: {', '.join(CLASS_FIELDS)}")
+        rows = self._near(
+            latitude, longitude, radius_m, f"AND created_at >= ? AND {RECORDED_COVERAGE}", (time.time() - days * 86400,)
+        )
+        width = BUCKET_SECONDS[bucket]
+        buckets: Dict[int, List] = {}
+        for row in rows:
+            buckets.setdefault(int(row["created_at"] // width), []).append(row)
+        series = [
+            {
+                "start": index * width,
+                "records": len(members),
+                **{name: round(sum(row[name] for row in members) / len(members), 2) for name in CLASS_FIELDS},
+            }
+            for index, members in sorted(buckets.items())
+        ]
+        slope = None
+        if len({row["created_at"] for row in rows}) >= 2:
+            times = np.array([row["created_at"] for row in rows]) / SECONDS_PER_YEAR
+            values = np.array([row[metric] for row in rows])
+            slope = round(float(np.polyfit(times - times.mean(), values, 1)[0]), 3)
+        return {
+            "metric": metric,
+            "records": len(rows),
+            "buckets": series,
+            "change": round(series[-1][metric] - series[0][metric], 2) if series else None,
+            "slope_per_year": slope,
+        }
+
+    def drops(
+        self,
+        threshold: float,
+        days: float = 90.0,
+        metric: str = "vegetation_coverage",
+        relative: bool = False,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        limit: int = 100,
+    ) -> List[Dict]:
+        """
+        Sites whose metric fell by at least threshold between their first and latest record in the window.
+
+        Args:
+            threshold (float): Minimum drop, in percentage points (or percent of the first
+                value when relative is true).
+            days (float): How far back the window reaches.
+            metric (str): Coverage field to compare.
+            relative (bool): Compare relative instead of absolute change.
+            bbox (tuple): Optional (south, west, north, east) filter.
+            limit (int): Most sites to return, largest drops first.
+        """
+        if metric not in CLASS_FIELDS:
+            raise ValueError(f"Unknown metric '{metric}'. Supported metrics: {', '.join(CLASS_FIELDS)}")
+        where, params = f"created_at >= ? AND {RECORDED_COVERAGE}", [time.time() - days * 86400]
+        if bbox:
+            south, west, north, east = bbox
+            where += " AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?"
+            params += [south, north, west, east]
+        drop = "(first.value - last.value)"
+        if relative:
+            drop = f"{drop} * 100.0 / first.value"
+        rows = self._conn().execute(f"""
+            WITH ranked AS (
+                SELECT geohash, latitude, longitude, city, country, created_at, {metric} AS value,
+                       ROW_NUMBER() OVER (PARTITION BY geohash ORDER BY created_at) AS oldest,
+                       ROW_NUMBER() OVER (PARTITION BY geohash ORDER BY created_at DESC) AS newest,
+                       COUNT(*) OVER (PARTITION BY geohash) AS records
+                FROM location_history WHERE {where}
+            )
+            SELECT first.geohash, last.latitude, last.longitude, last.city, last.country, first.records,
+                   first.value AS before, last.value AS after, first.created_at AS since,
+                   last.created_at AS latest, {drop} AS dropped
+            FROM ranked AS first JOIN ranked AS last ON first.geohash = last.geohash
+            WHERE first.oldest = 1 AND last.newest = 1 AND first.records > 1
+              AND first.value > 0 AND {drop} >= ?
+            ORDER BY dropped DESC LIMIT ?
+        """, (*params, threshold, limit)).fetchall()
+        return [
+            {**{key: row[key] for key in row.keys() if key != "dropped"}, "drop": round(row["dropped"], 2)}
+            for row in rows
+        ]
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": HISTORY_ENABLED,
+            "reuse_seconds": self.reuse_seconds,
+            "recorded": self.recorded,
+            "reused": self.reused,
+        }
+
+
+_history = None
+
+
+def get_history() -> HistoryStore:
+    global _history
+    if _history is None:
+        _history = HistoryStore()
+    return _history
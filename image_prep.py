@@ -0,0 +1,203 @@
+import io
+import os
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+from metrics import timed
+
+# How images are re-encoded before they are sent to the vision model. Satellite tiles arrive
+# as lossless PNGs several times larger than a good JPEG of the same view; coverage is a
+# ratio of areas, so a lossy, smaller view barely changes the model's estimate.
+# VISION_FORMAT=original sends the bytes unchanged.
+VISION_FORMAT = os.getenv("VISION_FORMAT", "jpeg").lower()
+VISION_QUALITY = int(os.getenv("VISION_QUALITY", "85"))
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "640"))
+# "rgb" keeps all three bands, "gray" sends luminance only and "palette" an adaptive
+# VISION_PALETTE_COLORS-color PNG; the reduced views are smaller but lose color cues.
+VISION_VIEW = os.getenv("VISION_VIEW", "rgb").lower()
+VISION_PALETTE_COLORS = int(os.getenv("VISION_PALETTE_COLORS", "64"))
+# Optional byte budget per image; quality is lowered in steps (to VISION_MIN_QUALITY) until it fits.
+VISION_TARGET_KB = float(os.getenv("VISION_TARGET_KB", "0"))
+VISION_MIN_QUALITY = int(os.getenv("VISION_MIN_QUALITY", "50"))
+
+VISION_FORMATS = ("original", "jpeg", "webp")
+VISION_VIEWS = ("rgb", "gray", "palette")
+QUALITY_STEP = 10
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+
+@dataclass
+class VisionImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    quality: Optional[int] = None
+
+
+@dataclass
+class PrepOptions:
+    format: str = VISION_FORMAT
+    quality: int = VISION_QUALITY
+    max_side: int = VISION_MAX_SIDE
+    view: str = VISION_VIEW
+    palette_colors: int = VISION_PALETTE_COLORS
+    target_kb: float = VISION_TARGET_KB
+    min_quality: int = VISION_MIN_QUALITY
+
+    def validate(self):
+        if self.format not in VISION_FORMATS:
+            raise ValueError(f"Unknown vision format '{self.format}'. Supported formats: {', '.join(VISION_FORMATS)}")
+        if self.view not in VISION_VIEWS:
+            raise ValueError(f"Unknown vision view '{self.view}'. Supported views: {', '.join(VISION_VIEWS)}")
+
+    @property
+    def version(self) -> str:
+        """Identifies the view the model sees, so estimates made from a different view are not reused."""
+        if self.format == "original":
+            return "original"
+        settings = f"{self.format}:{self.quality}:{self.max_side}:{self.view}:{self.palette_colors}:{self.target_kb}"
+        return hashlib.sha256(settings.encode()).hexdigest()[:12]
+
+
+_lock = threading.Lock()
+_stats = {"images": 0, "passed_through": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def _record(original_bytes: int, sent_bytes: int, passed_through: bool):
+    with _lock:
+        _stats["images"] += 1
+        _stats["passed_through"] += passed_through
+        _stats["bytes_in"] += original_bytes
+        _stats["bytes_out"] += sent_bytes
+
+
+def _reduce_view(image: Image.Image, options: PrepOptions) -> Image.Image:
+    if options.view == "gray":
+        return image.convert("L")
+    if options.view == "palette":
+        return image.quantize(colors=options.palette_colors, method=Image.Quantize.MEDIANCUT)
+    return image
+
+
+def _encode(image: Image.Image, options: PrepOptions, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if options.view == "palette":
+        # A palette image is only compact as PNG; JPEG and WebP would expand it back to RGB.
+        image.save(buffer, format="PNG", optimize=True)
+    elif options.format == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def fit_image(image: Image.Image, max_side: int) -> Image.Image:
+    """
+    Decodes an opened image to RGB no larger than max_side, rotated per EXIF.
+
+    JPEGs are decoded at a reduced DCT scale where possible. Shared by the upload and
+    vision preparation so each image is decoded once.
+    """
+    if image.format == "JPEG":
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full resolution.
+        image.draft("RGB", (max_side, max_side))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    return image
+
+
+def vision_from_image(
+    image: Image.Image, data: bytes, mime_type: str, options: Optional[PrepOptions] = None
+) -> VisionImage:
+    """
+    Encodes already decoded RGB pixels for the vision model.
+
+    image may be larger than options.max_side (it is downscaled, on a copy) but must come
+    from data, which is sent unchanged if the encoded view is not smaller.
+    """
+    options = options or PrepOptions()
+    options.validate()
+    original = VisionImage(data, mime_type, image.width, image.height, len(data))
+    if options.format == "original":
+        _record(len(data), len(data), passed_through=True)
+        return original
+
+    try:
+        if max(image.size) > options.max_side:
+            image = image.copy()
+            image.thumbnail((options.max_side, options.max_side), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        image = _reduce_view(image, options)
+
+        quality = options.quality
+        encoded = _encode(image, options, quality)
+        budget = options.target_kb * 1024
+        while budget and len(encoded) > budget and options.view != "palette" and quality > options.min_quality:
+            quality = max(quality - QUALITY_STEP, options.min_quality)
+            encoded = _encode(image, options, quality)
+    except Exception as e:
+        print(f"Vision preprocessing failed, sending the original image: {e}")
+        _record(len(data), len(data), passed_through=True)
+        return original
+
+    if len(encoded) >= len(data):
+        _record(len(data), len(data), passed_through=True)
+        return original
+    _record(len(data), len(encoded), passed_through=False)
+    out_format = "png" if options.view == "palette" else options.format
+    return VisionImage(
+        encoded, MIME_TYPES[out_format], image.width, image.height, len(data),
+        quality=None if out_format == "png" else quality,
+    )
+
+
+@timed("prepare_vision_image")
+def prepare_for_vision(data: bytes, mime_type: str, options: Optional[PrepOptions] = None) -> VisionImage:
+    """
+    Downscales and re-encodes an image for the vision model, all in memory.
+
+    The image is decoded once, reduced to options.max_side, optionally reduced to fewer
+    bands, and encoded at options.quality; with a byte target, quality is lowered in
+    steps until the image fits or reaches min_quality. If the result is not smaller than
+    the input, or the input cannot be decoded, the original bytes are sent unchanged.
+    Uploads are decoded by uploads.prepare_image instead, which calls vision_from_image
+    with the pixels it already has.
+
+    Args:
+        data (bytes): Encoded image.
+        mime_type (str): MIME type of data.
+        options (PrepOptions): Encoding settings; defaults to the VISION_* environment settings.
+
+    Returns:
+        VisionImage: The bytes and MIME type to send.
+
+    Raises:
+        ValueError: If the format or view is not supported.
+    """
+    options = options or PrepOptions()
+    options.validate()
+    if options.format == "original":
+        _record(len(data), len(data), passed_through=True)
+        return VisionImage(data, mime_type, 0, 0, len(data))
+    try:
+        image = fit_image(Image.open(io.BytesIO(data)), options.max_side)
+    except Exception as e:
+        print(f"Vision preprocessing failed, sending the original image: {e}")
+        _record(len(data), len(data), passed_through=True)
+        return VisionImage(data, mime_type, 0, 0, len(data))
+    return vision_from_image(image, data, mime_type, options)
+
+
+def prep_stats() -> Dict:
+    with _lock:
+        stats = dict(_stats)
+    return {
+        **stats,
+        "saved_ratio": round(1 - stats["bytes_out"] / stats["bytes_in"], 4) if stats["bytes_in"] else 0.0,
+    }
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+from typing import Dict, List, Optional
+
+from executor import run_blocking
+from pipeline import analyze_location_pipeline
+from storage import get_connection
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# A running job's claim is renewed while it runs; if its process dies, any process may
+# take the job over once the lease has expired.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Idle workers look for jobs queued by other processes (or with expired leases) this often.
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+
+UNFINISHED = "status = 'queued' OR (status = 'running' AND COALESCE(lease_until, 0) < ?)"
+# Jobs that count against max_pending: queued, or running under a live lease. A running
+# job whose worker died stops counting when its lease expires, so it cannot shrink the queue.
+PENDING = "status = 'queued' OR (status = 'running' AND COALESCE(lease_until, 0) >= ?)"
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobQueue:
+    """
+    Background queue for location analyses, persisted in SQLite.
+
+    Submitting a job stores it as 'queued' and returns its id immediately; a pool of
+    worker tasks runs the pipeline and records the result and stage timings. Workers
+    claim jobs from the table atomically with a lease that they renew while the job
+    runs, so any number of processes can share the database: each job runs once, and a
+    job whose process died is taken over when its lease expires. max_pending bounds
+    the queued and running jobs across all processes.
+    """
+
+    def __init__(
+        self,
+        workers: int = JOB_WORKERS,
+        max_pending: int = JOB_QUEUE_SIZE,
+        db_path: Optional[str] = None,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        poll_seconds: float = JOB_POLL_SECONDS,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._schema_ready = False
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if not self._schema_ready:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    timings TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+            """)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+            self._schema_ready = True
+        return conn
+
+    def _insert(self, job_id: str, kind: str, params: Dict) -> bool:
+        """Inserts a queued job unless max_pending jobs are pending; one statement, so it is atomic."""
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO jobs(id, kind, status, params, created_at) SELECT ?, ?, 'queued', ?, ? "
+            f"WHERE (SELECT COUNT(*) FROM jobs WHERE {PENDING}) < ?",
+            (job_id, kind, json.dumps(params), now, now, self.max_pending),
+        )
+        return cursor.rowcount == 1
+
+    def _claim(self) -> Optional[Dict]:
+        """Marks the oldest queued (or abandoned) job as running under this owner and returns it."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE {UNFINISHED} ORDER BY created_at LIMIT 1", (now,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, started_at = ? WHERE id = ?",
+                    (self.owner, now + self.lease_seconds, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self._decode(row) if row is not None else None
+
+    def _renew(self, job_id: str):
+        self._conn().execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? AND status = 'running'",
+            (time.time() + self.lease_seconds, job_id, self.owner),
+        )
+
+    def _release(self, job_id: str):
+        """Puts a job this process stopped running back in the queue."""
+        self._conn().execute(
+            "UPDATE jobs SET status = 'queued', owner = NULL, lease_until = NULL, started_at = NULL "
+            "WHERE id = ? AND owner = ? AND status = 'running'",
+            (job_id, self.owner),
+        )
+
+    def _finish(self, job_id: str, **fields):
+        """Records a job's outcome, unless another process has taken the job over meanwhile."""
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._conn().execute(
+            f"UPDATE jobs SET {assignments}, lease_until = NULL WHERE id = ? AND owner = ?",
+            (*fields.values(), job_id, self.owner),
+        )
+
+    def _drop_excess(self) -> int:
+        """Fails the newest queued jobs beyond max_pending (left over from before a restart)."""
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = 'failed', error = 'Dropped: the job queue was full after a restart.', "
+            "finished_at = ? WHERE id IN (SELECT id FROM jobs WHERE status = 'queued' "
+            f"ORDER BY created_at LIMIT -1 OFFSET MAX(? - (SELECT COUNT(*) FROM jobs WHERE status = 'running' "
+            "AND COALESCE(lease_until, 0) >= ?), 0))",
+            (now, self.max_pending, now),
+        )
+        return cursor.rowcount
+
+    @staticmethod
+    def _decode(row) -> Dict:
+        job = dict(row)
+        for name in ("params", "result", "timings"):
+            job[name] = json.loads(job[name]) if job[name] else None
+        return job
+
+    def _load(self, job_id: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        dropped = await run_blocking(self._drop_excess)
+        if dropped:
+            print(f"Dropped {dropped} queued jobs over the {self.max_pending}-job limit.")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, params: Dict, kind: str = "analyze-location") -> str:
+        """
+        Queues an analysis and returns its job id.
+
+        Raises:
+            QueueFull: If max_pending jobs are already waiting or running.
+        """
+        if self._wakeup is None:
+            raise RuntimeError("Job queue has not been started.")
+        job_id = uuid.uuid4().hex
+        if not await run_blocking(self._insert, job_id, kind, params):
+            raise QueueFull(f"Job queue is full ({self.max_pending} pending jobs).")
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await run_blocking(self._load, job_id)
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await run_blocking(self._renew, job_id)
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            job = await run_blocking(self._claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                # Shutting down: hand the job back so this or another process runs it. Shielded,
+                # so a second cancellation cannot interrupt the write.
+                await asyncio.shield(run_blocking(self._release, job["id"]))
+                raise
+            except Exception as e:
+                await run_blocking(self._finish, job["id"], status="failed", error=str(e), finished_at=time.time())
+            finally:
+                heartbeat.cancel()
+
+    async def _run(self, job: Dict):
+        result = await analyze_location_pipeline(**job["params"])
+        await run_blocking(
+            self._finish,
+            job["id"],
+            status="succeeded" if result["status"] == "success" else "failed",
+            result=json.dumps(result, default=str),
+            error=None if result["status"] == "success" else result.get("message"),
+            timings=json.dumps(result.get("timings")),
+            finished_at=time.time(),
+        )
+
+    def stats(self) -> Dict:
+        counts = {
+            row["status"]: row["count"]
+            for row in self._conn().execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")
+        }
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": counts.get("queued", 0) + counts.get("running", 0),
+            "by_status": counts,
+        }
+
+
+_job_queue = None
+
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
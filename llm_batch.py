@@ -0,0 +1,125 @@
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+# Off by default: every coverage and recommendation prompt is sent on its own. When on,
+# prompts arriving within the window are combined into one Gemini call of up to max items.
+LLM_BATCHING = os.getenv("LLM_BATCHING", "0").lower() in ("1", "true", "yes")
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "25"))
+LLM_BATCH_MAX_ITEMS = int(os.getenv("LLM_BATCH_MAX_ITEMS", "8"))
+
+
+class MicroBatcher:
+    """
+    Collects items submitted within window_seconds, up to max_items, and sends them as one call.
+
+    send_batch(items) returns one result per item, in order, with None for any item the
+    combined response did not answer; those items are sent again on their own with
+    send_one. If the combined call raises, every caller in the batch gets the exception.
+    A window that closes with a single item sends it with send_one, so under light load
+    the prompt is exactly the unbatched one.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        send_batch: Callable[[List[Any]], Awaitable[Sequence[Optional[Any]]]],
+        send_one: Callable[[Any], Awaitable[Any]],
+        window_seconds: float = LLM_BATCH_WINDOW_MS / 1000,
+        max_items: int = LLM_BATCH_MAX_ITEMS,
+    ):
+        self.name = name
+        self.send_batch = send_batch
+        self.send_one = send_one
+        self.window_seconds = window_seconds
+        self.max_items = max(max_items, 1)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats = {
+            "items": 0, "calls": 0, "batched_calls": 0, "batched_items": 0, "resent_items": 0, "largest_batch": 0,
+        }
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Pending items and timers belong to one event loop (e.g. a script calling asyncio.run twice).
+            self._loop, self._pending, self._timer = loop, [], None
+        future = loop.create_future()
+        self._pending.append((item, future))
+        self._stats["items"] += 1
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = self._loop.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send_single(self, item: Any, future: asyncio.Future):
+        self._stats["calls"] += 1
+        try:
+            result = await self.send_one(item)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    async def _send(self, batch: List[Tuple[Any, asyncio.Future]]):
+        # If sending is cancelled (or fails with another BaseException) no caller may wait forever.
+        try:
+            await self._send_batch(batch)
+        finally:
+            for _, future in batch:
+                if not future.done():
+                    future.cancel()
+
+    async def _send_batch(self, batch: List[Tuple[Any, asyncio.Future]]):
+        if len(batch) == 1:
+            await self._send_single(*batch[0])
+            return
+
+        self._stats["calls"] += 1
+        self._stats["batched_calls"] += 1
+        self._stats["batched_items"] += len(batch)
+        self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+        try:
+            results = list(await self.send_batch([item for item, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # A short result list leaves the rest unanswered rather than unresolved.
+        results += [None] * (len(batch) - len(results))
+        unanswered = []
+        for (item, future), result in zip(batch, results):
+            if result is None:
+                unanswered.append((item, future))
+            elif not future.done():
+                future.set_result(result)
+        if unanswered:
+            self._stats["resent_items"] += len(unanswered)
+            await asyncio.gather(*(self._send_single(item, future) for item, future in unanswered))
+
+    def stats(self) -> Dict:
+        calls = self._stats["calls"]
+        return {
+            "enabled": LLM_BATCHING,
+            "window_ms": round(self.window_seconds * 1000, 1),
+            "max_items": self.max_items,
+            **self._stats,
+            "items_per_call": round(self._stats["items"] / calls, 3) if calls else 0.0,
+        }
@@ -0,0 +1,279 @@
+import io
+import os
+import hashlib
+import logging
+import mimetypes
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+from metrics import timed
+
+# Directory /get-image serves from; names are resolved inside it and nowhere else.
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "files")
+# Resized and re-encoded variants are written here, keyed by the source file's path,
+# size and modification time, so a rewritten tile never gets a stale variant.
+MEDIA_VARIANT_DIR = os.getenv("MEDIA_VARIANT_DIR", "cache/media")
+MEDIA_VARIANT_MAX_MB = float(os.getenv("MEDIA_VARIANT_MAX_MB", "64"))
+# Requested widths are rounded up to one of these so the number of variants per image is bounded.
+MEDIA_WIDTHS = tuple(sorted(int(w) for w in os.getenv("MEDIA_WIDTHS", "128,256,512,1024").split(",") if w.strip()))
+MEDIA_WEBP_QUALITY = int(os.getenv("MEDIA_WEBP_QUALITY", "80"))
+# Cache-Control max-age for images; clients revalidate with If-None-Match afterwards.
+MEDIA_MAX_AGE = int(os.getenv("MEDIA_MAX_AGE", "86400"))
+
+MEDIA_FORMATS = ("auto", "original", "webp")
+RESIZABLE_TYPES = ("image/png", "image/jpeg", "image/webp")
+PRUNE_TARGET = 0.8
+
+logger = logging.getLogger(__name__)
+
+
+class MediaError(Exception):
+    """A media request the API refuses, with the HTTP status to report."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def resolve_media(name: str, root: str = MEDIA_ROOT) -> str:
+    """
+    Resolves a name to a file inside root.
+
+    Names may be relative to root ("tiles/abc.png") or carry the root prefix the API
+    returns in file_path ("files/tiles/abc.png").
+
+    Raises:
+        MediaError: If the name leaves root (400) or no such file exists (404).
+    """
+    root = os.path.realpath(root)
+    prefix = os.path.basename(root) + "/"
+    if name.startswith(prefix):
+        name = name[len(prefix):]
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root:
+        raise MediaError("Invalid file path.", 400)
+    if not os.path.isfile(path):
+        raise MediaError("Image not found.", 404)
+    return path
+
+
+def snap_width(width: Optional[int]) -> Optional[int]:
+    """Rounds a requested width up to the nearest configured size (None keeps the full size)."""
+    if not width:
+        return None
+    if width < 0:
+        raise MediaError("w must be positive.", 400)
+    for size in MEDIA_WIDTHS:
+        if size >= width:
+            return size
+    return None
+
+
+def choose_format(requested: str, accept: str, media_type: str) -> str:
+    """The format to send: "webp" when asked for or, with "auto", when the client accepts it."""
+    if requested not in MEDIA_FORMATS:
+        raise MediaError(f"Unknown format '{requested}'. Supported formats: {', '.join(MEDIA_FORMATS)}", 400)
+    if media_type not in RESIZABLE_TYPES or requested == "original":
+        return "original"
+    if requested == "webp" or "image/webp" in accept:
+        return "webp"
+    return "original"
+
+
+def is_not_modified(response_headers, request_headers: Headers) -> bool:
+    """Whether the request's validators match, so a 304 can be sent instead of the body."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110, 13.1.3).
+        etag = response_headers.get("etag", "").strip(" W/")
+        return if_none_match.strip() == "*" or etag in [tag.strip(" W/") for tag in if_none_match.split(",")]
+    if_modified_since = request_headers.get("if-modified-since")
+    last_modified = response_headers.get("last-modified")
+    if if_modified_since and last_modified:
+        since, modified = parsedate(if_modified_since), parsedate(last_modified)
+        return since is not None and modified is not None and since >= modified
+    return False
+
+
+def _cache_headers(response: Response, vary: bool = False):
+    response.headers["Cache-Control"] = f"public, max-age={MEDIA_MAX_AGE}"
+    if vary:
+        response.headers["Vary"] = "Accept"
+
+
+def _not_modified(response: Response) -> Response:
+    headers = {
+        key: value for key, value in response.headers.items()
+        if key in ("etag", "last-modified", "cache-control", "vary")
+    }
+    return Response(status_code=304, headers=headers)
+
+
+class VariantCache:
+    """
+    Disk cache of resized and WebP copies of served images.
+
+    A variant is generated on first request, written atomically and then served as a
+    plain file; concurrent requests for the same variant wait for one encode. The
+    directory is kept under max_bytes by removing the least recently written files.
+    """
+
+    def __init__(self, directory: str = MEDIA_VARIANT_DIR, max_bytes: int = int(MEDIA_VARIANT_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.generated = 0
+        self.bytes_saved = 0
+        self._bytes: Optional[int] = None
+        self._lock = threading.Lock()
+        # Per-variant lock and the number of requests holding or waiting for it.
+        self._key_locks: Dict[str, List] = {}
+
+    def _key(self, path: str, width: Optional[int], fmt: str) -> str:
+        stat = os.stat(path)
+        settings = f"{path}:{stat.st_size}:{stat.st_mtime_ns}:{width}:{fmt}:{MEDIA_WEBP_QUALITY}"
+        return hashlib.sha256(settings.encode()).hexdigest()[:32]
+
+    @contextmanager
+    def _key_lock(self, key: str):
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            # Dropped only by the last user, so a waiter never ends up on a different lock.
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def get(self, path: str, width: Optional[int], fmt: str) -> Tuple[str, str]:
+        """
+        Returns the file to send and its media type, generating the variant if needed.
+
+        The source file itself is returned when no variant is asked for, when the variant
+        would not be smaller, or when the image cannot be decoded.
+        """
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if width is None and fmt == "original":
+            return path, media_type
+        key = self._key(path, width, fmt)
+        variant = os.path.join(self.directory, key + (".webp" if fmt == "webp" else os.path.splitext(path)[1]))
+        try:
+            with self._key_lock(key):
+                if os.path.isfile(variant):
+                    with self._lock:
+                        self.hits += 1
+                else:
+                    self._generate(path, variant, width, fmt)
+                # Under the key lock; a prune from another request may still remove it (OSError below).
+                size = os.path.getsize(variant)
+        except Exception as e:
+            logger.warning("Could not generate a variant of %s, serving the original: %s", path, e)
+            return path, media_type
+        if size == 0:
+            # Empty marker: no variant is smaller than the original.
+            return path, media_type
+        return variant, "image/webp" if fmt == "webp" else media_type
+
+    @timed("generate_media_variant")
+    def _generate(self, path: str, variant: str, width: Optional[int], fmt: str):
+        with Image.open(path) as source:
+            source_format = source.format or "PNG"
+            # Palette images would be resized with nearest-neighbour; expand them first.
+            image = source.convert("RGBA" if "transparency" in source.info else "RGB") if source.mode == "P" else source
+            image.load()
+            if width and image.width > width:
+                image.thumbnail((width, image.height), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            if fmt == "webp":
+                image.save(buffer, format="WEBP", quality=MEDIA_WEBP_QUALITY, method=4)
+            else:
+                image.save(buffer, format=source_format, optimize=True)
+        data = buffer.getvalue()
+        original_size = os.path.getsize(path)
+        if len(data) >= original_size:
+            data = b""
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{variant}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, variant)
+        with self._lock:
+            self.generated += 1
+            self.bytes_saved += original_size - len(data) if data else 0
+            if self._bytes is not None:
+                self._bytes += len(data)
+        self._prune()
+
+    def _prune(self):
+        with self._lock:
+            if self._bytes is not None and self._bytes <= self.max_bytes:
+                return
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            for _, size, entry_path in sorted(entries):
+                if total <= self.max_bytes * PRUNE_TARGET:
+                    break
+                try:
+                    os.remove(entry_path)
+                    total -= size
+                except OSError:
+                    pass
+        with self._lock:
+            self._bytes = total
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "generated": self.generated,
+                "bytes_saved": self.bytes_saved,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_variant_cache = None
+
+
+def get_variant_cache() -> VariantCache:
+    global _variant_cache
+    if _variant_cache is None:
+        _variant_cache = VariantCache()
+    return _variant_cache
+
+
+def file_response(path: str, media_type: str, request_headers: Headers, vary: bool = False) -> Response:
+    """
+    A FileResponse with ETag, Last-Modified and Cache-Control, or a 304 when the client's copy is current.
+
+    Range and If-Range requests are answered by FileResponse itself with 206 partial content.
+    """
+    response = FileResponse(path, media_type=media_type, stat_result=os.stat(path))
+    _cache_headers(response, vary)
+    if is_not_modified(response.headers, request_headers):
+        return _not_modified(response)
+    return response
+
+
+class MediaFiles(StaticFiles):
+    """StaticFiles that also sends Cache-Control, so browsers stop re-downloading map tiles."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        _cache_headers(response)
+        return response
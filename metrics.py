@@ -0,0 +1,199 @@
+import time
+import inspect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Latency buckets in seconds; upstream calls range from cache hits (~ms) to LLM calls (~10 s).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[LabelKey, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {bucket_count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+STAGE_DURATION = Histogram(
+    "greenery_stage_duration_seconds", "Duration of instrumented upstream calls and pipeline stages."
+)
+STAGE_ERRORS = Counter("greenery_stage_errors_total", "Instrumented calls that raised or returned an error.")
+UPSTREAM_BYTES = Counter("greenery_upstream_bytes_total", "Bytes exchanged with upstream providers.")
+UPSTREAM_CALLS = Counter(
+    "greenery_upstream_calls_total", "Upstream call attempts by provider and outcome (see resilience.py)."
+)
+HTTP_DURATION = Histogram("greenery_http_request_duration_seconds", "HTTP request latency by route.")
+
+_collectors: List[Tuple[str, Callable[[], Dict]]] = []
+
+# Spans recorded for the current request when debug tracing is enabled.
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("greenery_trace", default=None)
+
+
+def register_collector(prefix: str, stats_fn: Callable[[], Dict]):
+    """Exposes the numeric fields of a stats() dict as greenery_<prefix>_<field> gauges."""
+    _collectors.append((prefix, stats_fn))
+
+
+def record_stage(stage: str, seconds: float, error: bool = False):
+    STAGE_DURATION.observe(seconds, stage=stage)
+    if error:
+        STAGE_ERRORS.inc(stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append({"stage": stage, "duration_ms": round(seconds * 1000, 1), "error": error})
+
+
+def record_bytes(provider: str, direction: str, amount: int):
+    if amount:
+        UPSTREAM_BYTES.inc(amount, provider=provider, direction=direction)
+
+
+def _is_error_result(result, none_is_error: bool) -> bool:
+    if result is None:
+        return none_is_error
+    return isinstance(result, dict) and result.get("status") == "error"
+
+
+def timed(stage: str, none_is_error: bool = False):
+    """
+    Decorator recording the duration and errors of a sync or async function.
+
+    A call counts as an error if it raises, returns a dict with status "error", or
+    (with none_is_error) returns None.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                error = True
+                try:
+                    result = await func(*args, **kwargs)
+                    error = _is_error_result(result, none_is_error)
+                    return result
+                finally:
+                    record_stage(stage, time.perf_counter() - started, error)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            error = True
+            try:
+                result = func(*args, **kwargs)
+                error = _is_error_result(result, none_is_error)
+                return result
+            finally:
+                record_stage(stage, time.perf_counter() - started, error)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def trace_request(enabled: bool = True):
+    """Collects the spans recorded inside the block (including child tasks) into a list."""
+    if not enabled:
+        yield None
+        return
+    spans: List[Dict] = []
+    token = _current_trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _current_trace.reset(token)
+
+
+def _render_collectors() -> List[str]:
+    lines = []
+    for prefix, stats_fn in _collectors:
+        try:
+            stats = stats_fn()
+        except Exception as e:
+            print(f"Error collecting {prefix} metrics: {e}")
+            continue
+        for field, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"greenery_{prefix}_{field}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+    return lines
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in (STAGE_DURATION, STAGE_ERRORS, UPSTREAM_BYTES, UPSTREAM_CALLS, HTTP_DURATION):
+        lines.extend(metric.render())
+    lines.extend(_render_collectors())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,455 @@
+import time
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional
+
+from step0 import download_static_map_async
+from step1 import COVERAGE_BACKEND, generate_coverage_details_async, generate_coverage_details_from_data_async
+from executor import run_blocking
+from uploads import UploadError, prepare_image
+from metrics import record_stage, trace_request
+from history import HISTORY_ENABLED, get_history
+from coverage_engine import CLASS_FIELDS
+from coverage_grid import get_coverage_grid
+from region import REGION_BACKENDS, REGION_TILE_SIZE, centered_cell
+from step2 import get_plant_system, compose_final_report_async, stream_final_report_async
+
+
+class StageFailed(Exception):
+    """Raised by a stage to stop the pipeline with a user-facing message."""
+
+
+class StageScheduler:
+    """
+    Runs async stages as soon as their dependencies have finished.
+
+    Each stage is registered with the names of the stages it depends on and is called
+    with their results as keyword arguments. Independent stages run concurrently; if any
+    stage raises, the remaining ones are cancelled and the error is re-raised from run().
+    """
+
+    def __init__(self):
+        self._stages: Dict[str, tuple] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self._origin = 0.0
+
+    def add(self, name: str, func: Callable[..., Awaitable[Any]], depends_on: Iterable[str] = ()):
+        depends_on = tuple(depends_on)
+        for dep in depends_on:
+            if dep not in self._stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'.")
+        self._stages[name] = (func, depends_on)
+
+    async def _run_stage(self, name: str, tasks: Dict[str, asyncio.Task]):
+        func, depends_on = self._stages[name]
+        dep_results = await asyncio.gather(*(tasks[dep] for dep in depends_on))
+        started = time.perf_counter()
+        try:
+            result = await func(**dict(zip(depends_on, dep_results)))
+        except BaseException:
+            record_stage(f"pipeline_{name}", time.perf_counter() - started, error=True)
+            raise
+        finally:
+            finished = time.perf_counter()
+            self.timings[name] = {
+                "start_ms": round((started - self._origin) * 1000, 1),
+                "duration_ms": round((finished - started) * 1000, 1),
+            }
+        record_stage(f"pipeline_{name}", finished - started)
+        self.results[name] = result
+        return result
+
+    async def run(self) -> Dict[str, Any]:
+        self._origin = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+        # Stages are registered after their dependencies, so creating tasks in order is safe.
+        for name in self._stages:
+            tasks[name] = asyncio.create_task(self._run_stage(name, tasks))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            self.timings["total"] = {
+                "start_ms": 0.0,
+                "duration_ms": round((time.perf_counter() - self._origin) * 1000, 1),
+            }
+        return self.results
+
+
+# Size of the maps the location pipelines fetch (download_static_map_async's default).
+MAP_SIZE = "640x640"
+
+
+async def default_fetch_weather(city: str):
+    return await get_plant_system().weather_service.get_weather_data_async(city)
+
+
+async def _record_history(
+    city: str, country: str, latitude: float, longitude: float, zoom: int,
+    coverage_backend: Optional[str], result: Dict, results: Dict[str, Any],
+):
+    """Adds a successful result to the history store; a history failure never fails the request."""
+    if not HISTORY_ENABLED:
+        return
+    reusable = not results["static_map"].get("stale") and not results["coverage"].get("fallback")
+    try:
+        await run_blocking(
+            get_history().record, latitude, longitude, zoom, city, country,
+            coverage_backend or COVERAGE_BACKEND, result, reusable, results["coverage"].get("caption"),
+        )
+    except Exception as e:
+        print(f"Could not record history for {city}: {e}")
+
+
+async def _record_grid(latitude: float, longitude: float, zoom: int, results: Dict[str, Any]):
+    """
+    Stores the coverage of an analyzed point as its grid cell's result.
+
+    Only a map centered on a cell (within a few pixels, e.g. a request for a heatmap
+    cell's center) covers that cell's area; a map around any other point would replace
+    an accurate cell-aligned result, so nothing is stored for it.
+    """
+    coverage = results["coverage"]
+    caption = coverage.get("caption") or {}
+    if (
+        coverage.get("backend") not in REGION_BACKENDS or coverage.get("fallback")
+        or results["static_map"].get("stale") or REGION_TILE_SIZE != MAP_SIZE
+        or not all(isinstance(caption.get(name), (int, float)) for name in CLASS_FIELDS)
+    ):
+        return
+    try:
+        cell = centered_cell(latitude, longitude, zoom, MAP_SIZE)
+        if cell is None:
+            return
+        await run_blocking(get_coverage_grid().put_cells, zoom, MAP_SIZE, coverage["backend"], {
+            cell: {name: caption[name] for name in CLASS_FIELDS},
+        })
+    except Exception as e:
+        print(f"Could not record the coverage grid cell at {latitude}, {longitude}: {e}")
+
+
+async def _reuse_history(
+    city: str, country: str, latitude: float, longitude: float, zoom: int, coverage_backend: Optional[str]
+) -> Optional[Dict]:
+    if not HISTORY_ENABLED:
+        return None
+    try:
+        stored = await run_blocking(
+            get_history().recent, latitude, longitude, zoom, city, country, coverage_backend or COVERAGE_BACKEND
+        )
+    except Exception as e:
+        print(f"Could not read history for {city}: {e}")
+        return None
+    if stored is None:
+        return None
+    recorded_at = stored.pop("recorded_at")
+    return {**stored, "history": {"reused": True, "recorded_at": recorded_at}, "timings": {}}
+
+
+async def analyze_location_pipeline(
+    city: str,
+    country: str,
+    latitude: float,
+    longitude: float,
+    zoom: int = 18,
+    coverage_backend: Optional[str] = None,
+    fetch_map: Optional[Callable[..., Awaitable[Dict]]] = None,
+    fetch_weather: Optional[Callable[..., Awaitable[Any]]] = None,
+    fetch_coverage: Optional[Callable[..., Awaitable[Dict]]] = None,
+    debug: bool = False,
+) -> Dict:
+    """
+    Runs the location analysis as a stage graph without blocking the event loop.
+
+    The weather lookup starts alongside the map download and captioning, and is joined
+    with the coverage result before the recommendation prompt is sent.
+
+    Args:
+        city (str): City used for the weather lookup.
+        country (str): Country used for season detection.
+        latitude (float): Latitude of the location.
+        longitude (float): Longitude of the location.
+        zoom (int): Zoom level for the static map.
+        coverage_backend (str): "llm", "local" or "crosscheck". Defaults to COVERAGE_BACKEND.
+        fetch_map, fetch_weather, fetch_coverage (callable): Optional replacements for the
+            upstream calls, e.g. memoized versions shared across a batch.
+        debug (bool): Include every instrumented call made for this request under "debug".
+
+    A successful result is recorded in the history store, and a repeat request for the
+    same point and settings within HISTORY_REUSE_SECONDS is answered from it (marked with
+    "history") without running any stage; debug requests always run.
+
+    Returns:
+        dict: Result with status, message, file_path, final_report and per-stage timings.
+    """
+    if not debug:
+        stored = await _reuse_history(city, country, latitude, longitude, zoom, coverage_backend)
+        if stored is not None:
+            return stored
+    fetch_map = fetch_map or download_static_map_async
+    fetch_weather = fetch_weather or default_fetch_weather
+    fetch_coverage = fetch_coverage or generate_coverage_details_async
+    scheduler = StageScheduler()
+
+    async def map_stage():
+        map_result = await fetch_map(latitude, longitude, zoom=zoom)
+        if map_result["status"] == "error":
+            raise StageFailed(map_result["message"])
+        return map_result
+
+    async def weather_stage():
+        return await fetch_weather(city)
+
+    async def coverage_stage(static_map):
+        coverage_details = await fetch_coverage(static_map["file_path"], backend=coverage_backend)
+        if coverage_details["status"] == "error":
+            raise StageFailed(coverage_details["message"])
+        return coverage_details
+
+    async def report_stage(coverage, weather):
+        return await compose_final_report_async(
+            coverage["caption"], weather, city, country, latitude, longitude
+        )
+
+    scheduler.add("static_map", map_stage)
+    scheduler.add("weather", weather_stage)
+    scheduler.add("coverage", coverage_stage, depends_on=["static_map"])
+    scheduler.add("report", report_stage, depends_on=["coverage", "weather"])
+
+    with trace_request(debug) as spans:
+        try:
+            results = await scheduler.run()
+        except Exception as e:
+            map_result: Optional[Dict] = scheduler.results.get("static_map")
+            error = {
+                "status": "error",
+                "message": str(e),
+                "file_path": map_result["file_path"] if map_result else None,
+                "timings": scheduler.timings,
+            }
+            if debug:
+                error["debug"] = {"spans": spans}
+            return error
+
+    result = {
+        "status": "success",
+        "message": "Location analyzed successfully.",
+        "file_path": results["static_map"]["file_path"],
+        "final_report": results["report"],
+        "coverage_backend": results["coverage"]["backend"],
+        "timings": scheduler.timings,
+    }
+    if "crosscheck" in results["coverage"]:
+        result["coverage_crosscheck"] = results["coverage"]["crosscheck"]
+    await _record_history(city, country, latitude, longitude, zoom, coverage_backend, result, results)
+    await _record_grid(latitude, longitude, zoom, results)
+    if debug:
+        result["debug"] = {
+            "spans": spans,
+            "cached": {
+                "static_map": results["static_map"].get("cached", False),
+                "coverage": results["coverage"].get("cached", False),
+                "report": (results["report"] or {}).get("cached", False),
+            },
+        }
+    return result
+
+
+async def stream_location_pipeline(
+    city: str,
+    country: str,
+    latitude: float,
+    longitude: float,
+    zoom: int = 18,
+    coverage_backend: Optional[str] = None,
+) -> AsyncIterator[Dict]:
+    """
+    Runs the same stage graph as analyze_location_pipeline, yielding events as results arrive.
+
+    Events are {"event": name, "data": ...} with names "weather", "static_map",
+    "coverage", "season", one "plant" per recommendation as the model generates it,
+    and a final "done" carrying the full result (status, final_report, timings) in the
+    shape analyze_location_pipeline returns.
+    """
+    scheduler = StageScheduler()
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def map_stage():
+        map_result = await download_static_map_async(latitude, longitude, zoom=zoom)
+        if map_result["status"] == "error":
+            raise StageFailed(map_result["message"])
+        events.put_nowait({"event": "static_map", "data": {
+            "file_path": map_result["file_path"], "cached": map_result.get("cached", False),
+        }})
+        return map_result
+
+    async def weather_stage():
+        weather = await default_fetch_weather(city)
+        events.put_nowait({"event": "weather", "data": weather.__dict__ if weather else None})
+        return weather
+
+    async def coverage_stage(static_map):
+        coverage_details = await generate_coverage_details_async(static_map["file_path"], backend=coverage_backend)
+        if coverage_details["status"] == "error":
+            raise StageFailed(coverage_details["message"])
+        events.put_nowait({"event": "coverage", "data": coverage_details["caption"]})
+        return coverage_details
+
+    async def report_stage(coverage, weather):
+        report = None
+        async for event in stream_final_report_async(
+            coverage["caption"], weather, city, country, latitude, longitude
+        ):
+            if event["event"] == "report":
+                report = event["data"]
+            else:
+                events.put_nowait(event)
+        return report
+
+    scheduler.add("static_map", map_stage)
+    scheduler.add("weather", weather_stage)
+    scheduler.add("coverage", coverage_stage, depends_on=["static_map"])
+    scheduler.add("report", report_stage, depends_on=["coverage", "weather"])
+
+    runner = asyncio.create_task(scheduler.run())
+    runner.add_done_callback(lambda _: events.put_nowait(None))
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield event
+        results = runner.result()
+    except StageFailed as e:
+        map_result = scheduler.results.get("static_map")
+        yield {"event": "done", "data": {
+            "status": "error",
+            "message": str(e),
+            "file_path": map_result["file_path"] if map_result else None,
+            "timings": scheduler.timings,
+        }}
+        return
+    except Exception as e:
+        yield {"event": "done", "data": {"status": "error", "message": str(e), "timings": scheduler.timings}}
+        return
+    finally:
+        # The client disconnected mid-stream: stop the remaining stages.
+        if not runner.done():
+            runner.cancel()
+
+    result = {
+        "status": "success",
+        "message": "Location analyzed successfully.",
+        "file_path": results["static_map"]["file_path"],
+        "final_report": results["report"],
+        "coverage_backend": results["coverage"]["backend"],
+        "timings": scheduler.timings,
+    }
+    await _record_history(city, country, latitude, longitude, zoom, coverage_backend, result, results)
+    await _record_grid(latitude, longitude, zoom, results)
+    yield {"event": "done", "data": result}
+
+
+async def analyze_image_pipeline(
+    image_data: bytes,
+    digest: str,
+    city: Optional[str] = None,
+    country: Optional[str] = None,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    coverage_backend: Optional[str] = None,
+    debug: bool = False,
+) -> Dict:
+    """
+    Analyzes an uploaded image held in memory, e.g. drone imagery.
+
+    The image is prepared (downscaled/re-encoded if needed) and passed to the coverage
+    stage as bytes; nothing is written to disk. When city and country are given, the
+    weather lookup runs alongside and a full plant report is composed as well.
+
+    Args:
+        image_data (bytes): The uploaded image.
+        digest (str): SHA-256 of the upload, used as the coverage cache key.
+        city, country (str): Optional location for weather and recommendations.
+        latitude, longitude (float): Optional coordinates for the report.
+        coverage_backend (str): "llm", "local" or "crosscheck". Defaults to COVERAGE_BACKEND.
+        debug (bool): Include every instrumented call made for this request under "debug".
+
+    Returns:
+        dict: Result with status, message, image details, coverage, optional
+        final_report and per-stage timings.
+    """
+    scheduler = StageScheduler()
+    with_report = bool(city and country)
+
+    # Only the LLM backends need the model's view; it is encoded from the same decode.
+    for_vision = (coverage_backend or COVERAGE_BACKEND) in ("llm", "crosscheck")
+
+    async def prepare_stage():
+        return await run_blocking(prepare_image, image_data, for_vision=for_vision)
+
+    async def coverage_stage(prepare):
+        coverage_details = await generate_coverage_details_from_data_async(
+            prepare.data, prepare.mime_type, backend=coverage_backend, digest=digest, vision=prepare.vision
+        )
+        if coverage_details["status"] == "error":
+            raise StageFailed(coverage_details["message"])
+        return coverage_details
+
+    async def weather_stage():
+        return await default_fetch_weather(city)
+
+    async def report_stage(coverage, weather):
+        return await compose_final_report_async(
+            coverage["caption"], weather, city, country, latitude, longitude
+        )
+
+    scheduler.add("prepare", prepare_stage)
+    scheduler.add("coverage", coverage_stage, depends_on=["prepare"])
+    if with_report:
+        scheduler.add("weather", weather_stage)
+        scheduler.add("report", report_stage, depends_on=["coverage", "weather"])
+
+    with trace_request(debug) as spans:
+        try:
+            results = await scheduler.run()
+        except UploadError:
+            # Not an image we can decode; the endpoint reports it with its HTTP status.
+            raise
+        except Exception as e:
+            error = {"status": "error", "message": str(e), "timings": scheduler.timings}
+            if debug:
+                error["debug"] = {"spans": spans}
+            return error
+
+    prepared = results["prepare"]
+    result = {
+        "status": "success",
+        "message": "Image analyzed successfully.",
+        "image": {
+            "sha256": digest,
+            "bytes_received": len(image_data),
+            "bytes_analyzed": len(prepared.data),
+            "mime_type": prepared.mime_type,
+            "width": prepared.width,
+            "height": prepared.height,
+            "original_width": prepared.original_width,
+            "original_height": prepared.original_height,
+            "resized": prepared.resized,
+        },
+        "coverage": results["coverage"]["caption"],
+        "coverage_backend": results["coverage"]["backend"],
+        "timings": scheduler.timings,
+    }
+    if "crosscheck" in results["coverage"]:
+        result["coverage_crosscheck"] = results["coverage"]["crosscheck"]
+    if with_report:
+        result["final_report"] = results["report"]
+    if debug:
+        result["debug"] = {"spans": spans, "cached": {"coverage": results["coverage"].get("cached", False)}}
+    return result
+
@@ -0,0 +1,311 @@
+import os
+import csv
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Bundled plant list with growing traits, ranked locally so recommendations need no LLM call.
+PLANT_CATALOG_CSV = os.getenv(
+    "PLANT_CATALOG_CSV", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "plant_catalog.csv")
+)
+CATALOG_RECOMMENDATIONS = int(os.getenv("CATALOG_RECOMMENDATIONS", "5"))
+# At most this many picks share a growth form, so a site is not offered five trees.
+CATALOG_MAX_PER_FORM = 2
+
+SUN_BITS = {"full": 1, "partial": 2, "shade": 4}
+WATER_LEVELS = {"low": 0, "medium": 1, "high": 2}
+SPACE_LEVELS = {"small": 0, "medium": 1, "large": 2}
+URBAN_LEVELS = {"low": 0, "medium": 1, "high": 2}
+SEASONS = ("Spring", "Summer", "Autumn", "Winter", "Rainy")
+
+# Zone names SeasonData carries when no Köppen code is known (see gazetteer.latitude_zone).
+ZONE_GROUPS = {
+    "tropical": "A", "arid": "B", "subtropical": "C", "temperate": "C", "continental": "D", "polar": "E",
+}
+KOPPEN_NAMES = {
+    "A": "tropical", "Af": "tropical rainforest", "Am": "tropical monsoon", "Aw": "tropical savanna",
+    "As": "tropical dry-summer savanna", "B": "dry", "BW": "desert", "BWh": "hot desert", "BWk": "cold desert",
+    "BS": "semi-arid", "BSh": "hot semi-arid", "BSk": "cold semi-arid", "C": "temperate",
+    "Cs": "Mediterranean", "Csa": "hot-summer Mediterranean", "Csb": "warm-summer Mediterranean",
+    "Cw": "dry-winter subtropical", "Cwa": "humid subtropical dry-winter", "Cwb": "subtropical highland",
+    "Cf": "humid temperate", "Cfa": "humid subtropical", "Cfb": "oceanic", "Cfc": "subpolar oceanic",
+    "D": "continental", "Dfa": "hot-summer continental", "Dfb": "warm-summer continental",
+    "Dfc": "subarctic", "Dfd": "extremely cold subarctic", "Dwa": "monsoon continental",
+    "Dwb": "monsoon warm-summer continental", "Dwc": "monsoon subarctic", "E": "polar", "ET": "tundra",
+}
+
+# How much each trait contributes to a candidate's score; the climate match multiplies the total.
+WEIGHTS = {
+    "temperature": 0.22, "humidity": 0.12, "water": 0.16, "wet_soil": 0.06,
+    "space": 0.14, "urban": 0.12, "sun": 0.08, "season": 0.10,
+}
+TEMPERATURE_MARGIN_C = 6.0
+HUMIDITY_MARGIN = 30.0
+# Climate fit when the site shares a listed code exactly, its first two letters, or only its group.
+CLIMATE_FITS = (1.0, 0.95, 0.85)
+# Climate fit given to every plant when too few match the site's climate at all.
+CLIMATE_RELAXED_FIT = 0.6
+OUT_OF_SEASON_FIT = 0.55
+
+
+def _split(value: str) -> List[str]:
+    return [part.strip() for part in value.split("|") if part.strip()]
+
+
+def _levels(record: Dict, field: str, levels: Dict[str, int]) -> int:
+    value = record[field].strip().lower()
+    if value not in levels:
+        raise ValueError(f"Invalid {field} '{value}' for {record['name']}")
+    return levels[value]
+
+
+class PlantCatalog:
+    """
+    Ranks the bundled plant list against a site's weather, season and land coverage.
+
+    Traits are held as numpy arrays, one entry per plant, and climates and seasons are
+    pre-indexed as boolean masks, so ranking scores every plant at once with a few
+    vectorized operations and makes no network calls.
+    """
+
+    def __init__(self, records: List[Dict], version: str):
+        self.version = version
+        self.names = [record["name"] for record in records]
+        self.common_names = [record["common_name"] for record in records]
+        self.care = [record["care"] for record in records]
+        self.forms = np.array([record["form"] for record in records])
+        self.climates = [_split(record["climates"]) for record in records]
+        self.seasons = [_split(record["seasons"]) for record in records]
+        self.min_temp = np.array([float(record["min_temp_c"]) for record in records])
+        self.max_temp = np.array([float(record["max_temp_c"]) for record in records])
+        self.min_humidity = np.array([float(record["min_humidity"]) for record in records])
+        self.max_humidity = np.array([float(record["max_humidity"]) for record in records])
+        self.sun = np.array([sum(SUN_BITS[part] for part in _split(record["sun"])) for record in records])
+        self.water = np.array([_levels(record, "water", WATER_LEVELS) for record in records])
+        self.space = np.array([_levels(record, "space", SPACE_LEVELS) for record in records])
+        self.urban = np.array([_levels(record, "urban", URBAN_LEVELS) for record in records])
+        self.wet_soil = np.array([record["wet_soil"].strip() == "1" for record in records])
+
+        # Plants listing a code exactly, and plants listing any code that starts with a prefix.
+        self._listed: Dict[str, np.ndarray] = {}
+        self._family: Dict[str, np.ndarray] = {}
+        for row, codes in enumerate(self.climates):
+            for code in codes:
+                self._listed.setdefault(code, np.zeros(len(records), dtype=bool))[row] = True
+                for length in (1, 2):
+                    if len(code) >= length:
+                        self._family.setdefault(code[:length], np.zeros(len(records), dtype=bool))[row] = True
+        self._in_season = {
+            season: np.array([season in seasons for seasons in self.seasons]) for season in SEASONS
+        }
+        self.climate_fit = lru_cache(maxsize=64)(self._climate_fit)
+
+    @classmethod
+    def load(cls, csv_path: str = PLANT_CATALOG_CSV) -> "PlantCatalog":
+        with open(csv_path, "rb") as f:
+            version = hashlib.sha256(f.read()).hexdigest()[:16]
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            records = list(csv.DictReader(f))
+        return cls(records, version)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _climate_fit(self, climate_zone: Optional[str]) -> Optional[np.ndarray]:
+        """
+        How well each plant's listed climates match a Köppen code or fallback zone name.
+
+        Returns:
+            Optional[np.ndarray]: Fit per plant (0 where the climate does not match at
+                all), or None when the climate is unknown.
+        """
+        code = ZONE_GROUPS.get((climate_zone or "").lower(), climate_zone or "")
+        if not code or code[0] not in "ABCDE":
+            return None
+        empty = np.zeros(len(self), dtype=bool)
+        covered = empty.copy()
+        for length in range(1, len(code) + 1):
+            covered |= self._listed.get(code[:length], empty)
+        exact, close, group = CLIMATE_FITS
+        return np.where(
+            covered, exact,
+            np.where(self._family.get(code[:2], empty) if len(code) >= 2 else empty, close,
+                     np.where(self._family.get(code[:1], empty), group, 0.0)),
+        )
+
+    def recommend(self, weather_data, season_data, land_coverage, limit: int = CATALOG_RECOMMENDATIONS) -> List[Dict]:
+        """
+        Ranks the catalog for a site.
+
+        Args:
+            weather_data (WeatherData): Current weather at the site.
+            season_data (SeasonData): Season and climate zone (Köppen code or zone name).
+            land_coverage (LandCoverageData): Coverage percentages of the site.
+            limit (int): Number of plants to return.
+
+        Returns:
+            List[Dict]: Best plants first, each with name, reason, care, form and score.
+        """
+        components = self._components(weather_data, season_data, land_coverage)
+        base = sum(WEIGHTS[name] * fit for name, fit in components.items())
+        temperature_ok = components["temperature"] > 0
+
+        climate = self.climate_fit(season_data.climate_zone)
+        if climate is None:
+            climate = np.ones(len(self))
+        candidates = temperature_ok & (climate > 0)
+        if candidates.sum() < limit:
+            climate = np.maximum(climate, CLIMATE_RELAXED_FIT)
+            candidates = temperature_ok if temperature_ok.sum() >= limit else np.ones(len(self), dtype=bool)
+        scores = np.where(candidates, base * climate, -1.0)
+
+        ranked = [int(row) for row in np.argsort(-scores, kind="stable") if scores[row] >= 0]
+        picks: List[int] = []
+        per_form: Dict[str, int] = {}
+        for row in ranked:
+            form = str(self.forms[row])
+            if len(picks) < limit and per_form.get(form, 0) < CATALOG_MAX_PER_FORM:
+                per_form[form] = per_form.get(form, 0) + 1
+                picks.append(row)
+        # A short list (few plants fit the climate) is topped up regardless of form.
+        picks += [row for row in ranked if row not in picks][:limit - len(picks)]
+        picks.sort(key=lambda row: -scores[row])
+
+        return [
+            {
+                "name": f"{self.names[row]} ({self.common_names[row]})",
+                "reason": self._reason(row, components, climate[row], weather_data, season_data, land_coverage),
+                "care": self.care[row],
+                "form": str(self.forms[row]),
+                "score": round(float(scores[row]), 3),
+            }
+            for row in picks
+        ]
+
+    def _components(self, weather_data, season_data, land_coverage) -> Dict[str, np.ndarray]:
+        """Per-trait fit of every plant to the site, each between 0 and 1."""
+        temperature = min(weather_data.temperature, weather_data.feels_like)
+        hottest = max(weather_data.temperature, weather_data.feels_like)
+        below = np.maximum(self.min_temp - temperature, 0)
+        above = np.maximum(hottest - self.max_temp, 0)
+        temperature_fit = np.clip(1 - (below + above) / TEMPERATURE_MARGIN_C, 0, 1)
+
+        humidity = weather_data.humidity
+        humidity_gap = np.maximum(self.min_humidity - humidity, 0) + np.maximum(humidity - self.max_humidity, 0)
+        humidity_fit = np.clip(1 - humidity_gap / HUMIDITY_MARGIN, 0, 1)
+
+        water_level = site_water_level(weather_data, season_data, land_coverage)
+        shortfall = np.maximum(self.water - water_level, 0)
+        surplus = np.maximum(water_level - self.water, 0)
+        water_fit = np.clip(1 - 0.45 * shortfall - 0.25 * surplus, 0, 1)
+
+        wet_site = land_coverage.water_body >= 10 or season_data.season == "Rainy"
+        wet_fit = np.where(self.wet_soil, 1.0, 0.5) if wet_site else np.ones(len(self))
+
+        space_level = site_space_level(land_coverage)
+        space_fit = np.clip(
+            1 - 0.45 * np.maximum(self.space - space_level, 0) - 0.1 * np.maximum(space_level - self.space, 0), 0, 1
+        )
+
+        urban_level = site_urban_level(land_coverage)
+        urban_fit = np.clip(1 - 0.4 * np.maximum(urban_level - self.urban, 0), 0, 1)
+
+        if land_coverage.building_coverage >= 50:
+            sun_fit = np.where(self.sun & (SUN_BITS["partial"] | SUN_BITS["shade"]), 1.0, 0.7)
+        else:
+            sun_fit = np.where(self.sun & SUN_BITS["full"], 1.0, 0.7)
+
+        in_season = self._in_season.get(season_data.season)
+        season_fit = np.ones(len(self)) if in_season is None else np.where(in_season, 1.0, OUT_OF_SEASON_FIT)
+
+        return {
+            "temperature": temperature_fit, "humidity": humidity_fit, "water": water_fit, "wet_soil": wet_fit,
+            "space": space_fit, "urban": urban_fit, "sun": sun_fit, "season": season_fit,
+        }
+
+    def _reason(self, row, components, climate_fit, weather_data, season_data, land_coverage) -> str:
+        """A short explanation built from the traits that scored best for this plant."""
+        phrases = []
+        zone = season_data.climate_zone or ""
+        if climate_fit >= CLIMATE_FITS[-1] and zone:
+            name = KOPPEN_NAMES.get(zone) or KOPPEN_NAMES.get(zone[:2]) or zone.lower()
+            phrases.append(f"suited to the {name} climate")
+
+        candidates: List[Tuple[float, str]] = []
+        if components["temperature"][row] >= 1:
+            candidates.append((WEIGHTS["temperature"], (
+                f"comfortable at the current {weather_data.temperature:g}°C "
+                f"(tolerates {self.min_temp[row]:g} to {self.max_temp[row]:g}°C)"
+            )))
+        if components["humidity"][row] >= 1:
+            candidates.append((WEIGHTS["humidity"], f"handles {weather_data.humidity:g}% humidity"))
+        if components["water"][row] >= 1:
+            water_text = {0: "needs little water once established", 1: "gets by on moderate watering",
+                          2: "makes good use of the plentiful water"}[int(self.water[row])]
+            candidates.append((WEIGHTS["water"], water_text))
+        if land_coverage.water_body >= 10 and self.wet_soil[row]:
+            candidates.append((WEIGHTS["wet_soil"] + 0.1, "tolerates the wet soil near water bodies"))
+        if components["space"][row] >= 1:
+            space_text = {0: "fits into small gaps between buildings and paving",
+                          1: "needs only a modest planting area",
+                          2: f"has room to grow on the {land_coverage.empty_land:g}% open land"}[int(self.space[row])]
+            candidates.append((WEIGHTS["space"], space_text))
+        if site_urban_level(land_coverage) >= 2 and self.urban[row] >= 2:
+            candidates.append((WEIGHTS["urban"] + 0.05, "tolerates the heat, dust and pollution of built-up areas"))
+        if land_coverage.building_coverage >= 50 and self.sun[row] & (SUN_BITS["partial"] | SUN_BITS["shade"]):
+            candidates.append((WEIGHTS["sun"], "copes with shade cast by buildings"))
+        if season_data.season in self.seasons[row]:
+            candidates.append((WEIGHTS["season"], f"{season_data.season.lower()} is a good time to plant it"))
+        elif self.seasons[row]:
+            candidates.append((0.0, f"best planted in {' or '.join(s.lower() for s in self.seasons[row][:2])}"))
+
+        phrases += [text for _, text in sorted(candidates, key=lambda c: -c[0])[:3]]
+        text = "; ".join(phrases) or "a reasonable match for the site"
+        return f"{self.common_names[row]} is {text}."
+
+    def stats(self) -> Dict:
+        return {"plants": len(self), "climate_codes": len(self._listed)}
+
+
+def site_water_level(weather_data, season_data, land_coverage) -> int:
+    """Water available to plants at the site: 0 (dry), 1 (moderate) or 2 (plentiful)."""
+    level = 1
+    if season_data.season == "Rainy" or weather_data.precipitation >= 2 or land_coverage.water_body >= 10:
+        level += 1
+    zone = ZONE_GROUPS.get((season_data.climate_zone or "").lower(), season_data.climate_zone or "")
+    if zone.startswith("B") or (weather_data.humidity < 35 and weather_data.precipitation == 0):
+        level -= 1
+    return max(0, min(2, level))
+
+
+def site_space_level(land_coverage) -> int:
+    if land_coverage.empty_land >= 25:
+        return 2
+    if land_coverage.empty_land >= 10:
+        return 1
+    return 0
+
+
+def site_urban_level(land_coverage) -> int:
+    density = land_coverage.building_coverage + land_coverage.road_coverage
+    if density >= 50:
+        return 2
+    if density >= 20:
+        return 1
+    return 0
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_plant_catalog() -> PlantCatalog:
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = PlantCatalog.load()
+    return _catalog
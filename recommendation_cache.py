@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Optional
+
+from storage import get_connection
+
+REC_CACHE_MAX_ENTRIES = int(os.getenv("REC_CACHE_MAX_ENTRIES", "5000"))
+REC_CACHE_TTL_HOURS = float(os.getenv("REC_CACHE_TTL_HOURS", "168"))
+# Bucket widths for the quantized feature vector.
+REC_COVERAGE_BUCKET = float(os.getenv("REC_COVERAGE_BUCKET", "5"))
+REC_TEMPERATURE_BUCKET = float(os.getenv("REC_TEMPERATURE_BUCKET", "3"))
+REC_HUMIDITY_BUCKET = float(os.getenv("REC_HUMIDITY_BUCKET", "10"))
+
+COVERAGE_FEATURES = ("vegetation_coverage", "building_coverage", "road_coverage", "empty_land", "water_body")
+
+
+def _band(value: float, width: float) -> int:
+    return int((float(value) + width / 2) // width)
+
+
+def feature_key(city: str, country: str, season: str, coverage: Dict, temperature: float, humidity: float) -> str:
+    """
+    Builds the cache key from a quantized view of the recommendation inputs.
+
+    Two sites in the same city and season whose coverage mix, temperature and humidity
+    fall in the same buckets share a key, and therefore a recommendation.
+    """
+    features = {
+        "city": " ".join(city.lower().split()),
+        "country": " ".join(country.lower().split()),
+        "season": season,
+        "coverage": [_band(coverage.get(name, 0.0), REC_COVERAGE_BUCKET) for name in COVERAGE_FEATURES],
+        "temperature": _band(temperature, REC_TEMPERATURE_BUCKET),
+        "humidity": _band(humidity, REC_HUMIDITY_BUCKET),
+    }
+    return hashlib.sha256(json.dumps(features, sort_keys=True).encode()).hexdigest()[:32]
+
+
+class RecommendationCache:
+    """
+    SQLite cache of parsed recommendation results, keyed by quantized features.
+
+    Entries carry the prompt template version they were generated with and are only
+    read back for that version, so processes running different versions (a rolling
+    deploy) can share the database. Entries of other versions are removed once unused
+    for the TTL. Least recently used entries are evicted past max_entries and entries
+    older than the TTL are misses, though get_stale still returns them while Gemini is
+    unavailable.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = REC_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = REC_CACHE_TTL_HOURS * 3600,
+        db_path: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if not self._schema_ready:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS recommendation_cache (
+                    key TEXT NOT NULL,
+                    template_version TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (key, template_version)
+                );
+                CREATE INDEX IF NOT EXISTS idx_recommendation_cache_last_access
+                    ON recommendation_cache(last_access);
+            """)
+            self._schema_ready = True
+        return conn
+
+    def get(self, key: str, template_version: str) -> Optional[Dict]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT payload, created_at FROM recommendation_cache WHERE key = ? AND template_version = ?",
+            (key, template_version),
+        ).fetchone()
+        now = time.time()
+        if row is None or now - row["created_at"] > self.ttl_seconds:
+            with self._lock:
+                self.misses += 1
+            return None
+        conn.execute(
+            "UPDATE recommendation_cache SET last_access = ? WHERE key = ? AND template_version = ?",
+            (now, key, template_version),
+        )
+        with self._lock:
+            self.hits += 1
+        return json.loads(row["payload"])
+
+    def get_stale(self, key: str, template_version: str) -> Optional[Dict]:
+        """Returns the entry for key regardless of its age, or None."""
+        row = self._conn().execute(
+            "SELECT payload FROM recommendation_cache WHERE key = ? AND template_version = ?",
+            (key, template_version),
+        ).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self.stale_served += 1
+        return json.loads(row["payload"])
+
+    def put(self, key: str, template_version: str, parsed_result: Dict):
+        if parsed_result.get("error") or not parsed_result.get("recommendations"):
+            return
+        conn = self._conn()
+        now = time.time()
+        payload = json.dumps({"recommendations": parsed_result["recommendations"]})
+        conn.execute(
+            "INSERT OR REPLACE INTO recommendation_cache(key, template_version, payload, created_at, last_access) "
+            "VALUES(?, ?, ?, ?, ?)",
+            (key, template_version, payload, now, now),
+        )
+        # Other versions may still be in use by other processes; drop them only once idle for the TTL.
+        conn.execute(
+            "DELETE FROM recommendation_cache WHERE last_access < ? AND template_version != ?",
+            (now - self.ttl_seconds, template_version),
+        )
+        count = conn.execute("SELECT COUNT(*) FROM recommendation_cache").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM recommendation_cache WHERE rowid IN "
+                "(SELECT rowid FROM recommendation_cache ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def invalidate(self, keep_version: Optional[str] = None) -> int:
+        """Deletes every entry, or every entry not generated with keep_version. Returns rows removed."""
+        conn = self._conn()
+        if keep_version is None:
+            cursor = conn.execute("DELETE FROM recommendation_cache")
+        else:
+            cursor = conn.execute("DELETE FROM recommendation_cache WHERE template_version != ?", (keep_version,))
+        return cursor.rowcount
+
+    def stats(self) -> Dict:
+        entries = self._conn().execute("SELECT COUNT(*) FROM recommendation_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_served": self.stale_served,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_recommendation_cache = None
+
+
+def get_recommendation_cache() -> RecommendationCache:
+    global _recommendation_cache
+    if _recommendation_cache is None:
+        _recommendation_cache = RecommendationCache()
+    return _recommendation_cache
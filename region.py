@@ -0,0 +1,474 @@
+import io
+import os
+import math
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from executor import run_blocking, run_in_process
+from coverage_engine import CLASS_FIELDS, MAX_SIDE, aggregate_coverage, estimate_coverage
+from step0 import download_static_map_async
+from step1 import generate_coverage_details_from_data_async
+from uploads import UPLOAD_MAX_PIXELS, UploadError, open_upload
+from coverage_grid import get_coverage_grid
+
+REGION_MAX_TILES = int(os.getenv("REGION_MAX_TILES", "400"))
+# Tiles fetched/decoded at once; bounds memory to roughly this many images in flight.
+REGION_CONCURRENCY = int(os.getenv("REGION_CONCURRENCY", "8"))
+REGION_TILE_SIZE = os.getenv("REGION_TILE_SIZE", "640x640")
+# "local" runs the NumPy engine in the process pool; "llm" sends every tile to Gemini.
+REGION_COVERAGE_BACKEND = os.getenv("REGION_COVERAGE_BACKEND", "local")
+ORTHOPHOTO_TILE_PX = int(os.getenv("ORTHOPHOTO_TILE_PX", "640"))
+ORTHOPHOTO_MAX_MB = float(os.getenv("ORTHOPHOTO_MAX_MB", "200"))
+
+REGION_BACKENDS = ("local", "llm")
+EARTH_CIRCUMFERENCE_M = 40075016.686
+MAX_MERCATOR_LATITUDE = 85.05112878
+# Zoom levels the static map API serves.
+MIN_ZOOM, MAX_ZOOM = 0, 21
+
+BBox = Tuple[float, float, float, float]
+
+
+@dataclass
+class RegionTile:
+    row: int
+    col: int
+    # Ground area in m² (bounding box mode) or pixel count (orthophoto mode) inside the region.
+    weight: float
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    bounds: Optional[BBox] = None
+    # Crop box (left, top, right, bottom) in orthophoto pixels.
+    box: Optional[Tuple[int, int, int, int]] = None
+    # (x, y) of the cell on the global tile grid (bounding box mode).
+    cell: Optional[Tuple[int, int]] = None
+
+    def describe(self) -> Dict:
+        tile = {"row": self.row, "col": self.col, "weight": round(self.weight, 2)}
+        if self.latitude is not None:
+            tile.update({
+                "latitude": round(self.latitude, 7),
+                "longitude": round(self.longitude, 7),
+                "bounds": [round(v, 7) for v in self.bounds],
+            })
+        if self.box is not None:
+            tile["box"] = list(self.box)
+        if self.cell is not None:
+            tile["cell"] = list(self.cell)
+        return tile
+
+
+def _world_pixel(latitude: float, longitude: float, zoom: int) -> Tuple[float, float]:
+    """Web Mercator pixel coordinates at the given zoom (the projection static maps use)."""
+    scale = 256 * 2 ** zoom
+    sin_lat = math.sin(math.radians(latitude))
+    x = (longitude + 180.0) / 360.0 * scale
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * scale
+    return x, y
+
+
+def _from_world_pixel(x: float, y: float, zoom: int) -> Tuple[float, float]:
+    scale = 256 * 2 ** zoom
+    longitude = x / scale * 360.0 - 180.0
+    latitude = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / scale))))
+    return latitude, longitude
+
+
+def meters_per_pixel(latitude: float, zoom: int) -> float:
+    return EARTH_CIRCUMFERENCE_M * math.cos(math.radians(latitude)) / (256 * 2 ** zoom)
+
+
+def parse_bbox(value: Union[str, Sequence[float]]) -> BBox:
+    """Parses [south, west, north, east] from a list or a 'south,west,north,east' string."""
+    if isinstance(value, str):
+        value = value.split(",")
+    try:
+        south, west, north, east = (float(v) for v in value)
+    except (TypeError, ValueError):
+        raise ValueError("bbox must be four numbers: south, west, north, east.")
+    if not (-MAX_MERCATOR_LATITUDE <= south < north <= MAX_MERCATOR_LATITUDE):
+        raise ValueError("bbox latitudes must satisfy south < north within ±85.05.")
+    if not (-180.0 <= west < east <= 180.0):
+        raise ValueError("bbox longitudes must satisfy west < east within ±180 (no antimeridian crossing).")
+    return south, west, north, east
+
+
+def check_zoom(zoom: int) -> int:
+    if not isinstance(zoom, int) or not MIN_ZOOM <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be an integer from {MIN_ZOOM} to {MAX_ZOOM}, got {zoom}.")
+    return zoom
+
+
+def tile_dimensions(size: str) -> Tuple[int, int]:
+    width, height = (int(v) for v in size.lower().split("x"))
+    return width, height
+
+
+def cell_range(bbox: BBox, zoom: int, size: str = REGION_TILE_SIZE) -> Tuple[int, int, int, int]:
+    """
+    Cells of the global tile grid that intersect a bounding box.
+
+    Returns:
+        tuple: (x0, x1, y0, y1), inclusive.
+    """
+    check_zoom(zoom)
+    south, west, north, east = bbox
+    width, height = tile_dimensions(size)
+    left, top = _world_pixel(north, west, zoom)
+    right, bottom = _world_pixel(south, east, zoom)
+    return (
+        int(left // width), max(int(left // width), math.ceil(right / width) - 1),
+        int(top // height), max(int(top // height), math.ceil(bottom / height) - 1),
+    )
+
+
+def centered_cell(
+    latitude: float, longitude: float, zoom: int, size: str = REGION_TILE_SIZE, tolerance_px: float = 8.0
+) -> Optional[Tuple[int, int]]:
+    """The grid cell centered on a point (within tolerance_px world pixels), or None if the point is off-center."""
+    check_zoom(zoom)
+    width, height = tile_dimensions(size)
+    x, y = _world_pixel(latitude, longitude, zoom)
+    cell = (int(x // width), int(y // height))
+    if abs(x - (cell[0] + 0.5) * width) > tolerance_px or abs(y - (cell[1] + 0.5) * height) > tolerance_px:
+        return None
+    return cell
+
+
+def cell_bounds(x, y, zoom: int, size: str = REGION_TILE_SIZE):
+    """(south, west, north, east) of cell (x, y); works element-wise on NumPy arrays."""
+    width, height = tile_dimensions(size)
+    scale = 256 * 2 ** zoom
+    west = np.asarray(x) * width / scale * 360.0 - 180.0
+    east = (np.asarray(x) + 1) * width / scale * 360.0 - 180.0
+    north = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y) * height / scale))))
+    south = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (np.asarray(y) + 1) * height / scale))))
+    return south, west, north, east
+
+
+def cell_tile(cell: Tuple[int, int], zoom: int, size: str = REGION_TILE_SIZE, row: int = 0, col: int = 0) -> RegionTile:
+    """The whole tile for a grid cell, weighted by its full ground area."""
+    width, height = tile_dimensions(size)
+    latitude, longitude = _from_world_pixel((cell[0] + 0.5) * width, (cell[1] + 0.5) * height, zoom)
+    return RegionTile(
+        row=row,
+        col=col,
+        weight=width * height * meters_per_pixel(latitude, zoom) ** 2,
+        latitude=latitude,
+        longitude=longitude,
+        bounds=tuple(float(v) for v in cell_bounds(cell[0], cell[1], zoom, size)),
+        cell=cell,
+    )
+
+
+def plan_bbox_grid(
+    bbox: BBox, zoom: int = 18, size: str = REGION_TILE_SIZE, max_tiles: int = REGION_MAX_TILES
+) -> Tuple[int, int, List[RegionTile]]:
+    """
+    Splits a bounding box into the static-map tiles of the global grid that it touches.
+
+    Tiles are aligned to the global grid (see coverage_grid) so results can be reused
+    by any later region or heatmap over the same cells. Each tile is weighted by the
+    ground area of its part inside the box, so edge tiles count only for what they cover.
+
+    Returns:
+        tuple: (rows, cols, tiles) in row-major order from the north-west corner.
+
+    Raises:
+        ValueError: If zoom is out of range or the box needs more than max_tiles tiles.
+    """
+    check_zoom(zoom)
+    south, west, north, east = bbox
+    width, height = tile_dimensions(size)
+    left, top = _world_pixel(north, west, zoom)
+    right, bottom = _world_pixel(south, east, zoom)
+    cell_x0, cell_x1, cell_y0, cell_y1 = cell_range(bbox, zoom, size)
+    cols, rows = cell_x1 - cell_x0 + 1, cell_y1 - cell_y0 + 1
+    if rows * cols > max_tiles:
+        raise ValueError(
+            f"The region needs {rows * cols} tiles at zoom {zoom}; the limit is {max_tiles}. "
+            "Use a smaller box or a lower zoom."
+        )
+
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            cell = (cell_x0 + col, cell_y0 + row)
+            x0, y0 = cell[0] * width, cell[1] * height
+            x1, y1 = x0 + width, y0 + height
+            inside = max(0.0, min(x1, right) - max(x0, left)) * max(0.0, min(y1, bottom) - max(y0, top))
+            latitude, longitude = _from_world_pixel(x0 + width / 2, y0 + height / 2, zoom)
+            tile_north, tile_west = _from_world_pixel(x0, y0, zoom)
+            tile_south, tile_east = _from_world_pixel(x1, y1, zoom)
+            tiles.append(RegionTile(
+                row=row,
+                col=col,
+                weight=inside * meters_per_pixel(latitude, zoom) ** 2,
+                latitude=latitude,
+                longitude=longitude,
+                bounds=(tile_south, tile_west, tile_north, tile_east),
+                cell=cell,
+            ))
+    return rows, cols, tiles
+
+
+def plan_orthophoto_grid(
+    width: int, height: int, tile_px: int = ORTHOPHOTO_TILE_PX, bbox: Optional[BBox] = None
+) -> Tuple[int, int, List[RegionTile]]:
+    """
+    Splits an image of width x height pixels into tile_px squares (smaller at the edges).
+
+    Tiles are weighted by pixel count. With a bbox (north-up image), each tile also
+    gets its center and bounds by linear interpolation.
+
+    Raises:
+        ValueError: If tile_px is not positive or the image splits into more than REGION_MAX_TILES tiles.
+    """
+    if tile_px <= 0:
+        raise ValueError(f"tile_px must be positive, got {tile_px}.")
+    cols, rows = math.ceil(width / tile_px), math.ceil(height / tile_px)
+    if rows * cols > REGION_MAX_TILES:
+        raise ValueError(
+            f"The image splits into {rows * cols} tiles of {tile_px}px; the limit is {REGION_MAX_TILES}. "
+            "Use a larger tile size."
+        )
+
+    def to_lat_lon(x: float, y: float) -> Tuple[float, float]:
+        south, west, north, east = bbox
+        return north - (north - south) * y / height, west + (east - west) * x / width
+
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            box = (col * tile_px, row * tile_px, min((col + 1) * tile_px, width), min((row + 1) * tile_px, height))
+            tile = RegionTile(row=row, col=col, weight=float((box[2] - box[0]) * (box[3] - box[1])), box=box)
+            if bbox is not None:
+                tile_north, tile_west = to_lat_lon(box[0], box[1])
+                tile_south, tile_east = to_lat_lon(box[2], box[3])
+                tile.bounds = (tile_south, tile_west, tile_north, tile_east)
+                tile.latitude, tile.longitude = to_lat_lon((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)
+            tiles.append(tile)
+    return rows, cols, tiles
+
+
+def open_orthophoto(data: bytes, tile_px: int = ORTHOPHOTO_TILE_PX) -> Tuple[Image.Image, int, int]:
+    """
+    Decodes an orthophoto at the lowest resolution the coverage engine still needs.
+
+    Every tile is analyzed at MAX_SIDE pixels at most, so a JPEG is decoded at a reduced
+    DCT scale when tiles are larger than that, which keeps memory proportional to
+    what is analyzed rather than to the full image.
+
+    Returns:
+        tuple: (decoded RGB image, original width, original height).
+    """
+    image = open_upload(data)
+    width, height = image.size
+    if image.format == "JPEG" and tile_px > MAX_SIDE:
+        reduction = tile_px / MAX_SIDE
+        image.draft("RGB", (math.ceil(width / reduction), math.ceil(height / reduction)))
+    if image.size[0] * image.size[1] > UPLOAD_MAX_PIXELS:
+        raise UploadError(f"Image is too large to process ({width}x{height}).", status_code=413)
+    try:
+        return image.convert("RGB"), width, height
+    except Exception as e:
+        raise UploadError(f"Could not decode the uploaded image: {e}", status_code=415)
+
+
+def crop_tile(image: Image.Image, original_width: int, box: Tuple[int, int, int, int]) -> Image.Image:
+    """Crops a tile given in original pixel coordinates and shrinks it to MAX_SIDE."""
+    factor = image.width / original_width
+    crop = image.crop(tuple(round(v * factor) for v in box))
+    if max(crop.size) > MAX_SIDE:
+        crop.thumbnail((MAX_SIDE, MAX_SIDE), Image.Resampling.BILINEAR)
+    return crop
+
+
+def _encode_jpeg(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def analyze_tiles(
+    tiles: List[RegionTile],
+    load_tile: Callable[[RegionTile], Awaitable[Union[bytes, Image.Image]]],
+    backend: str = REGION_COVERAGE_BACKEND,
+    concurrency: int = REGION_CONCURRENCY,
+) -> List[Dict]:
+    """
+    Estimates coverage for every tile with at most `concurrency` tiles loaded at once.
+
+    The local backend runs in the process pool, so estimation scales across cores while
+    loading (downloads, crops) overlaps on the event loop and thread pool.
+
+    Returns:
+        list: One dict per tile (its description plus "coverage" or "error"), in tile order.
+    """
+    if backend not in REGION_BACKENDS:
+        raise ValueError(f"Unknown region backend '{backend}'. Supported backends: {', '.join(REGION_BACKENDS)}")
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def analyze(tile: RegionTile) -> Dict:
+        result = tile.describe()
+        async with semaphore:
+            try:
+                image = await load_tile(tile)
+                if backend == "local":
+                    result["coverage"] = await run_in_process(estimate_coverage, image)
+                else:
+                    if isinstance(image, Image.Image):
+                        data, mime_type = await run_blocking(_encode_jpeg, image), "image/jpeg"
+                    else:
+                        data, mime_type = image, "image/png"
+                    details = await generate_coverage_details_from_data_async(data, mime_type, backend="llm")
+                    if details["status"] == "error":
+                        raise RuntimeError(details["message"])
+                    result["coverage"] = details["caption"]
+            except Exception as e:
+                result["error"] = str(e)
+        return result
+
+    return await asyncio.gather(*(analyze(tile) for tile in tiles))
+
+
+def summarize_region(mode: str, backend: str, rows: int, cols: int, tiles: List[RegionTile], results: List[Dict]) -> Dict:
+    """Aggregates per-tile results into area-weighted coverage plus the tile grid."""
+    succeeded = [(tile, result) for tile, result in zip(tiles, results) if "coverage" in result]
+    summary = {
+        "mode": mode,
+        "coverage_backend": backend,
+        "tiles_total": len(tiles),
+        "tiles_analyzed": len(succeeded),
+        "tiles_failed": len(tiles) - len(succeeded),
+        "grid": {"rows": rows, "cols": cols, "tiles": results},
+    }
+    if not succeeded:
+        first_error = next((r["error"] for r in results if "error" in r), "No tiles to analyze.")
+        return {"status": "error", "message": f"No tile could be analyzed: {first_error}", **summary}
+
+    coverage = aggregate_coverage([r["coverage"] for _, r in succeeded], [t.weight for t, _ in succeeded])
+    analyzed_weight = sum(t.weight for t, _ in succeeded)
+    result = {"status": "success", "message": "Region analyzed successfully.", "coverage": coverage, **summary}
+    if mode == "bbox":
+        result["area_m2"] = round(sum(t.weight for t in tiles), 1)
+        result["analyzed_area_m2"] = round(analyzed_weight, 1)
+        result["coverage_area_m2"] = {name: round(analyzed_weight * coverage[name] / 100, 1) for name in CLASS_FIELDS}
+    else:
+        result["area_pixels"] = int(sum(t.weight for t in tiles))
+    return result
+
+
+async def analyze_cells(
+    tiles: List[RegionTile],
+    zoom: int,
+    backend: str = REGION_COVERAGE_BACKEND,
+    concurrency: int = REGION_CONCURRENCY,
+    size: str = REGION_TILE_SIZE,
+) -> List[Dict]:
+    """
+    Coverage for grid-aligned tiles, analyzing only the cells not already stored.
+
+    Fresh results are written back to the coverage grid, so later regions and heatmaps
+    over the same cells are served without fetching or estimating again.
+
+    Returns:
+        list: One dict per tile, in tile order; reused results carry "cached": True.
+    """
+    grid = get_coverage_grid()
+    stored = await run_blocking(grid.get_cells, zoom, size, backend, [tile.cell for tile in tiles])
+    missing = [tile for tile in tiles if tile.cell not in stored]
+
+    async def load_tile(tile: RegionTile) -> bytes:
+        map_result = await download_static_map_async(tile.latitude, tile.longitude, zoom=zoom, size=size)
+        if map_result["status"] == "error":
+            raise RuntimeError(map_result["message"])
+        return await run_blocking(_read_file, map_result["file_path"])
+
+    fresh = dict(zip((tile.cell for tile in missing), await analyze_tiles(missing, load_tile, backend, concurrency)))
+    await run_blocking(grid.put_cells, zoom, size, backend, {
+        cell: result["coverage"] for cell, result in fresh.items() if "coverage" in result
+    })
+
+    results = []
+    for tile in tiles:
+        if tile.cell in fresh:
+            results.append(fresh[tile.cell])
+        else:
+            results.append({**tile.describe(), "coverage": stored[tile.cell], "cached": True})
+    return results
+
+
+async def analyze_region(
+    bbox: BBox,
+    zoom: int = 18,
+    coverage_backend: Optional[str] = None,
+    concurrency: int = REGION_CONCURRENCY,
+) -> Dict:
+    """
+    Analyzes every static-map tile of a bounding box and aggregates the coverage.
+
+    Args:
+        bbox (tuple): (south, west, north, east) in degrees.
+        zoom (int): Static map zoom level for the tiles.
+        coverage_backend (str): "local" or "llm". Defaults to REGION_COVERAGE_BACKEND.
+        concurrency (int): Tiles processed at once.
+
+    Returns:
+        dict: Area-weighted coverage, covered areas in m² and the per-tile grid.
+    """
+    backend = coverage_backend or REGION_COVERAGE_BACKEND
+    started = time.perf_counter()
+    rows, cols, tiles = plan_bbox_grid(bbox, zoom)
+    results = await analyze_cells(tiles, zoom, backend, concurrency)
+    summary = summarize_region("bbox", backend, rows, cols, tiles, results)
+    summary["zoom"] = zoom
+    summary["tiles_cached"] = sum(1 for result in results if result.get("cached"))
+    summary["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return summary
+
+
+async def analyze_orthophoto(
+    image_data: bytes,
+    tile_px: int = ORTHOPHOTO_TILE_PX,
+    bbox: Optional[BBox] = None,
+    coverage_backend: Optional[str] = None,
+    concurrency: int = REGION_CONCURRENCY,
+) -> Dict:
+    """
+    Splits a large uploaded image into tiles and aggregates their coverage.
+
+    Args:
+        image_data (bytes): The uploaded orthophoto.
+        tile_px (int): Tile side in original pixels.
+        bbox (tuple): Optional (south, west, north, east) of a north-up image, used to
+            georeference the tile grid.
+        coverage_backend (str): "local" or "llm". Defaults to REGION_COVERAGE_BACKEND.
+        concurrency (int): Tiles processed at once.
+
+    Returns:
+        dict: Pixel-weighted coverage and the per-tile grid.
+    """
+    backend = coverage_backend or REGION_COVERAGE_BACKEND
+    started = time.perf_counter()
+    image, width, height = await run_blocking(open_orthophoto, image_data, tile_px)
+    rows, cols, tiles = plan_orthophoto_grid(width, height, tile_px, bbox)
+
+    async def load_tile(tile: RegionTile) -> Image.Image:
+        return await run_blocking(crop_tile, image, width, tile.box)
+
+    results = await analyze_tiles(tiles, load_tile, backend, concurrency)
+    summary = summarize_region("orthophoto", backend, rows, cols, tiles, results)
+    summary.update({"width": width, "height": height, "tile_px": tile_px})
+    summary["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return summary
@@ -0,0 +1,407 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from metrics import UPSTREAM_CALLS
+
+# Shared retry and circuit-breaker settings; the per-provider rate limits, timeouts and
+# retry counts are read in _upstream_config below.
+UPSTREAM_BACKOFF_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_SECONDS", "0.5"))
+UPSTREAM_BACKOFF_MAX_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_MAX_SECONDS", "8"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+# A half-open probe that has not reported back within this long (a hung call) no longer
+# blocks the next one.
+BREAKER_PROBE_TIMEOUT_SECONDS = float(os.getenv("BREAKER_PROBE_TIMEOUT_SECONDS", "120"))
+# A call that would wait longer than this for a rate-limit token fails fast instead.
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "10"))
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+# Exception class names (anywhere in the MRO) that mean the upstream was unreachable, slow
+# or overloaded rather than that the request was wrong. Matched by name so this module does
+# not have to import requests, httpx or google.api_core.
+RETRYABLE_ERRORS = {
+    "TimeoutError", "TimeoutException", "Timeout", "ConnectionError", "TransportError",
+    "ConnectError", "ReadError", "RemoteProtocolError", "ResourceExhausted", "ServiceUnavailable",
+    "DeadlineExceeded", "InternalServerError", "TooManyRequests", "BadGateway", "GatewayTimeout",
+}
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling the upstream because its breaker is open or it is rate limited."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class RateLimitedError(UpstreamUnavailable):
+    pass
+
+
+class UpstreamStatusError(Exception):
+    """An HTTP response whose status is worth retrying (429 or 5xx)."""
+
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"Upstream returned {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def check_status(response):
+    """Raises UpstreamStatusError for a retryable requests/httpx response status."""
+    if response.status_code not in RETRYABLE_STATUS:
+        return
+    retry_after = None
+    try:
+        retry_after = float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        pass
+    raise UpstreamStatusError(response.status_code, retry_after)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, UpstreamStatusError):
+        return exc.status_code in RETRYABLE_STATUS
+    if isinstance(exc, UpstreamUnavailable):
+        return False
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(exc).__mro__)
+
+
+def is_unavailable(exc: Optional[BaseException]) -> bool:
+    """True if exc (or what it wraps) means the upstream could not serve the call."""
+    while exc is not None:
+        if isinstance(exc, UpstreamUnavailable) or is_retryable(exc):
+            return True
+        exc = exc.__cause__
+    return False
+
+
+class TokenBucket:
+    """Token bucket refilled at rate tokens per second up to burst; a rate of 0 disables it."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Takes a token, possibly in advance, and returns how long to wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return max(-self._tokens / self.rate, 0.0)
+
+    def cancel(self):
+        """Returns a reserved token that will not be used."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    def available(self) -> float:
+        if self.rate <= 0:
+            return self.burst
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and fails calls fast until
+    reset_seconds have passed; then lets a single probe through (half-open) and closes
+    again if it succeeds. A probe that is abandoned (release_probe) or never reports back
+    within probe_timeout lets the next call probe instead.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURES,
+        reset_seconds: float = BREAKER_RESET_SECONDS,
+        probe_timeout: float = BREAKER_PROBE_TIMEOUT_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.probe_timeout = probe_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    raise CircuitOpenError("Circuit breaker is open")
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open":
+                now = time.monotonic()
+                if self._probing and now - self._probe_started < self.probe_timeout:
+                    raise CircuitOpenError("Circuit breaker is half-open and a probe is in flight")
+                self._probing = True
+                self._probe_started = now
+
+    def release_probe(self):
+        """Frees the half-open slot after a call that ended without an outcome (e.g. cancelled)."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened += 1
+                self._opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the upstream's Retry-After."""
+    delay = random.uniform(0, min(UPSTREAM_BACKOFF_MAX_SECONDS, UPSTREAM_BACKOFF_SECONDS * 2 ** attempt))
+    if retry_after:
+        delay = max(delay, min(retry_after, UPSTREAM_BACKOFF_MAX_SECONDS))
+    return delay
+
+
+class Upstream:
+    """
+    Rate limit, timeout, retries and circuit breaker for one external provider.
+
+    call/call_async run a function through all of them: each attempt takes a token and
+    checks the breaker, retryable failures (timeouts, connection errors, 429/5xx) are
+    retried with jittered backoff, and other exceptions are raised at once without counting
+    against the breaker. When the breaker is open or a token is too far off the call fails
+    fast with an UpstreamUnavailable, so callers can fall back to a cached or stale result.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, timeout: float, retries: int):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+        self._counts = {outcome: 0 for outcome in
+                        ("success", "error", "retry", "circuit_open", "rate_limited", "fallback")}
+        self._lock = threading.Lock()
+
+    def _record(self, outcome: str):
+        UPSTREAM_CALLS.inc(provider=self.name, outcome=outcome)
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def record_fallback(self):
+        """Counts a call the caller answered from a fallback instead of this upstream."""
+        self._record("fallback")
+
+    def _admit(self) -> float:
+        """Checks the breaker and takes a token; returns how long to wait for the token."""
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._record("circuit_open")
+            raise
+        wait = self.bucket.reserve()
+        if wait > RATE_LIMIT_MAX_WAIT_SECONDS:
+            self.bucket.cancel()
+            # The upstream is never called, so this call must not hold the half-open probe.
+            self.breaker.release_probe()
+            self._record("rate_limited")
+            raise RateLimitedError(f"{self.name} rate limit: next slot in {wait:.1f}s")
+        return wait
+
+    def _on_error(self, exc: Exception, attempt: int) -> Optional[float]:
+        """Records a failed attempt; returns the backoff before retrying, or None to give up."""
+        if not is_retryable(exc):
+            # The upstream answered; the request itself was bad.
+            self.breaker.record_success()
+            self._record("error")
+            return None
+        self.breaker.record_failure()
+        if attempt >= self.retries:
+            self._record("error")
+            return None
+        self._record("retry")
+        return backoff_delay(attempt, getattr(exc, "retry_after", None))
+
+    def _on_success(self):
+        self.breaker.record_success()
+        self._record("success")
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """Runs a blocking call; func must apply self.timeout to its own I/O."""
+        attempt = 0
+        while True:
+            wait = self._admit()
+            if wait:
+                time.sleep(wait)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+            self._on_success()
+            return result
+
+    async def call_async(self, func: Callable, *args, **kwargs) -> Any:
+        """Awaits func(*args, **kwargs), cancelling attempts that take longer than self.timeout."""
+        attempt = 0
+        while True:
+            wait = self._admit()
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                result = await asyncio.wait_for(func(*args, **kwargs), self.timeout)
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled: the call has no outcome, but must not keep the probe slot.
+                self.breaker.release_probe()
+                raise
+            self._on_success()
+            return result
+
+    async def stream_async(self, open_stream: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """
+        Yields from the stream open_stream() returns. Opening the stream and waiting for its
+        first chunk are retried like call_async; once a chunk has been yielded a failure is
+        raised, since the consumer has already used part of the response. Each chunk must
+        arrive within self.timeout.
+        """
+        attempt = 0
+        while True:
+            wait = self._admit()
+            if wait:
+                await asyncio.sleep(wait)
+            stream = open_stream()
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                break
+            except StopAsyncIteration:
+                self._on_success()
+                return
+            except Exception as e:
+                await _close(stream)
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+            except BaseException:
+                self.breaker.release_probe()
+                await _close(stream)
+                raise
+
+        try:
+            yield first
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        except Exception as e:
+            self._on_error(e, self.retries)
+            raise
+        except BaseException:
+            # The consumer stopped early or was cancelled after the upstream had already
+            # answered, which is a success as far as the breaker is concerned.
+            self._on_success()
+            raise
+        finally:
+            await _close(stream)
+        self._on_success()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "state": self.breaker.state,
+            "open": int(self.breaker.state != "closed"),
+            "consecutive_failures": self.breaker.failures,
+            "times_opened": self.breaker.opened,
+            "tokens_available": round(self.bucket.available(), 2),
+            "rate_per_second": self.bucket.rate,
+            "timeout_seconds": self.timeout,
+            # Also exported as greenery_upstream_calls_total{provider,outcome}.
+            "calls": counts,
+        }
+
+
+async def _close(stream):
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+def _upstream_config(prefix: str, rate: float, burst: float, timeout: float, retries: int) -> Dict:
+    return {
+        "rate": float(os.getenv(f"{prefix}_RATE_PER_SECOND", str(rate))),
+        "burst": float(os.getenv(f"{prefix}_BURST", str(burst))),
+        "timeout": float(os.getenv(f"{prefix}_TIMEOUT_SECONDS", str(timeout))),
+        "retries": int(os.getenv(f"{prefix}_RETRIES", str(retries))),
+    }
+
+
+# Limits are per process; with several workers divide the provider's quota between them.
+UPSTREAMS = {
+    "maps": _upstream_config("MAPS", rate=50, burst=50, timeout=10, retries=2),
+    "weather": _upstream_config("WEATHER", rate=20, burst=20, timeout=5, retries=2),
+    "gemini_coverage": _upstream_config("GEMINI_COVERAGE", rate=10, burst=20, timeout=60, retries=2),
+    "gemini_recommendations": _upstream_config("GEMINI_RECOMMENDATIONS", rate=10, burst=20, timeout=90, retries=1),
+}
+
+_lock = threading.Lock()
+_upstreams: Dict[str, Upstream] = {}
+
+
+def get_upstream(name: str) -> Upstream:
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        with _lock:
+            upstream = _upstreams.get(name)
+            if upstream is None:
+                upstream = _upstreams[name] = Upstream(name, **UPSTREAMS[name])
+    return upstream
+
+
+def upstream_stats() -> Dict:
+    return {name: get_upstream(name).stats() for name in UPSTREAMS}
@@ -0,0 +1,41 @@
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import load_dotenv
+from pydantic import model_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+# Read .env into the environment once per process. Modules that read tuning constants with
+# os.getenv at import time see its values as long as this module is imported first (app.py
+# does); nothing else calls load_dotenv.
+load_dotenv()
+
+
+class Settings(BaseSettings):
+    """API keys, upstream endpoints and startup options, read from the environment once."""
+
+    model_config = SettingsConfigDict(extra="ignore")
+
+    google_maps_api_key: Optional[str] = None
+    google_api_key: Optional[str] = None
+    weatherapi_key: Optional[str] = None
+
+    google_maps_base_url: str = "https://maps.googleapis.com/maps/api/staticmap"
+    weatherapi_base_url: str = "http://api.weatherapi.com/v1/current.json"
+    # Point Gemini at another endpoint (e.g. the benchmark fakes) and/or use the REST transport.
+    gemini_api_endpoint: Optional[str] = None
+    gemini_transport: Optional[str] = None
+
+    # Import heavy modules and build model clients in the background after startup.
+    warmup: bool = True
+
+    @model_validator(mode="after")
+    def _default_transport(self) -> "Settings":
+        if not self.gemini_transport and self.gemini_api_endpoint:
+            self.gemini_transport = "rest"
+        return self
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()
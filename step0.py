@@ -1,57 +1,141 @@
-import requests
-from dotenv import load_dotenv
-import os
 
+from executor import run_blocking
+from clients import get_http_session, get_async_client
+from settings import get_settings
+from tile_cache import get_tile_cache, quantize
+from metrics import record_bytes, timed
+from resilience import check_status, get_upstream
+
+
+def _build_map_request(latitude, longitude, zoom, size):
+    settings = get_settings()
+    api_key = settings.google_maps_api_key
+
+    if not api_key:
+        raise ValueError("Google Maps API key not found. Set it in .env or pass explicitly.")
+
+    url = (
+        f"{settings.google_maps_base_url}?"
+        f"center={latitude},{longitude}&zoom={zoom}&size={size}&maptype=satellite&key={api_key}"
+    )
+    return url
+
+
+def _map_result(status, message, file_path, latitude, longitude, cached=False, stale=False):
+    result = {
+        "status": status,
+        "message": message,
+        "file_path": file_path,
+        "latitude": latitude,
+        "longitude": longitude,
+        "cached": cached,
+    }
+    if stale:
+        result["stale"] = True
+    return result
+
+
+def _lookup_tile(latitude, longitude, zoom, size):
+    cell_lat, cell_lon = quantize(latitude, longitude, zoom, size)
+    cache = get_tile_cache()
+    key = cache.make_key(cell_lat, cell_lon, zoom, size)
+    return cache, key, cell_lat, cell_lon, cache.get(key)
+
+
+def _handle_response(cache, key, status_code, content, cell_lat, cell_lon, zoom, size, latitude, longitude):
+    if status_code == 200:
+        file_path = cache.put(key, content, cell_lat, cell_lon, zoom, size)
+        return _map_result("success", "Map image saved successfully.", file_path, latitude, longitude)
+    return _map_result("error", f"Failed to download map: {status_code}", None, latitude, longitude)
+
+
+def _fallback_to_stale(cache, key, error, latitude, longitude):
+    """Serves an expired tile when Maps failed or is fast-failing; otherwise reports the error."""
+    stale_path = cache.get_stale(key)
+    if stale_path:
+        get_upstream("maps").record_fallback()
+        return _map_result(
+            "success", f"Map image served from stale cache ({error}).", stale_path, latitude, longitude,
+            cached=True, stale=True,
+        )
+    return _map_result("error", f"Failed to download map: {error}", None, latitude, longitude)
+
+
+def _fetch_tile(url):
+    response = get_http_session().get(url, timeout=get_upstream("maps").timeout)
+    record_bytes("google_maps", "received", len(response.content))
+    check_status(response)
+    return response
+
+
+async def _fetch_tile_async(url):
+    response = await get_async_client().get(url, timeout=get_upstream("maps").timeout)
+    record_bytes("google_maps", "received", len(response.content))
+    check_status(response)
+    return response
+
+
+@timed("download_static_map")
 def download_static_map(latitude, longitude, zoom=19, size="640x640"):
     """
     Downloads a static map image from Google Maps Static API.
 
+    The center is snapped to the tile cache grid, so repeat queries for the same
+    neighbourhood are served from disk without a network call. If Maps fails or its
+    circuit breaker is open, an expired tile for the cell is served instead (stale=True).
+
     Args:
         latitude (float): Latitude of the map center.
         longitude (float): Longitude of the map center.
         zoom (int): Zoom level.
         size (str): Image size in 'WIDTHxHEIGHT' format.
-        map_type (str): Map type ('roadmap', 'satellite', 'terrain', 'hybrid').
-        file_path (str): Path to save the image.
-        api_key (str): Google Maps API key. If None, loads from environment variable.
 
     Returns:
-        dict: Result with status, message, and file_path.
+        dict: Result with status, message, file_path and whether it was served from cache.
     """
-    
-    load_dotenv()
-    api_key = os.getenv("GOOGLE_MAPS_API_KEY")
+    cache, key, cell_lat, cell_lon, cached_path = _lookup_tile(latitude, longitude, zoom, size)
+    if cached_path:
+        return _map_result("success", "Map image served from cache.", cached_path, latitude, longitude, cached=True)
 
-    if not api_key:
-        raise ValueError("Google Maps API key not found. Set it in .env or pass explicitly.")
+    url = _build_map_request(cell_lat, cell_lon, zoom, size)
+    try:
+        response = get_upstream("maps").call(_fetch_tile, url)
+    except Exception as e:
+        return _fallback_to_stale(cache, key, e, latitude, longitude)
+    return _handle_response(
+        cache, key, response.status_code, response.content, cell_lat, cell_lon, zoom, size, latitude, longitude
+    )
 
-    url = (
-        f"https://maps.googleapis.com/maps/api/staticmap?"
-        f"center={latitude},{longitude}&zoom={zoom}&size={size}&maptype={"satellite"}&key={api_key}"
+
+@timed("download_static_map")
+async def download_static_map_async(latitude, longitude, zoom=19, size="640x640"):
+    """
+    Non-blocking variant of download_static_map for use inside the event loop.
+
+    Args:
+        latitude (float): Latitude of the map center.
+        longitude (float): Longitude of the map center.
+        zoom (int): Zoom level.
+        size (str): Image size in 'WIDTHxHEIGHT' format.
+
+    Returns:
+        dict: Result with status, message, file_path and whether it was served from cache.
+    """
+    cache, key, cell_lat, cell_lon, cached_path = await run_blocking(_lookup_tile, latitude, longitude, zoom, size)
+    if cached_path:
+        return _map_result("success", "Map image served from cache.", cached_path, latitude, longitude, cached=True)
+
+    url = _build_map_request(cell_lat, cell_lon, zoom, size)
+    try:
+        response = await get_upstream("maps").call_async(_fetch_tile_async, url)
+    except Exception as e:
+        return await run_blocking(_fallback_to_stale, cache, key, e, latitude, longitude)
+    return await run_blocking(
+        _handle_response,
+        cache, key, response.status_code, response.content, cell_lat, cell_lon, zoom, size, latitude, longitude
     )
-    os.makedirs("files", exist_ok=True)
-    file_path = f"files/static_map-{latitude}-{longitude}.png"
-    response = requests.get(url)
-    if response.status_code == 200:
-        with open(file_path, "wb") as f:
-            f.write(response.content)
-        return {
-            "status": "success",
-            "message": "Map image saved successfully.",
-            "file_path": file_path,
-            "latitude": latitude,
-            "longitude": longitude,
-        }
-    else:
-        return {
-            "status": "error",
-            "message": f"Failed to download map: {response.status_code}",
-            "file_path": None,
-            "latitude": latitude,
-            "longitude": longitude,
-        }
-
-
-# result = download_static_map(25.5941, 85.1376, file_path="static_map.png")
+
+
+# result = download_static_map(25.5941, 85.1376)
 # print(result)
-# This will download a static map centered at the specified latitude and longitude, save it as 'static_map.png', and print the result.
\ No newline at end of file
+# This will download a static map centered at the specified latitude and longitude, cache it under 'files/tiles/', and print the result.
@@ -1,12 +1,19 @@
 import os
 import re
 import json
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+import hashlib
+import asyncio
 
+from executor import run_blocking
+from clients import get_genai_model, generate_content_async
+from coverage_cache import get_coverage_cache, image_hash
+from coverage_engine import CLASS_FIELDS, estimate_coverage, compare_coverage
+from image_prep import PrepOptions, prepare_for_vision
+from uploads import UPLOAD_JPEG_QUALITY, UPLOAD_MAX_SIDE
+from llm_batch import LLM_BATCHING, MicroBatcher
+from metrics import record_bytes, timed
+from settings import get_settings
+from resilience import get_upstream, is_unavailable
 
 
 def get_mime_type(file_path):
@@ -23,29 +30,70 @@ def get_mime_type(file_path):
         return mime_types[extension]
     raise ValueError(f"Unsupported file format '{extension}'. Supported formats: {', '.join(mime_types.keys())}")
 
-def caption_image(image_path, prompt="Caption this image.", api_key=None):
-    try:
-        if api_key is None:
-            api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("Google API key not found. Set it in .env or pass explicitly.")
+def _get_api_key(api_key):
+    if api_key is None:
+        api_key = get_settings().google_api_key
+    if not api_key:
+        raise ValueError("Google API key not found. Set it in .env or pass explicitly.")
+    return api_key
 
-        genai.configure(api_key=api_key)
+def _read_image(image_path):
+    with open(image_path, "rb") as img_file:
+        return img_file.read()
 
-        with open(image_path, "rb") as img_file:
-            image_data = img_file.read()
-
-        mime_type = get_mime_type(image_path)
+COVERAGE_MODEL = "gemini-2.5-flash"
 
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content([
+@timed("caption_image")
+def caption_image_data(image_data, mime_type, prompt="Caption this image.", api_key=None):
+    try:
+        model = get_genai_model(COVERAGE_MODEL, _get_api_key(api_key))
+        upstream = get_upstream("gemini_coverage")
+        response = upstream.call(model.generate_content, [
             {"mime_type": mime_type, "data": image_data},
             prompt
-        ])
+        ], request_options={"timeout": upstream.timeout})
+        record_bytes("gemini", "sent", len(image_data) + len(prompt.encode()))
+        record_bytes("gemini", "received", len(response.text.encode()))
         return response.text
 
     except Exception as e:
-        raise RuntimeError(f"Captioning failed: {e}")
+        raise RuntimeError(f"Captioning failed: {e}") from e
+
+async def _generate_caption_async(contents, sent_bytes, api_key):
+    try:
+        model = get_genai_model(COVERAGE_MODEL, _get_api_key(api_key))
+        upstream = get_upstream("gemini_coverage")
+        response = await upstream.call_async(
+            generate_content_async, model, contents, request_options={"timeout": upstream.timeout}
+        )
+        record_bytes("gemini", "sent", sent_bytes)
+        record_bytes("gemini", "received", len(response.text.encode()))
+        return response.text
+
+    except Exception as e:
+        raise RuntimeError(f"Captioning failed: {e}") from e
+
+@timed("caption_image")
+async def caption_image_data_async(image_data, mime_type, prompt="Caption this image.", api_key=None):
+    contents = [{"mime_type": mime_type, "data": image_data}, prompt]
+    return await _generate_caption_async(contents, len(image_data) + len(prompt.encode()), api_key)
+
+@timed("caption_image_batch")
+async def caption_images_data_async(images, prompt, api_key=None):
+    """Sends several (image_data, mime_type) pairs in one request, each preceded by an "Image <n>:" label."""
+    contents = []
+    for index, (image_data, mime_type) in enumerate(images, 1):
+        contents += [f"Image {index}:", {"mime_type": mime_type, "data": image_data}]
+    contents.append(prompt)
+    sent_bytes = sum(len(image_data) for image_data, _ in images) + len(prompt.encode())
+    return await _generate_caption_async(contents, sent_bytes, api_key)
+
+def caption_image(image_path, prompt="Caption this image.", api_key=None):
+    return caption_image_data(_read_image(image_path), get_mime_type(image_path), prompt, api_key)
+
+async def caption_image_async(image_path, prompt="Caption this image.", api_key=None):
+    image_data = await run_blocking(_read_image, image_path)
+    return await caption_image_data_async(image_data, get_mime_type(image_path), prompt, api_key)
 
 def extract_json_from_caption(caption):
     try:
@@ -60,8 +108,7 @@ def extract_json_from_caption(caption):
     except Exception as e:
         raise RuntimeError(f"Error extracting JSON: {e}")
 
-def generate_coverage_details(image_path="files/static_map.png", latitude=None, longitude=None):
-    prompt = """From this image, estimate the land coverage percentages and return the result in valid JSON format. The JSON must match the following schema:
+COVERAGE_PROMPT = """From this image, estimate the land coverage percentages and return the result in valid JSON format. The JSON must match the following schema:
 {
   "vegetation_coverage": float,
   "building_coverage": float,
@@ -72,20 +119,225 @@ def generate_coverage_details(image_path="files/static_map.png", latitude=None,
 Only return the JSON object. Do not include any explanation or extra text. All values should be in percentage format as floats (e.g., 23.5).
 """
 
+COVERAGE_BATCH_PROMPT = """Each image above is preceded by its label ("Image 1:", "Image 2:", ...). For every image, estimate the land coverage percentages and return the results in valid JSON format as an array with one object per image, in label order. Each object must match the following schema:
+{
+  "image": int,
+  "vegetation_coverage": float,
+  "building_coverage": float,
+  "road_coverage": float,
+  "empty_land": float,
+  "water_body": float
+}
+Only return the JSON array. Do not include any explanation or extra text. All values should be in percentage format as floats (e.g., 23.5).
+"""
+
+def extract_json_list_from_caption(caption, count):
+    """
+    Splits a batched coverage answer into one estimate per image, in label order.
+
+    Images the answer skipped or described with missing or non-numeric fields are None.
+    """
+    results = [None] * count
+    match = re.search(r"```(?:json)?\s*(\[.*\])\s*```", caption, re.DOTALL)
+    match = match or re.search(r"(\[.*\])", caption, re.DOTALL)
+    if not match:
+        return results
+    try:
+        entries = json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return results
+    for position, entry in enumerate(entries if isinstance(entries, list) else []):
+        if not isinstance(entry, dict):
+            continue
+        index = entry.get("image", position + 1)
+        if not isinstance(index, int) or not 1 <= index <= count:
+            continue
+        if all(isinstance(entry.get(field), (int, float)) for field in CLASS_FIELDS):
+            results[index - 1] = {field: float(entry[field]) for field in CLASS_FIELDS}
+    return results
+
+# Changing the prompts (single or batched), model or the view the model is sent (VISION_*,
+# and for uploads the UPLOAD_* downscaling) changes this version, so stale cached estimates
+# are not reused.
+COVERAGE_PROMPT_VERSION = hashlib.sha256(
+    f"{COVERAGE_MODEL}\n{COVERAGE_PROMPT}\n{COVERAGE_BATCH_PROMPT}\n{PrepOptions().version}\n"
+    f"{UPLOAD_MAX_SIDE}:{UPLOAD_JPEG_QUALITY}".encode()
+).hexdigest()[:16]
+
+# "llm" asks Gemini, "local" runs the on-CPU segmentation engine, and "crosscheck" runs
+# both, returns the LLM estimate and reports how far the local engine disagrees.
+COVERAGE_BACKEND = os.getenv("COVERAGE_BACKEND", "llm")
+COVERAGE_BACKENDS = ("llm", "local", "crosscheck")
+# What the "llm" backend does when Gemini is unavailable (retries exhausted, breaker open or
+# rate limited): "local" answers with the local engine, "none" returns the error.
+COVERAGE_FALLBACK = os.getenv("COVERAGE_FALLBACK", "local")
+
+def _coverage_result(parsed_json, backend, cached=False):
+    return {
+        "status": "success",
+        "message": "Coverage details served from cache." if cached else "Coverage details extracted successfully.",
+        "caption": parsed_json,
+        "backend": backend,
+        "cached": cached,
+    }
+
+def _coverage_error(e):
+    return {
+        "status": "error",
+        "message": str(e),
+        "caption": None
+    }
+
+def _resolve_backend(backend):
+    backend = backend or COVERAGE_BACKEND
+    if backend not in COVERAGE_BACKENDS:
+        raise ValueError(f"Unknown coverage backend '{backend}'. Supported backends: {', '.join(COVERAGE_BACKENDS)}")
+    return backend
+
+def _lookup_coverage(image_data, digest=None):
+    digest = digest or image_hash(image_data)
+    return digest, get_coverage_cache().get(digest, COVERAGE_PROMPT_VERSION)
+
+def _store_coverage(digest, parsed_json):
+    get_coverage_cache().put(digest, COVERAGE_PROMPT_VERSION, parsed_json)
+
+@timed("local_coverage")
+def _local_coverage(image_data):
+    try:
+        return _coverage_result(estimate_coverage(image_data), "local")
+    except Exception as e:
+        return _coverage_error(f"Local coverage estimation failed: {e}")
+
+def _fallback_coverage(error, local_result):
+    """Marks a local estimate that stands in for an unavailable LLM; local errors keep the LLM error."""
+    if local_result["status"] == "error":
+        return _coverage_error(error)
+    get_upstream("gemini_coverage").record_fallback()
+    return {
+        **local_result,
+        "message": f"LLM unavailable ({error}); coverage estimated locally.",
+        "fallback": "local",
+    }
+
+def _should_fall_back(error, fallback):
+    return fallback and COVERAGE_FALLBACK == "local" and is_unavailable(error)
+
+def _crosscheck(llm_result, local_result):
+    if llm_result["status"] == "error":
+        if local_result["status"] == "error":
+            return llm_result
+        return {**local_result, "crosscheck": {"llm_error": llm_result["message"]}}
+    if local_result["status"] == "error":
+        return {**llm_result, "crosscheck": {"local_error": local_result["message"]}}
+    return {
+        **llm_result,
+        "crosscheck": {
+            "local": local_result["caption"],
+            **compare_coverage(llm_result["caption"], local_result["caption"]),
+        },
+    }
+
+async def _coverage_one_async(image):
+    image_data, mime_type = image
+    return extract_json_from_caption(await caption_image_data_async(image_data, mime_type, prompt=COVERAGE_PROMPT))
+
+async def _coverage_batch_async(images):
+    return extract_json_list_from_caption(await caption_images_data_async(images, COVERAGE_BATCH_PROMPT), len(images))
+
+_coverage_batcher = None
+
+def get_coverage_batcher():
+    global _coverage_batcher
+    if _coverage_batcher is None:
+        _coverage_batcher = MicroBatcher("coverage", _coverage_batch_async, _coverage_one_async)
+    return _coverage_batcher
+
+async def _caption_coverage_async(image_data, mime_type):
+    """Coverage JSON for one image; with LLM_BATCHING on, concurrent images share one call."""
+    if LLM_BATCHING:
+        return await get_coverage_batcher().submit((image_data, mime_type))
+    return await _coverage_one_async((image_data, mime_type))
+
+def _llm_coverage(image_data, mime_type, digest=None, fallback=True, vision=None):
     try:
-        caption = caption_image(image_path, prompt=prompt)
+        digest, cached = _lookup_coverage(image_data, digest)
+        if cached:
+            return _coverage_result(cached, "llm", cached=True)
+        vision = vision or prepare_for_vision(image_data, mime_type)
+        caption = caption_image_data(vision.data, vision.mime_type, prompt=COVERAGE_PROMPT)
         parsed_json = extract_json_from_caption(caption)
-        return {
-            "status": "success",
-            "message": "Coverage details extracted successfully.",
-            "caption": parsed_json
-        }
+        _store_coverage(digest, parsed_json)
+        return _coverage_result(parsed_json, "llm")
+    except Exception as e:
+        if _should_fall_back(e, fallback):
+            return _fallback_coverage(e, _local_coverage(image_data))
+        return _coverage_error(e)
+
+async def _llm_coverage_async(image_data, mime_type, digest=None, fallback=True, vision=None):
+    try:
+        digest, cached = await run_blocking(_lookup_coverage, image_data, digest)
+        if cached:
+            return _coverage_result(cached, "llm", cached=True)
+        vision = vision or await run_blocking(prepare_for_vision, image_data, mime_type)
+        parsed_json = await _caption_coverage_async(vision.data, vision.mime_type)
+        await run_blocking(_store_coverage, digest, parsed_json)
+        return _coverage_result(parsed_json, "llm")
+    except Exception as e:
+        if _should_fall_back(e, fallback):
+            return _fallback_coverage(e, await run_blocking(_local_coverage, image_data))
+        return _coverage_error(e)
+
+def generate_coverage_details_from_data(image_data, mime_type, backend=None, digest=None, vision=None):
+    """
+    Estimates land coverage from in-memory image bytes.
+
+    digest may be passed when the caller already hashed the image (e.g. while receiving
+    an upload); it is used as the coverage cache key instead of rehashing the bytes.
+    vision may carry the view for the model when the caller already prepared it from the
+    decoded image (uploads.prepare_image), so the image is not decoded and encoded again.
+    """
+    try:
+        backend = _resolve_backend(backend)
+    except ValueError as e:
+        return _coverage_error(e)
+    if backend == "local":
+        return _local_coverage(image_data)
+    if backend == "crosscheck":
+        return _crosscheck(
+            _llm_coverage(image_data, mime_type, digest, fallback=False, vision=vision), _local_coverage(image_data)
+        )
+    return _llm_coverage(image_data, mime_type, digest, vision=vision)
+
+async def generate_coverage_details_from_data_async(image_data, mime_type, backend=None, digest=None, vision=None):
+    try:
+        backend = _resolve_backend(backend)
+    except ValueError as e:
+        return _coverage_error(e)
+    if backend == "local":
+        return await run_blocking(_local_coverage, image_data)
+    if backend == "crosscheck":
+        llm_result, local_result = await asyncio.gather(
+            _llm_coverage_async(image_data, mime_type, digest, fallback=False, vision=vision),
+            run_blocking(_local_coverage, image_data),
+        )
+        return _crosscheck(llm_result, local_result)
+    return await _llm_coverage_async(image_data, mime_type, digest, vision=vision)
+
+def generate_coverage_details(image_path="files/static_map.png", latitude=None, longitude=None, backend=None):
+    try:
+        image_data = _read_image(image_path)
+        mime_type = get_mime_type(image_path)
+    except Exception as e:
+        return _coverage_error(e)
+    return generate_coverage_details_from_data(image_data, mime_type, backend=backend)
+
+async def generate_coverage_details_async(image_path="files/static_map.png", latitude=None, longitude=None, backend=None):
+    try:
+        image_data = await run_blocking(_read_image, image_path)
+        mime_type = get_mime_type(image_path)
     except Exception as e:
-        return {
-            "status": "error",
-            "message": str(e),
-            "caption": None
-        }
+        return _coverage_error(e)
+    return await generate_coverage_details_from_data_async(image_data, mime_type, backend=backend)
 
 # Example usage:
 # result = generate_coverage_details()
@@ -1,18 +1,28 @@
 # Imports and setup
 import os
-import requests
+import re
 import json
-from typing import Dict, List, Optional
+import time
+import hashlib
+from typing import AsyncIterator, Dict, List, Optional
 from dataclasses import dataclass
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import BaseOutputParser
-import google.generativeai as genai
-from dotenv import load_dotenv
 from datetime import datetime
-import pytz
 
-# Load environment variables from .env file
-load_dotenv()
+from clients import get_http_session, get_async_client, get_genai_model, generate_content_async, stream_content_async
+from weather_cache import WeatherCache
+from recommendation_cache import feature_key, get_recommendation_cache
+from executor import run_blocking
+from gazetteer import get_gazetteer
+from metrics import record_bytes, record_stage, timed
+from settings import get_settings
+from resilience import check_status, get_upstream, is_unavailable
+from llm_batch import LLM_BATCHING, MicroBatcher
+from plant_catalog import get_plant_catalog
+
+# "llm" asks Gemini for the plants; "catalog" ranks the bundled plant catalog without any LLM
+# call; "enriched" ranks the catalog and only asks Gemini to rewrite the reasons and care notes.
+RECOMMENDATION_BACKEND = os.getenv("RECOMMENDATION_BACKEND", "llm")
+RECOMMENDATION_BACKENDS = ("llm", "catalog", "enriched")
 
 # Data structures
 @dataclass
@@ -36,6 +46,8 @@ class SeasonData:
     day_of_year: int
     is_growing_season: bool
     planting_season: str
+    climate_zone: Optional[str] = None
+    hemisphere: Optional[str] = None
 
 @dataclass
 class LandCoverageData:
@@ -52,7 +64,7 @@ class LocationData:
     city: str
     country: str
 
-class PlantRecommendationParser(BaseOutputParser):
+class PlantRecommendationParser:
     def parse(self, text: str) -> Dict:
         try:
             lines = text.strip().split('\n')
@@ -82,51 +94,154 @@ class PlantRecommendationParser(BaseOutputParser):
                 'error': str(e)
             }
 
+class IncrementalRecommendationParser:
+    """
+    Parses Plant:/Reason:/Care: blocks from text that arrives in pieces.
+
+    Only complete lines are interpreted, using the same rules as PlantRecommendationParser.
+    A plant is emitted as soon as its Care line ends (or the next Plant line starts, or
+    the text is closed), so a client can show it while the rest is still generating.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._current: Dict = {}
+        self.recommendations: List[Dict] = []
+
+    @staticmethod
+    def _field(line: str) -> Optional[str]:
+        for field in ("Plant", "Reason", "Care"):
+            if line.startswith(f"{field}:") or line.startswith(f"**{field}:"):
+                return field
+        return None
+
+    def _flush(self) -> List[Dict]:
+        if not self._current:
+            return []
+        plant, self._current = self._current, {}
+        self.recommendations.append(plant)
+        return [plant]
+
+    def _parse_line(self, line: str) -> List[Dict]:
+        line = line.strip()
+        field = self._field(line)
+        if field is None:
+            return []
+        value = line.split(':', 1)[1].strip().replace('**', '')
+        if field == "Plant":
+            emitted = self._flush()
+            self._current = {'name': value}
+            return emitted
+        if not self._current:
+            return []
+        self._current[field.lower()] = value
+        return self._flush() if field == "Care" else []
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Adds streamed text and returns the plants completed by it."""
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split('\n')
+        emitted = []
+        for line in lines:
+            emitted.extend(self._parse_line(line))
+        return emitted
+
+    def close(self) -> List[Dict]:
+        """Parses the trailing partial line and returns any plant still being built."""
+        emitted = self._parse_line(self._buffer)
+        self._buffer = ""
+        return emitted + self._flush()
+
 class WeatherService:
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.base_url = "http://api.weatherapi.com/v1/current.json"
+        self.base_url = get_settings().weatherapi_base_url
+
+    def _parse_weather(self, data: Dict) -> WeatherData:
+        current = data['current']
+        location = data['location']
+
+        return WeatherData(
+            temperature=current['temp_c'],
+            humidity=current['humidity'],
+            pressure=current['pressure_mb'],
+            weather_description=current['condition']['text'],
+            wind_speed=current['wind_kph'] / 3.6,
+            precipitation=current['precip_mm'],
+            feels_like=current['feelslike_c'],
+            uv_index=current['uv'],
+            visibility=current['vis_km'],
+            local_time=location['localtime'],
+            timezone=location['tz_id']
+        )
 
     def get_weather_data(self, city: str) -> Optional[WeatherData]:
+        return get_weather_cache().get_or_fetch(city, self._fetch_weather_data)
+
+    async def get_weather_data_async(self, city: str) -> Optional[WeatherData]:
+        return await get_weather_cache().get_or_fetch_async(city, self._fetch_weather_data_async)
+
+    def _request_weather(self, city: str) -> Dict:
+        params = {'key': self.api_key, 'q': city, 'aqi': 'no'}
+        response = get_http_session().get(self.base_url, params=params, timeout=get_upstream("weather").timeout)
+        record_bytes("weatherapi", "received", len(response.content))
+        check_status(response)
+        response.raise_for_status()
+        return response.json()
+
+    async def _request_weather_async(self, city: str) -> Dict:
+        params = {'key': self.api_key, 'q': city, 'aqi': 'no'}
+        response = await get_async_client().get(self.base_url, params=params, timeout=get_upstream("weather").timeout)
+        record_bytes("weatherapi", "received", len(response.content))
+        check_status(response)
+        response.raise_for_status()
+        return response.json()
+
+    @timed("get_weather_data", none_is_error=True)
+    def _fetch_weather_data(self, city: str) -> Optional[WeatherData]:
         try:
-            params = {'key': self.api_key, 'q': city, 'aqi': 'no'}
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-
-            data = response.json()
-            current = data['current']
-            location = data['location']
-
-            return WeatherData(
-                temperature=current['temp_c'],
-                humidity=current['humidity'],
-                pressure=current['pressure_mb'],
-                weather_description=current['condition']['text'],
-                wind_speed=current['wind_kph'] / 3.6,
-                precipitation=current['precip_mm'],
-                feels_like=current['feelslike_c'],
-                uv_index=current['uv'],
-                visibility=current['vis_km'],
-                local_time=location['localtime'],
-                timezone=location['tz_id']
-            )
+            return self._parse_weather(get_upstream("weather").call(self._request_weather, city))
         except Exception as e:
             print(f"Error fetching weather data: {e}")
             return None
 
+    @timed("get_weather_data", none_is_error=True)
+    async def _fetch_weather_data_async(self, city: str) -> Optional[WeatherData]:
+        try:
+            return self._parse_weather(await get_upstream("weather").call_async(self._request_weather_async, city))
+        except Exception as e:
+            print(f"Error fetching weather data: {e}")
+            return None
+
+_weather_cache = None
+
+def get_weather_cache() -> WeatherCache:
+    global _weather_cache
+    if _weather_cache is None:
+        _weather_cache = WeatherCache(factory=WeatherData, on_stale=get_upstream("weather").record_fallback)
+    return _weather_cache
+
 class SeasonService:
     @staticmethod
-    def determine_season(date_str: str, timezone_str: str, latitude: float = 0, city: str = "", country: str = "") -> SeasonData:
+    def determine_season(
+        date_str: str,
+        timezone_str: str,
+        latitude: Optional[float] = 0,
+        city: str = "",
+        country: str = "",
+        longitude: Optional[float] = None,
+    ) -> SeasonData:
         try:
             local_time = datetime.strptime(date_str, '%Y-%m-%d %H:%M')
             month = local_time.month
             day_of_year = local_time.timetuple().tm_yday
-            is_southern = latitude < 0
+            # The wet season comes from the local climate (nearest known city), not the country name.
+            climate = get_gazetteer().climate_for(city, country, latitude, longitude)
+            is_southern = climate.hemisphere == "southern"
             season = "Unknown"
             planting = "Season-appropriate planting recommended"
 
-            is_tropical_region = country.lower() in ["india", "bangladesh", "sri lanka", "nepal", "pakistan"]
-            if is_tropical_region and month in [6, 7, 8, 9]:
+            if climate.is_wet_month(month):
                 season = "Rainy"
                 planting = "Excellent for rice, sugarcane, tropical fruits, and water-loving plants"
             else:
@@ -159,30 +274,36 @@ class SeasonService:
                     planting = "Indoor planting or dormant season preparations"
 
             is_growing = season in ["Spring", "Summer", "Rainy"]
-            return SeasonData(season, month, day_of_year, is_growing, planting)
+            return SeasonData(
+                season, month, day_of_year, is_growing, planting,
+                climate_zone=climate.koppen or climate.zone, hemisphere=climate.hemisphere,
+            )
 
         except Exception as e:
             print(f"Error determining season: {e}")
             return SeasonData("Unknown", datetime.now().month, datetime.now().timetuple().tm_yday, True, "Season-appropriate planting recommended")
 
     @staticmethod
-    def get_location_coordinates(city: str, country: str) -> tuple:
-        coordinates = {
-            "lucknow": (26.8467, 80.9462),
-            "delhi": (28.7041, 77.1025),
-            "mumbai": (19.0760, 72.8777),
-            "bangalore": (12.9716, 77.5946),
-            "london": (51.5074, -0.1278),
-            "new york": (40.7128, -74.0060),
-            "sydney": (-33.8688, 151.2093)
-        }
-        return coordinates.get(city.lower(), (26.8467, 80.9462))
+    def get_location_coordinates(city: str, country: str) -> Optional[tuple]:
+        """
+        Looks a city up in the bundled gazetteer.
+
+        Returns:
+            Optional[tuple]: (latitude, longitude), or None if the city is not known.
+        """
+        place = get_gazetteer().lookup(city, country)
+        if place is None:
+            return None
+        return place.latitude, place.longitude
 
 class PlantRecommendationSystem:
     def __init__(self, weatherapi_key: str, gemini_api_key: str):
+        # langchain_core takes a noticeable share of startup; only the prompt needs it.
+        from langchain_core.prompts import PromptTemplate
+
         self.weather_service = WeatherService(weatherapi_key)
-        genai.configure(api_key=gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.model_name = 'gemini-1.5-flash'
+        self.model = get_genai_model(self.model_name, gemini_api_key)
 
         self.prompt_template = PromptTemplate(
             input_variables=[
@@ -223,6 +344,484 @@ class PlantRecommendationSystem:
             """
         )
         self.parser = PlantRecommendationParser()
+        # Cached recommendations are tied to the exact template and model that produced them.
+        self.template_version = hashlib.sha256(
+            f"{self.model_name}\n{self.prompt_template.template}".encode()
+        ).hexdigest()[:16]
+
+_plant_systems: Dict[tuple, PlantRecommendationSystem] = {}
+
+def get_plant_system() -> PlantRecommendationSystem:
+    """Returns the shared PlantRecommendationSystem for the configured API keys."""
+    settings = get_settings()
+    keys = (settings.weatherapi_key, settings.google_api_key)
+    plant_system = _plant_systems.get(keys)
+    if plant_system is None:
+        plant_system = _plant_systems[keys] = PlantRecommendationSystem(*keys)
+    return plant_system
+
+def _report_error(message: str) -> Dict:
+    return {
+        "status": "error",
+        "message": message,
+        "response": None,
+    }
+
+def _check_inputs(coverage_details: Dict) -> Optional[str]:
+    settings = get_settings()
+    if RECOMMENDATION_BACKEND not in RECOMMENDATION_BACKENDS:
+        return (
+            f"Unknown recommendation backend '{RECOMMENDATION_BACKEND}'. "
+            f"Supported backends: {', '.join(RECOMMENDATION_BACKENDS)}"
+        )
+    if RECOMMENDATION_BACKEND == "catalog":
+        if not settings.weatherapi_key:
+            return "API key not found. Please set WEATHERAPI_KEY in your .env file."
+    elif not settings.weatherapi_key or not settings.google_api_key:
+        return "API keys not found. Please set WEATHERAPI_KEY and GOOGLE_API_KEY in your .env file."
+    if not coverage_details:
+        return "Coverage details not provided."
+    return None
+
+def build_land_coverage(coverage_details: Dict) -> LandCoverageData:
+    land_coverage = LandCoverageData(
+        vegetation_coverage=coverage_details.get("vegetation_coverage", 0.0),
+        building_coverage=coverage_details.get("building_coverage", 0.0),
+        road_coverage=coverage_details.get("road_coverage", 0.0),
+        empty_land=coverage_details.get("empty_land", 0.0),
+        water_body=coverage_details.get("water_body", 0.0),
+    )
+
+    total_coverage = (
+        land_coverage.vegetation_coverage +
+        land_coverage.building_coverage +
+        land_coverage.road_coverage +
+        land_coverage.empty_land +
+        land_coverage.water_body
+    )
+
+    if abs(total_coverage - 100) > 1:
+        raise ValueError(f"Land coverage percentages must sum to 100%. Provided sum: {total_coverage}%")
+    return land_coverage
+
+def _build_prompt(
+    plant_system: PlantRecommendationSystem,
+    weather_data: WeatherData,
+    land_coverage: LandCoverageData,
+    season_data: SeasonData,
+    city: str,
+    country: str,
+) -> str:
+    return plant_system.prompt_template.format(
+        temperature=weather_data.temperature,
+        humidity=weather_data.humidity,
+        weather_description=weather_data.weather_description,
+        wind_speed=weather_data.wind_speed,
+        precipitation=weather_data.precipitation,
+        feels_like=weather_data.feels_like,
+        uv_index=weather_data.uv_index,
+        visibility=weather_data.visibility,
+        vegetation_coverage=land_coverage.vegetation_coverage,
+        building_coverage=land_coverage.building_coverage,
+        road_coverage=land_coverage.road_coverage,
+        empty_land=land_coverage.empty_land,
+        water_body=land_coverage.water_body,
+        city=city,
+        country=country,
+        season=season_data.season,
+        planting_season=season_data.planting_season
+    )
+
+@timed("generate_content")
+def _generate_recommendations(plant_system: PlantRecommendationSystem, prompt: str) -> str:
+    upstream = get_upstream("gemini_recommendations")
+    response = upstream.call(plant_system.model.generate_content, prompt, request_options={"timeout": upstream.timeout})
+    record_bytes("gemini", "sent", len(prompt.encode()))
+    record_bytes("gemini", "received", len(response.text.encode()))
+    return response.text
+
+@timed("generate_content")
+async def _generate_recommendations_async(plant_system: PlantRecommendationSystem, prompt: str) -> str:
+    upstream = get_upstream("gemini_recommendations")
+    response = await upstream.call_async(
+        generate_content_async, plant_system.model, prompt, request_options={"timeout": upstream.timeout}
+    )
+    record_bytes("gemini", "sent", len(prompt.encode()))
+    record_bytes("gemini", "received", len(response.text.encode()))
+    return response.text
+
+BATCH_PROMPT_HEADER = (
+    "Answer each of the {count} independent requests below completely, in the format that request asks for. "
+    "Answer them in order and start the answer to each one with a line '=== RESPONSE <number> ===' "
+    "giving the number of the request it answers.\n\n"
+)
+BATCH_RESPONSE_MARKER = re.compile(r"^[\s*#]*=+\s*RESPONSE\s+(\d+)\s*=+[\s*]*$", re.MULTILINE)
+
+def build_batch_prompt(prompts: List[str]) -> str:
+    requests = "\n\n".join(f"=== REQUEST {index} ===\n{prompt.strip()}" for index, prompt in enumerate(prompts, 1))
+    return BATCH_PROMPT_HEADER.format(count=len(prompts)) + requests
+
+def split_batch_response(text: str, count: int) -> List[Optional[str]]:
+    """Splits a batched answer at its RESPONSE markers; requests without an answer are None."""
+    answers: List[Optional[str]] = [None] * count
+    markers = list(BATCH_RESPONSE_MARKER.finditer(text))
+    for marker, following in zip(markers, markers[1:] + [None]):
+        index = int(marker.group(1))
+        body = text[marker.end():following.start() if following else len(text)].strip()
+        if 1 <= index <= count and body:
+            answers[index - 1] = body
+    return answers
+
+@timed("generate_content_batch")
+async def _generate_recommendations_batch_async(
+    plant_system: PlantRecommendationSystem, prompts: List[str]
+) -> List[Optional[str]]:
+    text = await _generate_recommendations_async(plant_system, build_batch_prompt(prompts))
+    return split_batch_response(text, len(prompts))
+
+async def _recommend_one_async(prompt: str) -> Dict:
+    plant_system = get_plant_system()
+    return plant_system.parser.parse(await _generate_recommendations_async(plant_system, prompt))
+
+async def _recommend_batch_async(prompts: List[str]) -> List[Optional[Dict]]:
+    plant_system = get_plant_system()
+    results = []
+    for answer in await _generate_recommendations_batch_async(plant_system, prompts):
+        parsed_result = plant_system.parser.parse(answer) if answer else None
+        # An answer with no plants in it is re-asked on its own rather than returned empty.
+        results.append(parsed_result if parsed_result and parsed_result["recommendations"] else None)
+    return results
+
+_recommendation_batcher = None
+
+def get_recommendation_batcher() -> MicroBatcher:
+    global _recommendation_batcher
+    if _recommendation_batcher is None:
+        _recommendation_batcher = MicroBatcher("recommendations", _recommend_batch_async, _recommend_one_async)
+    return _recommendation_batcher
+
+async def _recommend_async(prompt: str) -> Dict:
+    """Parsed recommendations for one prompt; with LLM_BATCHING on, concurrent prompts share one call."""
+    if LLM_BATCHING:
+        return await get_recommendation_batcher().submit(prompt)
+    return await _recommend_one_async(prompt)
+
+ENRICHMENT_PROMPT = """
+You are an expert botanist and landscape designer. The plants below have already been chosen for a site in
+{city}, {country}. Conditions: {season} season, {temperature}°C, {humidity}% humidity, {precipitation} mm
+precipitation; land coverage {vegetation_coverage}% vegetation, {building_coverage}% buildings, {road_coverage}%
+roads, {empty_land}% empty land and {water_body}% water.
+
+For each plant, in the order given, explain in two or three sentences why it suits this site and give practical
+care instructions. Do not add, remove, rename or reorder plants.
+
+{plants}
+
+Please provide the answer in the following format for each plant:
+
+Plant: [Plant Name]
+Reason: [Why this plant is suitable for these conditions]
+Care: [Basic care instructions]
+"""
+
+def _catalog_picks(weather_data: WeatherData, land_coverage: LandCoverageData, season_data: SeasonData) -> List[Dict]:
+    return get_plant_catalog().recommend(weather_data, season_data, land_coverage)
+
+def _build_enrichment_prompt(
+    picks: List[Dict],
+    weather_data: WeatherData,
+    land_coverage: LandCoverageData,
+    season_data: SeasonData,
+    city: str,
+    country: str,
+) -> str:
+    plants = "\n".join(f"{index}. {pick['name']}: {pick['reason']}" for index, pick in enumerate(picks, 1))
+    return ENRICHMENT_PROMPT.format(
+        city=city, country=country, season=season_data.season, temperature=weather_data.temperature,
+        humidity=weather_data.humidity, precipitation=weather_data.precipitation, plants=plants,
+        **land_coverage.__dict__,
+    )
+
+def _enrich(pick: Dict, enriched: Optional[Dict]) -> Dict:
+    """A catalog pick with the model's reason and care text, where it gave them; the name always stays."""
+    plant = dict(pick)
+    for field in ("reason", "care"):
+        if enriched and enriched.get(field):
+            plant[field] = enriched[field]
+    return plant
+
+def _enrich_all(picks: List[Dict], parsed_result: Optional[Dict]) -> Dict:
+    """Merges parsed model output into the picks by position; without output the catalog text is kept."""
+    enriched = (parsed_result or {}).get("recommendations", [])
+    return {
+        "recommendations": [
+            _enrich(pick, enriched[index] if index < len(enriched) else None) for index, pick in enumerate(picks)
+        ]
+    }
+
+def _recommendation_version(plant_system: PlantRecommendationSystem) -> str:
+    """Cache version for the configured backend; enriched entries also depend on the prompt and the catalog."""
+    if RECOMMENDATION_BACKEND != "enriched":
+        return plant_system.template_version
+    return hashlib.sha256(
+        f"{plant_system.template_version}\n{ENRICHMENT_PROMPT}\n{get_plant_catalog().version}".encode()
+    ).hexdigest()[:16]
+
+def _stale_recommendations(cache, cache_key: str, version: str, error: Exception) -> Optional[Dict]:
+    """An expired cached result for the same inputs, used when Gemini is unavailable."""
+    if not is_unavailable(error):
+        return None
+    parsed_result = cache.get_stale(cache_key, version)
+    if parsed_result is not None:
+        get_upstream("gemini_recommendations").record_fallback()
+    return parsed_result
+
+def _recommendation_key(
+    weather_data: WeatherData,
+    land_coverage: LandCoverageData,
+    season_data: SeasonData,
+    city: str,
+    country: str,
+) -> str:
+    return feature_key(
+        city, country, season_data.season, land_coverage.__dict__, weather_data.temperature, weather_data.humidity
+    )
+
+def _resolve_season(
+    weather_data: WeatherData,
+    city: str,
+    country: str,
+    latitude: Optional[float],
+    longitude: Optional[float] = None,
+):
+    if latitude is None:
+        coordinates = SeasonService.get_location_coordinates(city, country)
+        if coordinates is None:
+            print(f"Location not found in gazetteer: {city}, {country}")
+        else:
+            latitude, longitude = coordinates
+
+    season_data = SeasonService.determine_season(
+        weather_data.local_time, weather_data.timezone, latitude, city, country, longitude
+    )
+    return season_data, latitude
+
+def _assemble_report(
+    parsed_result: Dict,
+    weather_data: WeatherData,
+    land_coverage: LandCoverageData,
+    season_data: SeasonData,
+    city: str,
+    country: str,
+    latitude: Optional[float],
+    longitude: Optional[float],
+    cached: bool = False,
+    stale: bool = False,
+) -> Dict:
+    parsed_result['weather_data'] = weather_data.__dict__
+    parsed_result['land_coverage'] = land_coverage.__dict__
+    parsed_result['season'] = season_data.__dict__
+    parsed_result['location'] = {
+        'city': city,
+        'country': country,
+        'latitude': latitude,
+        'longitude': longitude,
+    }
+
+    report = {
+        "status": "success",
+        "message": "Plant recommendations generated successfully.",
+        "response": parsed_result,
+        "cached": cached,
+        "backend": RECOMMENDATION_BACKEND,
+    }
+    if stale:
+        report["message"] = "Plant recommendations served from stale cache; the model is unavailable."
+        report["stale"] = True
+    return report
+
+class _AsyncReportIO:
+    """Cache and model access for the async report paths; plants() yields parsed plants."""
+
+    def __init__(self, stream: bool = False):
+        self.stream = stream
+
+    async def cache_get(self, cache, cache_key: str, version: str) -> Optional[Dict]:
+        return await run_blocking(cache.get, cache_key, version)
+
+    async def cache_put(self, cache, cache_key: str, version: str, parsed_result: Dict):
+        await run_blocking(cache.put, cache_key, version, parsed_result)
+
+    async def stale(self, cache, cache_key: str, version: str, error: Exception) -> Optional[Dict]:
+        return await run_blocking(_stale_recommendations, cache, cache_key, version, error)
+
+    async def plants(self, plant_system: PlantRecommendationSystem, prompt: str) -> AsyncIterator[Dict]:
+        if not self.stream:
+            for plant in (await _recommend_async(prompt))["recommendations"]:
+                yield plant
+            return
+        parser = IncrementalRecommendationParser()
+        async for chunk in _stream_recommendations_async(plant_system, prompt):
+            for plant in parser.feed(chunk):
+                yield plant
+        for plant in parser.close():
+            yield plant
+
+def _recommendation_report(
+    plant_system: PlantRecommendationSystem,
+    weather_data: WeatherData,
+    land_coverage: LandCoverageData,
+    season_data: SeasonData,
+    city: str,
+    country: str,
+    latitude: Optional[float],
+    longitude: Optional[float],
+) -> Dict:
+    """
+    Blocking counterpart of _recommendation_events for generate_final_report.
+
+    Same sources in the same order (catalog, cache, enriched or LLM) with the same
+    fallbacks, built from the same helpers; the answer is requested whole.
+    """
+    def report(parsed_result: Dict, cached: bool = False, stale: bool = False) -> Dict:
+        return _assemble_report(
+            parsed_result, weather_data, land_coverage, season_data, city, country, latitude, longitude, cached, stale
+        )
+
+    if RECOMMENDATION_BACKEND == "catalog":
+        return report({"recommendations": _catalog_picks(weather_data, land_coverage, season_data)})
+
+    cache = get_recommendation_cache()
+    cache_key = _recommendation_key(weather_data, land_coverage, season_data, city, country)
+    version = _recommendation_version(plant_system)
+    parsed_result = cache.get(cache_key, version)
+    if parsed_result is not None:
+        return report(parsed_result, cached=True)
+
+    if RECOMMENDATION_BACKEND == "enriched":
+        picks = _catalog_picks(weather_data, land_coverage, season_data)
+        prompt = _build_enrichment_prompt(picks, weather_data, land_coverage, season_data, city, country)
+        try:
+            enriched = plant_system.parser.parse(_generate_recommendations(plant_system, prompt))
+        except Exception as e:
+            print(f"Enrichment failed, using catalog text: {e}")
+            enriched = None
+        parsed_result = _enrich_all(picks, enriched)
+        if enriched is not None:
+            cache.put(cache_key, version, parsed_result)
+        return report(parsed_result)
+
+    prompt = _build_prompt(plant_system, weather_data, land_coverage, season_data, city, country)
+    try:
+        parsed_result = {
+            "recommendations": plant_system.parser.parse(_generate_recommendations(plant_system, prompt))["recommendations"]
+        }
+    except Exception as e:
+        parsed_result = _stale_recommendations(cache, cache_key, version, e)
+        if parsed_result is None:
+            raise
+        return report(parsed_result, cached=True, stale=True)
+    cache.put(cache_key, version, parsed_result)
+    return report(parsed_result)
+
+async def _recommendation_events(
+    io,
+    plant_system: PlantRecommendationSystem,
+    weather_data: WeatherData,
+    land_coverage: LandCoverageData,
+    season_data: SeasonData,
+    city: str,
+    country: str,
+    latitude: Optional[float],
+    longitude: Optional[float],
+) -> AsyncIterator[Dict]:
+    """
+    Chooses where the recommendations come from and yields them.
+
+    Yields one {"event": "plant", ...} per recommendation and ends with {"event": "report",
+    ...}. The source is the catalog (RECOMMENDATION_BACKEND=catalog), else the cached
+    result for the same inputs, else the model: enriched catalog picks, falling back to
+    the catalog text, or a full LLM answer, falling back to a stale cached one when
+    Gemini is unavailable. Shared by the async and streaming report functions, which
+    differ only in io; _recommendation_report is the blocking counterpart.
+    """
+    def report(parsed_result: Dict, cached: bool = False, stale: bool = False) -> Dict:
+        return {"event": "report", "data": _assemble_report(
+            parsed_result, weather_data, land_coverage, season_data, city, country, latitude, longitude, cached, stale
+        )}
+
+    if RECOMMENDATION_BACKEND == "catalog":
+        parsed_result = {"recommendations": _catalog_picks(weather_data, land_coverage, season_data)}
+        for plant in parsed_result["recommendations"]:
+            yield {"event": "plant", "data": plant}
+        yield report(parsed_result)
+        return
+
+    cache = get_recommendation_cache()
+    cache_key = _recommendation_key(weather_data, land_coverage, season_data, city, country)
+    version = _recommendation_version(plant_system)
+    parsed_result = await io.cache_get(cache, cache_key, version)
+    if parsed_result is not None:
+        for plant in parsed_result["recommendations"]:
+            yield {"event": "plant", "data": plant}
+        yield report(parsed_result, cached=True)
+        return
+
+    plants: List[Dict] = []
+    if RECOMMENDATION_BACKEND == "enriched":
+        picks = _catalog_picks(weather_data, land_coverage, season_data)
+        prompt = _build_enrichment_prompt(picks, weather_data, land_coverage, season_data, city, country)
+        failed = False
+        try:
+            async for enriched in io.plants(plant_system, prompt):
+                if len(plants) < len(picks):
+                    plants.append(_enrich(picks[len(plants)], enriched))
+                    yield {"event": "plant", "data": plants[-1]}
+        except Exception as e:
+            print(f"Enrichment failed, using catalog text: {e}")
+            failed = True
+        # Picks the model did not get to keep their catalog text.
+        for pick in picks[len(plants):]:
+            plants.append(dict(pick))
+            yield {"event": "plant", "data": plants[-1]}
+        parsed_result = {"recommendations": plants}
+        if not failed:
+            await io.cache_put(cache, cache_key, version, parsed_result)
+        yield report(parsed_result)
+        return
+
+    prompt = _build_prompt(plant_system, weather_data, land_coverage, season_data, city, country)
+    try:
+        async for plant in io.plants(plant_system, prompt):
+            plants.append(plant)
+            yield {"event": "plant", "data": plant}
+    except Exception as e:
+        # A stale result can only replace the answer if none of it was sent yet.
+        if plants:
+            raise
+        parsed_result = await io.stale(cache, cache_key, version, e)
+        if parsed_result is None:
+            raise
+        for plant in parsed_result["recommendations"]:
+            yield {"event": "plant", "data": plant}
+        yield report(parsed_result, cached=True, stale=True)
+        return
+    parsed_result = {"recommendations": plants}
+    await io.cache_put(cache, cache_key, version, parsed_result)
+    yield report(parsed_result)
+
+def _report_inputs(coverage_details: Dict, weather_data: Optional[WeatherData]):
+    """Validates the report inputs; returns (error, land_coverage)."""
+    error = _check_inputs(coverage_details)
+    if error:
+        return error, None
+    try:
+        land_coverage = build_land_coverage(coverage_details)
+    except ValueError as e:
+        return str(e), None
+    if not weather_data:
+        return "Failed to fetch weather data for the provided city.", None
+    return None, land_coverage
 
 # ✅ Final function with lat/lng support
 def generate_final_report(
@@ -232,109 +831,119 @@ def generate_final_report(
     latitude: Optional[float] = None,
     longitude: Optional[float] = None,
 ) -> Dict:
-    WEATHERAPI_KEY = os.getenv('WEATHERAPI_KEY')
-    GEMINI_API_KEY = os.getenv('GOOGLE_API_KEY')
-
-    if not WEATHERAPI_KEY or not GEMINI_API_KEY:
-        return {
-            "status": "error",
-            "message": "API keys not found. Please set WEATHERAPI_KEY and GOOGLE_API_KEY in your .env file.",
-            "response": None,
-        }
-
-    if not coverage_details:
-        return {
-            "status": "error",
-            "message": "Coverage details not provided.",
-            "response": None,
-        }
+    error = _check_inputs(coverage_details)
+    if error:
+        return _report_error(error)
 
     try:
-        land_coverage = LandCoverageData(
-            vegetation_coverage=coverage_details.get("vegetation_coverage", 0.0),
-            building_coverage=coverage_details.get("building_coverage", 0.0),
-            road_coverage=coverage_details.get("road_coverage", 0.0),
-            empty_land=coverage_details.get("empty_land", 0.0),
-            water_body=coverage_details.get("water_body", 0.0),
-        )
-
-        total_coverage = (
-            land_coverage.vegetation_coverage +
-            land_coverage.building_coverage +
-            land_coverage.road_coverage +
-            land_coverage.empty_land +
-            land_coverage.water_body
-        )
-
-        if abs(total_coverage - 100) > 1:
-            return {
-                "status": "error",
-                "message": f"Land coverage percentages must sum to 100%. Provided sum: {total_coverage}%",
-                "response": None,
-            }
+        try:
+            land_coverage = build_land_coverage(coverage_details)
+        except ValueError as e:
+            return _report_error(str(e))
 
-        plant_system = PlantRecommendationSystem(WEATHERAPI_KEY, GEMINI_API_KEY)
+        plant_system = get_plant_system()
 
         weather_data = plant_system.weather_service.get_weather_data(city)
         if not weather_data:
-            return {
-                "status": "error",
-                "message": "Failed to fetch weather data for the provided city.",
-                "response": None,
-            }
-
-        if latitude is None:
-            latitude, _ = SeasonService.get_location_coordinates(city, country)
+            return _report_error("Failed to fetch weather data for the provided city.")
 
-        season_data = SeasonService.determine_season(
-            weather_data.local_time, weather_data.timezone, latitude, city, country
+        season_data, latitude = _resolve_season(weather_data, city, country, latitude, longitude)
+        return _recommendation_report(
+            plant_system, weather_data, land_coverage, season_data, city, country, latitude, longitude
         )
 
-        prompt = plant_system.prompt_template.format(
-            temperature=weather_data.temperature,
-            humidity=weather_data.humidity,
-            weather_description=weather_data.weather_description,
-            wind_speed=weather_data.wind_speed,
-            precipitation=weather_data.precipitation,
-            feels_like=weather_data.feels_like,
-            uv_index=weather_data.uv_index,
-            visibility=weather_data.visibility,
-            vegetation_coverage=land_coverage.vegetation_coverage,
-            building_coverage=land_coverage.building_coverage,
-            road_coverage=land_coverage.road_coverage,
-            empty_land=land_coverage.empty_land,
-            water_body=land_coverage.water_body,
-            city=city,
-            country=country,
-            season=season_data.season,
-            planting_season=season_data.planting_season
-        )
+    except Exception as e:
+        return _report_error(f"Unexpected error: {str(e)}")
 
-        response = plant_system.model.generate_content(prompt)
-        parsed_result = plant_system.parser.parse(response.text)
-
-        parsed_result['weather_data'] = weather_data.__dict__
-        parsed_result['land_coverage'] = land_coverage.__dict__
-        parsed_result['season'] = season_data.__dict__
-        parsed_result['location'] = {
-            'city': city,
-            'country': country,
-            'latitude': latitude,
-            'longitude': longitude,
-        }
+async def generate_final_report_async(
+    coverage_details: Dict,
+    city: str,
+    country: str,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+) -> Dict:
+    error = _check_inputs(coverage_details)
+    if error:
+        return _report_error(error)
+    try:
+        build_land_coverage(coverage_details)
+    except ValueError as e:
+        return _report_error(str(e))
 
-        return {
-            "status": "success",
-            "message": "Plant recommendations generated successfully.",
-            "response": parsed_result,
-        }
+    weather_data = await get_plant_system().weather_service.get_weather_data_async(city)
+    return await compose_final_report_async(coverage_details, weather_data, city, country, latitude, longitude)
+
+async def compose_final_report_async(
+    coverage_details: Dict,
+    weather_data: Optional[WeatherData],
+    city: str,
+    country: str,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+) -> Dict:
+    """Builds the report from weather data that was fetched separately (e.g. concurrently with captioning)."""
+    report = None
+    async for event in stream_final_report_async(
+        coverage_details, weather_data, city, country, latitude, longitude, stream=False
+    ):
+        if event["event"] == "report":
+            report = event["data"]
+    return report
+
+async def stream_final_report_async(
+    coverage_details: Dict,
+    weather_data: Optional[WeatherData],
+    city: str,
+    country: str,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    stream: bool = True,
+) -> AsyncIterator[Dict]:
+    """
+    Streaming variant of compose_final_report_async.
+
+    Yields {"event": "season", ...} as soon as the inputs are validated, one
+    {"event": "plant", ...} per recommendation as the model generates it, and finally
+    {"event": "report", "data": <the same dict compose_final_report_async returns>}.
+    Errors end the stream with a "report" event whose status is "error". With
+    stream=False the model's answer is requested whole (and may be micro-batched), so
+    the plants only arrive once it is complete.
+    """
+    error, land_coverage = _report_inputs(coverage_details, weather_data)
+    if error:
+        yield {"event": "report", "data": _report_error(error)}
+        return
+
+    try:
+        plant_system = get_plant_system()
+        season_data, latitude = _resolve_season(weather_data, city, country, latitude, longitude)
+        yield {"event": "season", "data": season_data.__dict__}
+        async for event in _recommendation_events(
+            _AsyncReportIO(stream), plant_system, weather_data, land_coverage, season_data,
+            city, country, latitude, longitude,
+        ):
+            yield event
 
     except Exception as e:
-        return {
-            "status": "error",
-            "message": f"Unexpected error: {str(e)}",
-            "response": None,
-        }
+        yield {"event": "report", "data": _report_error(f"Unexpected error: {str(e)}")}
+
+async def _stream_recommendations_async(plant_system: PlantRecommendationSystem, prompt: str) -> AsyncIterator[str]:
+    started = time.perf_counter()
+    received = 0
+    error = True
+    try:
+        upstream = get_upstream("gemini_recommendations")
+        chunks = upstream.stream_async(
+            lambda: stream_content_async(plant_system.model, prompt, request_options={"timeout": upstream.timeout})
+        )
+        async for chunk in chunks:
+            received += len(chunk.encode())
+            yield chunk
+        error = False
+    finally:
+        record_stage("generate_content_stream", time.perf_counter() - started, error)
+        record_bytes("gemini", "sent", len(prompt.encode()))
+        record_bytes("gemini", "received", received)
 
 # Example usage (uncomment to run):
 # example_coverage = {
@@ -0,0 +1,36 @@
+import os
+import sqlite3
+import threading
+
+# Local state (caches, indexes) lives in one SQLite file outside the publicly served
+# files/ directory.
+DB_PATH = os.getenv("GREENERY_DB_PATH", "cache/greenery.db")
+
+_local = threading.local()
+
+
+def get_connection(db_path: str = None) -> sqlite3.Connection:
+    """
+    Returns a per-thread autocommit connection to the local SQLite database.
+
+    Args:
+        db_path (str): Database file. Defaults to GREENERY_DB_PATH.
+
+    Returns:
+        sqlite3.Connection: Connection with WAL enabled and rows accessible by name.
+    """
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[db_path] = conn
+    return conn
@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+import batch
+from batch import BatchRunner, parse_points_csv, parse_points_json, parse_points_upload
+
+
+def feature(longitude, latitude, **properties):
+    return {"type": "Feature", "geometry": {"type": "Point", "coordinates": [longitude, latitude]}, "properties": properties}
+
+
+def test_parse_json_list_and_points_object():
+    point = {"latitude": "52.5", "longitude": 13.4, "city": "Berlin", "country": "Germany", "id": 7}
+    [parsed] = parse_points_json([point])
+    assert (parsed.latitude, parsed.longitude, parsed.zoom, parsed.id) == (52.5, 13.4, 18, "7")
+    assert parse_points_json({"points": [point]}, default_zoom=17)[0].zoom == 17
+
+
+def test_parse_csv_accepts_column_aliases():
+    points = parse_points_csv("Lat,Lng,City,Country,zoom\n48.85,2.35,Paris,France,19\n")
+    assert [(p.latitude, p.longitude, p.city, p.zoom) for p in points] == [(48.85, 2.35, "Paris", 19)]
+
+
+def test_parse_geojson_feature_collection():
+    payload = {
+        "type": "FeatureCollection",
+        "features": [feature(2.35, 48.85, city="Paris", country="France"), {**feature(13.4, 52.5, city="Berlin", country="Germany"), "id": "b"}],
+    }
+    points = parse_points_json(payload)
+    assert [(p.latitude, p.longitude, p.id) for p in points] == [(48.85, 2.35, None), (52.5, 13.4, "b")]
+
+
+def test_upload_falls_back_to_csv_when_not_json():
+    points = parse_points_upload("points.txt", b"latitude,longitude,city,country\n1,2,A,B\n")
+    assert points[0].city == "A"
+
+
+@pytest.mark.parametrize("payload", [
+    {"type": "FeatureCollection", "features": [1]},
+    {"type": "FeatureCollection", "features": {"not": "a list"}},
+    {"type": "FeatureCollection", "features": [{}]},
+    {"type": "Feature", "geometry": "Point"},
+    {"type": "Feature", "geometry": {"type": "Point"}},
+    {"type": "Feature", "geometry": {"type": "Point", "coordinates": [1]}},
+    {"type": "Feature", "geometry": {"type": "LineString", "coordinates": [[0, 0], [1, 1]]}},
+    {**feature(2.35, 48.85), "properties": ["Paris"]},
+    feature(2.35, 48.85, city="Paris"),
+    feature(200, 48.85, city="Paris", country="France"),
+    [{"latitude": "north", "longitude": 1, "city": "A", "country": "B"}],
+    [{"latitude": 1, "longitude": 1, "city": "A", "country": "B", "zoom": 40}],
+    [{"latitude": 1, "longitude": 1, "city": "A", "country": "B", "zoom": -1}],
+    [{"latitude": 1, "longitude": 1, "city": "A", "country": "B", "zoom": "high"}],
+    "not points",
+])
+def test_malformed_points_raise_value_error(payload):
+    with pytest.raises(ValueError):
+        parse_points_json(payload)
+
+
+def test_stream_reports_a_failing_point_and_carries_on(monkeypatch):
+    async def fake_pipeline(city, country, latitude, longitude, **kwargs):
+        if city == "Broken":
+            raise RuntimeError("boom")
+        return {"status": "success"}
+
+    monkeypatch.setattr(batch, "analyze_location_pipeline", fake_pipeline)
+    points = parse_points_json([
+        {"latitude": 1, "longitude": 2, "city": city, "country": "X"} for city in ("A", "Broken", "C")
+    ])
+
+    async def collect():
+        return [json.loads(line) async for line in BatchRunner(concurrency=2).stream(points)]
+
+    lines = asyncio.run(collect())
+    by_index = {line["index"]: line for line in lines if "index" in line}
+    assert by_index[1]["status"] == "error" and "boom" in by_index[1]["message"]
+    assert by_index[0]["status"] == by_index[2]["status"] == "success"
+    assert lines[-1]["summary"]["succeeded"] == 2
+    assert lines[-1]["summary"]["failed"] == 1
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from coverage_engine import CLASS_FIELDS, estimate_coverage, local_std
+
+
+@pytest.mark.parametrize("shape", [(1, 1), (2, 1), (1, 5), (5, 1), (2, 2), (3, 7)])
+def test_local_std_keeps_the_shape_of_tiny_inputs(shape):
+    texture = local_std(np.random.default_rng(0).random(shape, dtype=np.float32))
+    assert texture.shape == shape
+    assert np.isfinite(texture).all()
+
+
+def test_local_std_is_zero_on_flat_input_and_positive_on_noise():
+    assert not local_std(np.full((32, 32), 0.5, dtype=np.float32)).any()
+    assert local_std(np.random.default_rng(0).random((32, 32), dtype=np.float32)).mean() > 0.1
+
+
+@pytest.mark.parametrize("size", [(1, 1), (1, 40), (40, 1)])
+def test_estimate_coverage_handles_one_pixel_wide_images(size):
+    coverage = estimate_coverage(Image.new("RGB", size, (40, 140, 50)))
+    assert set(coverage) == set(CLASS_FIELDS)
+    assert sum(coverage.values()) == pytest.approx(100, abs=0.1)
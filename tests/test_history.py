@@ -0,0 +1,46 @@
+import time
+
+from history import HistoryStore, encode_geohash
+
+COVERAGE = {"vegetation_coverage": 40.0, "building_coverage": 30.0, "road_coverage": 10.0,
+            "empty_land": 15.0, "water_body": 5.0}
+FAILED_REPORT = {"status": "success", "final_report": {"status": "error", "message": "Weather lookup failed."}}
+
+
+def make_store(tmp_path):
+    return HistoryStore(db_path=str(tmp_path / "history.db"))
+
+
+def record(store, result, coverage=None):
+    store.record(52.5, 13.4, 18, "Berlin", "Germany", "local", result, reusable=True, coverage=coverage)
+
+
+def test_failed_report_records_the_coverage_estimate(tmp_path):
+    store = make_store(tmp_path)
+    record(store, FAILED_REPORT, COVERAGE)
+    record(store, FAILED_REPORT, COVERAGE)
+    trend = store.trend(52.5, 13.4)
+    assert trend["records"] == 2
+    assert trend["buckets"][-1]["vegetation_coverage"] == 40.0
+    assert store.drops(threshold=1) == []
+
+
+def test_result_without_coverage_is_not_recorded(tmp_path):
+    store = make_store(tmp_path)
+    record(store, FAILED_REPORT)
+    assert store.trend(52.5, 13.4)["records"] == 0
+
+
+def test_rows_without_coverage_do_not_show_up_as_drops(tmp_path):
+    store = make_store(tmp_path)
+    record(store, FAILED_REPORT, COVERAGE)
+    # A row written by an older version for a failed report: every coverage field 0.
+    columns = ", ".join(COVERAGE)
+    store._conn().execute(
+        f"INSERT INTO location_history(geohash, latitude, longitude, zoom, city, country, coverage_backend, "
+        f"{columns}, result, reusable, created_at) VALUES(?, 52.5, 13.4, 18, 'Berlin', 'Germany', 'local', "
+        f"0, 0, 0, 0, 0, '{{}}', 0, ?)",
+        (encode_geohash(52.5, 13.4), time.time() + 1),
+    )
+    assert store.drops(threshold=10) == []
+    assert store.trend(52.5, 13.4)["slope_per_year"] is None
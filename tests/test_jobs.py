@@ -0,0 +1,130 @@
+import asyncio
+import collections
+
+import pytest
+
+import jobs
+from jobs import JobQueue, QueueFull
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    counts = collections.Counter()
+
+    async def fake_pipeline(**params):
+        counts[params["n"]] += 1
+        await asyncio.sleep(0.01)
+        return {"status": "success", "timings": {}}
+
+    monkeypatch.setattr(jobs, "analyze_location_pipeline", fake_pipeline)
+    return counts
+
+
+def make_queue(tmp_path, **kwargs):
+    return JobQueue(db_path=str(tmp_path / "jobs.db"), poll_seconds=0.02, **kwargs)
+
+
+def test_two_queues_on_one_database_run_each_job_once(tmp_path, runs):
+    async def scenario():
+        first, second = make_queue(tmp_path, workers=3, max_pending=20), make_queue(tmp_path, workers=3, max_pending=20)
+        await first.start()
+        await second.start()
+        ids = [await first.submit({"n": n}) for n in range(12)]
+        await asyncio.sleep(0.5)
+        await first.stop()
+        await second.stop()
+        return [(await first.get(job_id))["status"] for job_id in ids]
+
+    assert asyncio.run(scenario()) == ["succeeded"] * 12
+    assert set(runs.values()) == {1}
+
+
+def test_submit_refuses_jobs_past_max_pending(tmp_path, monkeypatch):
+    async def slow_pipeline(**params):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(jobs, "analyze_location_pipeline", slow_pipeline)
+
+    async def scenario():
+        queue = make_queue(tmp_path, workers=1, max_pending=2)
+        await queue.start()
+        running = await queue.submit({"n": 0})
+        await queue.submit({"n": 1})
+        await asyncio.sleep(0.05)
+        with pytest.raises(QueueFull):
+            await queue.submit({"n": 2})
+        await queue.stop()
+        # A job interrupted by shutdown goes back to the queue for the next worker.
+        assert (await queue.get(running))["status"] == "queued"
+
+    asyncio.run(scenario())
+
+
+def test_expired_lease_is_reclaimed(tmp_path, runs):
+    async def scenario():
+        queue = make_queue(tmp_path, workers=1)
+        queue._conn().execute(
+            "INSERT INTO jobs(id, kind, status, params, created_at, owner, lease_until) "
+            "VALUES('orphan', 'analyze-location', 'running', '{\"n\": 1}', 0, 'gone:1:x', 1)"
+        )
+        await queue.start()
+        await asyncio.sleep(0.2)
+        await queue.stop()
+        return (await queue.get("orphan"))["status"]
+
+    assert asyncio.run(scenario()) == "succeeded"
+    assert runs[1] == 1
+
+
+def test_live_lease_is_left_to_its_owner(tmp_path, runs):
+    async def scenario():
+        queue = make_queue(tmp_path, workers=1)
+        queue._conn().execute(
+            "INSERT INTO jobs(id, kind, status, params, created_at, owner, lease_until) "
+            "VALUES('busy', 'analyze-location', 'running', '{\"n\": 1}', 0, 'other:1:x', 1e12)"
+        )
+        await queue.start()
+        await asyncio.sleep(0.1)
+        await queue.stop()
+        return (await queue.get("busy"))["status"]
+
+    assert asyncio.run(scenario()) == "running"
+    assert not runs
+
+
+def test_recovered_jobs_past_max_pending_are_failed_on_start(tmp_path, runs):
+    async def scenario():
+        queue = make_queue(tmp_path, workers=1, max_pending=3)
+        for i in range(5):
+            queue._conn().execute(
+                "INSERT INTO jobs(id, kind, status, params, created_at) VALUES(?, 'analyze-location', 'queued', ?, ?)",
+                (f"job{i}", f'{{"n": {i}}}', i),
+            )
+        await queue.start()
+        await asyncio.sleep(0.2)
+        await queue.stop()
+        return {i: (await queue.get(f"job{i}"))["status"] for i in range(5)}
+
+    statuses = asyncio.run(scenario())
+    assert statuses == {0: "succeeded", 1: "succeeded", 2: "succeeded", 3: "failed", 4: "failed"}
+
+
+def test_jobs_with_expired_leases_do_not_count_against_max_pending(tmp_path, monkeypatch):
+    async def slow_pipeline(**params):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(jobs, "analyze_location_pipeline", slow_pipeline)
+
+    async def scenario():
+        queue = make_queue(tmp_path, workers=1, max_pending=2)
+        for i in range(2):
+            queue._conn().execute(
+                "INSERT INTO jobs(id, kind, status, params, created_at, owner, lease_until) "
+                "VALUES(?, 'analyze-location', 'running', '{}', 0, 'gone:1:x', 1)",
+                (f"crashed{i}",),
+            )
+        await queue.start()
+        await queue.submit({"n": 0})
+        await queue.stop()
+
+    asyncio.run(scenario())
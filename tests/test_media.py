@@ -0,0 +1,59 @@
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+import media
+from media import MediaError, VariantCache, resolve_media, snap_width
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "tile.png"
+    Image.new("RGB", (800, 600), (30, 160, 40)).save(path)
+    return str(path)
+
+
+def test_concurrent_requests_encode_a_variant_once(tmp_path, source):
+    cache = VariantCache(directory=str(tmp_path / "variants"))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(source, 256, "webp"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(results)) == 1
+    path, media_type = results[0]
+    assert media_type == "image/webp" and path != source
+    assert cache.stats()["generated"] == 1
+    assert cache._key_locks == {}
+
+
+def test_missing_variant_falls_back_to_the_original(tmp_path, source, monkeypatch):
+    cache = VariantCache(directory=str(tmp_path / "variants"))
+
+    def vanished(path):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(media.os.path, "getsize", vanished)
+    assert cache.get(source, 256, "webp") == (source, "image/png")
+
+
+def test_resolve_media_stays_inside_root(tmp_path):
+    root = tmp_path / "files"
+    (root / "tiles").mkdir(parents=True)
+    (root / "tiles" / "a.png").write_bytes(b"png")
+    assert resolve_media("files/tiles/a.png", str(root)) == os.path.realpath(root / "tiles" / "a.png")
+    with pytest.raises(MediaError) as error:
+        resolve_media("../secret.txt", str(root))
+    assert error.value.status_code == 400
+    with pytest.raises(MediaError) as error:
+        resolve_media("tiles/missing.png", str(root))
+    assert error.value.status_code == 404
+
+
+def test_snap_width_rounds_up_to_a_configured_size():
+    assert snap_width(None) is None
+    assert snap_width(100) == media.MEDIA_WIDTHS[0]
+    assert snap_width(media.MEDIA_WIDTHS[-1] + 1) is None
@@ -0,0 +1,68 @@
+import pytest
+
+from region import REGION_MAX_TILES, centered_cell, parse_bbox, plan_bbox_grid, plan_orthophoto_grid
+
+
+def test_orthophoto_grid_covers_the_image_with_smaller_edge_tiles():
+    rows, cols, tiles = plan_orthophoto_grid(1000, 700, tile_px=400)
+    assert (rows, cols) == (2, 3)
+    assert tiles[0].box == (0, 0, 400, 400)
+    assert tiles[-1].box == (800, 400, 1000, 700)
+    assert sum(tile.weight for tile in tiles) == 1000 * 700
+
+
+def test_orthophoto_grid_interpolates_bounds_from_bbox():
+    _, _, tiles = plan_orthophoto_grid(200, 200, tile_px=100, bbox=(10.0, 20.0, 12.0, 22.0))
+    north_west = tiles[0]
+    assert north_west.bounds == pytest.approx((11.0, 20.0, 12.0, 21.0))
+    assert (north_west.latitude, north_west.longitude) == pytest.approx((11.5, 20.5))
+
+
+@pytest.mark.parametrize("tile_px", [0, -64])
+def test_orthophoto_grid_rejects_non_positive_tile_size(tile_px):
+    with pytest.raises(ValueError):
+        plan_orthophoto_grid(100, 100, tile_px=tile_px)
+
+
+def test_orthophoto_grid_rejects_too_many_tiles():
+    with pytest.raises(ValueError):
+        plan_orthophoto_grid(REGION_MAX_TILES + 1, 1, tile_px=1)
+
+
+def test_bbox_grid_tiles_are_grid_aligned_and_weighted_by_area():
+    bbox = (52.50, 13.40, 52.51, 13.42)
+    rows, cols, tiles = plan_bbox_grid(bbox, zoom=17)
+    assert len(tiles) == rows * cols
+    assert len({tile.cell for tile in tiles}) == len(tiles)
+    _, _, again = plan_bbox_grid(bbox, zoom=17)
+    assert [tile.cell for tile in again] == [tile.cell for tile in tiles]
+    # Edge tiles only count for the part inside the box, so the total is the box area (~1.5 km²).
+    assert sum(tile.weight for tile in tiles) == pytest.approx(1111 * 1355, rel=0.02)
+
+
+@pytest.mark.parametrize("zoom", [-1, 22, 30])
+def test_bbox_grid_rejects_out_of_range_zoom(zoom):
+    with pytest.raises(ValueError):
+        plan_bbox_grid((52.50, 13.40, 52.51, 13.42), zoom=zoom)
+
+
+def test_bbox_grid_rejects_too_many_tiles():
+    with pytest.raises(ValueError):
+        plan_bbox_grid((50.0, 10.0, 52.0, 12.0), zoom=18, max_tiles=10)
+
+
+@pytest.mark.parametrize("value", ["1,2,3", "2,0,1,1", "0,10,1,5", "0,-181,1,0", "a,b,c,d"])
+def test_parse_bbox_rejects_invalid_boxes(value):
+    with pytest.raises(ValueError):
+        parse_bbox(value)
+
+
+def test_parse_bbox_accepts_string_and_sequence():
+    assert parse_bbox("1, 2, 3, 4") == parse_bbox([1, 2, 3, 4]) == (1.0, 2.0, 3.0, 4.0)
+
+
+def test_centered_cell_only_matches_cell_centers():
+    _, _, [tile] = plan_bbox_grid((52.5000, 13.4000, 52.5001, 13.4001), zoom=18)
+    assert centered_cell(tile.latitude, tile.longitude, 18) == tile.cell
+    south, west, north, east = tile.bounds
+    assert centered_cell(south + (north - south) * 0.3, west + (east - west) * 0.7, 18) is None
@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, RateLimitedError, Upstream, UpstreamStatusError
+
+
+def make_upstream(retries=0, timeout=1.0):
+    upstream = Upstream("test", rate=0, burst=1, timeout=timeout, retries=retries)
+    upstream.breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05, probe_timeout=60)
+    return upstream
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    open_breaker(breaker)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_lets_one_probe_through_and_closes_on_success():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_breaker_reopens_when_probe_fails():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opened == 2
+
+
+def test_probe_timeout_allows_a_new_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.01, probe_timeout=0.02)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    breaker.before_call()
+    time.sleep(0.03)
+    breaker.before_call()
+
+
+def test_released_probe_frees_the_half_open_slot():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    breaker.before_call()
+    breaker.release_probe()
+    breaker.before_call()
+
+
+def test_call_retries_retryable_errors():
+    upstream = make_upstream(retries=2)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise UpstreamStatusError(503, retry_after=0)
+        return "ok"
+
+    assert upstream.call(flaky) == "ok"
+    assert len(attempts) == 2
+    assert upstream.stats()["calls"]["retry"] == 1
+
+
+def test_non_retryable_error_does_not_count_against_the_breaker():
+    upstream = make_upstream()
+
+    def bad_request():
+        raise ValueError("bad input")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            upstream.call(bad_request)
+    assert upstream.breaker.state == "closed"
+
+
+def test_cancelled_async_probe_releases_the_breaker():
+    upstream = make_upstream()
+    open_breaker(upstream.breaker)
+    time.sleep(0.06)
+
+    async def scenario():
+        probe = asyncio.ensure_future(upstream.call_async(asyncio.sleep, 10))
+        await asyncio.sleep(0.01)
+        assert upstream.breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def ok():
+            return "ok"
+
+        return await upstream.call_async(ok)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert upstream.breaker.state == "closed"
+
+
+def test_stream_closed_early_counts_as_success():
+    upstream = make_upstream()
+    open_breaker(upstream.breaker)
+    time.sleep(0.06)
+
+    async def chunks():
+        for i in range(5):
+            yield i
+
+    async def scenario():
+        stream = upstream.stream_async(chunks)
+        async for chunk in stream:
+            break
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert upstream.breaker.state == "closed"
+    upstream.breaker.before_call()
+
+
+def test_rate_limited_probe_releases_the_breaker():
+    upstream = Upstream("test", rate=0.01, burst=1, timeout=1.0, retries=0)
+    upstream.breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.01, probe_timeout=60)
+    upstream.bucket.reserve()
+    open_breaker(upstream.breaker)
+    time.sleep(0.02)
+    with pytest.raises(RateLimitedError):
+        upstream.call(lambda: "ok")
+    upstream.breaker.before_call()
+    assert upstream.breaker.state == "half_open"
@@ -0,0 +1,44 @@
+import io
+
+import pytest
+from PIL import Image
+
+import uploads
+from region import open_orthophoto
+from uploads import UPLOAD_MAX_PIXELS, UploadError, prepare_image
+
+
+def png(size):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (20, 120, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_pil_limit_follows_the_upload_setting():
+    assert Image.MAX_IMAGE_PIXELS == UPLOAD_MAX_PIXELS
+
+
+@pytest.mark.filterwarnings("ignore::PIL.Image.DecompressionBombWarning")
+@pytest.mark.parametrize("open_image", [prepare_image, open_orthophoto])
+@pytest.mark.parametrize("limit", [1000, 3000])
+def test_images_over_the_pixel_limit_are_413(monkeypatch, open_image, limit):
+    # 1000 px is past PIL's own (2x) refusal threshold, 3000 px only past ours.
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", limit)
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_PIXELS", limit)
+    monkeypatch.setattr("region.UPLOAD_MAX_PIXELS", limit)
+    with pytest.raises(UploadError) as error:
+        open_image(png((80, 50)))
+    assert error.value.status_code == 413
+
+
+def test_non_images_are_415():
+    with pytest.raises(UploadError) as error:
+        prepare_image(b"not an image")
+    assert error.value.status_code == 415
+
+
+def test_small_native_images_pass_through_unchanged():
+    data = png((64, 48))
+    prepared = prepare_image(data)
+    assert prepared.data == data and not prepared.resized
+    assert (prepared.width, prepared.height) == (64, 48)
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+
+import pytest
+
+from weather_cache import WeatherCache
+
+
+@dataclass
+class Weather:
+    temperature: float
+
+
+def make_cache(tmp_path, **kwargs):
+    return WeatherCache(Weather, ttl_seconds=600, db_path=str(tmp_path / "weather.db"), **kwargs)
+
+
+def test_concurrent_async_misses_share_one_fetch(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+
+    async def fetch(city):
+        calls.append(city)
+        await asyncio.sleep(0.02)
+        return Weather(20.0)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_fetch_async("Berlin", fetch) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert calls == ["Berlin"]
+    assert all(result == Weather(20.0) for result in results)
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (1, 4, 0)
+    assert cache.get(" berlin ") == Weather(20.0)
+
+
+def test_cancelling_the_first_caller_does_not_cancel_the_others(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+
+    async def fetch(city):
+        calls.append(city)
+        await asyncio.sleep(0.05)
+        return Weather(12.5)
+
+    async def scenario():
+        leader = asyncio.ensure_future(cache.get_or_fetch_async("Oslo", fetch))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(cache.get_or_fetch_async("Oslo", fetch)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(scenario()) == [Weather(12.5)] * 3
+    assert calls == ["Oslo"]
+
+
+def test_failed_fetch_is_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+    results = iter([None, Weather(5.0)])
+
+    async def fetch(city):
+        return next(results)
+
+    async def scenario():
+        first = await cache.get_or_fetch_async("Rome", fetch)
+        second = await cache.get_or_fetch_async("Rome", fetch)
+        return first, second
+
+    assert asyncio.run(scenario()) == (None, Weather(5.0))
+    assert cache.stats()["upstream_calls"] == 2
+
+
+def test_concurrent_sync_misses_share_one_fetch(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+
+    def fetch(city):
+        calls.append(city)
+        time.sleep(0.05)
+        return Weather(30.0)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_fetch("Madrid", fetch))) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ["Madrid"]
+    assert results == [Weather(30.0)] * 4
+
+
+def test_shared_cache_is_read_by_another_instance(tmp_path):
+    first = make_cache(tmp_path, shared=True)
+    first.get_or_fetch("Lisbon", lambda city: Weather(22.0))
+    second = make_cache(tmp_path, shared=True)
+    assert second.get("Lisbon") == Weather(22.0)
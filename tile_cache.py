@@ -0,0 +1,209 @@
+import os
+import time
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+
+from storage import get_connection
+
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", "files/tiles")
+TILE_CACHE_MAX_MB = float(os.getenv("TILE_CACHE_MAX_MB", "256"))
+TILE_CACHE_TTL_HOURS = float(os.getenv("TILE_CACHE_TTL_HOURS", "168"))
+# Expired tiles are kept this much longer so they can be served while Maps is unavailable.
+TILE_CACHE_STALE_HOURS = float(os.getenv("TILE_CACHE_STALE_HOURS", "720"))
+# Grid step as a fraction of the tile width. Centers are snapped to this grid so nearby
+# (jittered) coordinates share one cached image; 0.05 is ~20 m at zoom 18.
+TILE_CACHE_SNAP = float(os.getenv("TILE_CACHE_SNAP", "0.05"))
+
+
+def tile_span_degrees(zoom: int, size: str) -> float:
+    """Longitude span covered by a static map of the given zoom and 'WIDTHxHEIGHT' size."""
+    width = int(size.lower().split("x")[0])
+    return width * 360.0 / (256 * 2 ** zoom)
+
+
+def quantize(latitude: float, longitude: float, zoom: int, size: str) -> Tuple[float, float]:
+    """
+    Snaps a coordinate to the cache grid for the given zoom and size.
+
+    Returns:
+        tuple: (latitude, longitude) of the cell center.
+    """
+    step = tile_span_degrees(zoom, size) * TILE_CACHE_SNAP
+    digits = 7
+    return (
+        round(round(latitude / step) * step, digits),
+        round(round(longitude / step) * step, digits),
+    )
+
+
+class TileCache:
+    """
+    Disk cache for static map tiles with an SQLite index.
+
+    Entries are addressed by a hash of the quantized (lat, lon, zoom, size, maptype) cell.
+    The cache keeps total size under max_bytes by evicting least recently used tiles and
+    treats tiles older than ttl_seconds as misses. Expired tiles stay on disk for another
+    stale_seconds, during which get_stale still returns them.
+    """
+
+    def __init__(
+        self,
+        directory: str = TILE_CACHE_DIR,
+        max_bytes: int = int(TILE_CACHE_MAX_MB * 1024 * 1024),
+        ttl_seconds: float = TILE_CACHE_TTL_HOURS * 3600,
+        stale_seconds: float = TILE_CACHE_STALE_HOURS * 3600,
+        db_path: Optional[str] = None,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if not self._schema_ready:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tile_cache (
+                    key TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    latitude REAL,
+                    longitude REAL,
+                    zoom INTEGER,
+                    size TEXT,
+                    bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_tile_cache_last_access ON tile_cache(last_access);
+                CREATE TABLE IF NOT EXISTS tile_cache_stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                );
+            """)
+            self._schema_ready = True
+        return conn
+
+    def _bump(self, conn, name: str, amount: int = 1):
+        conn.execute(
+            "INSERT INTO tile_cache_stats(name, value) VALUES(?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    @staticmethod
+    def make_key(latitude: float, longitude: float, zoom: int, size: str, maptype: str = "satellite") -> str:
+        cell = f"{latitude:.7f},{longitude:.7f},{zoom},{size},{maptype}"
+        return hashlib.sha256(cell.encode()).hexdigest()[:32]
+
+    def path_for(self, key: str) -> str:
+        return f"{self.directory}/{key}.png"
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached tile path, or None on a miss or expired entry."""
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute("SELECT path, bytes, created_at FROM tile_cache WHERE key = ?", (key,)).fetchone()
+        if row is not None and now - row["created_at"] <= self.ttl_seconds and os.path.isfile(row["path"]):
+            conn.execute(
+                "UPDATE tile_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+            self._bump(conn, "hits")
+            self._bump(conn, "bytes_saved", row["bytes"])
+            return row["path"]
+
+        expired = row is not None and now - row["created_at"] > self.ttl_seconds + self.stale_seconds
+        if row is not None and (expired or not os.path.isfile(row["path"])):
+            self._remove(conn, key, row["path"])
+            self._bump(conn, "expired")
+        self._bump(conn, "misses")
+        return None
+
+    def get_stale(self, key: str) -> Optional[str]:
+        """Returns the tile path even if it has expired (within the stale window), or None."""
+        conn = self._conn()
+        row = conn.execute("SELECT path, created_at FROM tile_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row["created_at"] > self.ttl_seconds + self.stale_seconds:
+            return None
+        if not os.path.isfile(row["path"]):
+            return None
+        self._bump(conn, "stale_served")
+        return row["path"]
+
+    def put(self, key: str, content: bytes, latitude: float, longitude: float, zoom: int, size: str) -> str:
+        """Stores a tile, evicting old entries if the disk budget is exceeded. Returns its path."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO tile_cache(key, path, latitude, longitude, zoom, size, bytes, created_at, last_access) "
+            "VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, path, latitude, longitude, zoom, size, len(content), now, now),
+        )
+        self._evict(conn)
+        return path
+
+    def _remove(self, conn, key: str, path: str):
+        conn.execute("DELETE FROM tile_cache WHERE key = ?", (key,))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, conn):
+        with self._lock:
+            cutoff = time.time() - self.ttl_seconds - self.stale_seconds
+            for row in conn.execute("SELECT key, path FROM tile_cache WHERE created_at < ?", (cutoff,)).fetchall():
+                self._remove(conn, row["key"], row["path"])
+                self._bump(conn, "expired")
+
+            total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM tile_cache").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for row in conn.execute("SELECT key, path, bytes FROM tile_cache ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._remove(conn, row["key"], row["path"])
+                self._bump(conn, "evictions")
+                total -= row["bytes"]
+
+    def stats(self) -> Dict:
+        conn = self._conn()
+        counters = {row["name"]: row["value"] for row in conn.execute("SELECT name, value FROM tile_cache_stats")}
+        entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM tile_cache").fetchone()
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "stale_seconds": self.stale_seconds,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "bytes_saved": counters.get("bytes_saved", 0),
+            "evictions": counters.get("evictions", 0),
+            "expired": counters.get("expired", 0),
+            "stale_served": counters.get("stale_served", 0),
+        }
+
+
+_tile_cache = None
+
+
+def get_tile_cache() -> TileCache:
+    global _tile_cache
+    if _tile_cache is None:
+        _tile_cache = TileCache()
+    return _tile_cache
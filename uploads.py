@@ -0,0 +1,213 @@
+import io
+import os
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from PIL import Image
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+from starlette.requests import Request
+
+from image_prep import VisionImage, fit_image, vision_from_image
+
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", "25"))
+# Longest side sent for analysis; larger images are downscaled and re-encoded in memory.
+UPLOAD_MAX_SIDE = int(os.getenv("UPLOAD_MAX_SIDE", "1600"))
+UPLOAD_JPEG_QUALITY = int(os.getenv("UPLOAD_JPEG_QUALITY", "90"))
+# Refuse to decode images that would expand to more pixels than this (decompression bombs).
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", str(200_000_000)))
+# PIL refuses images past its own, lower default limit at open; use ours so the size check
+# below reports them as too large (413) rather than unsupported.
+Image.MAX_IMAGE_PIXELS = UPLOAD_MAX_PIXELS
+
+# Formats the model accepts as-is; anything else is re-encoded.
+NATIVE_MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+# Form fields other than the file are small; cap them separately.
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    """An upload the API refuses, with the HTTP status to report."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class ImageUpload:
+    data: bytes
+    digest: str
+    filename: str
+    fields: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    resized: bool
+    # What the vision model is sent, encoded from the same decoded pixels (see prepare_image).
+    vision: Optional[VisionImage] = None
+
+
+class _UploadCollector:
+    """Callbacks for python-multipart that keep the file part in memory and hash it as it arrives."""
+
+    def __init__(self, file_field: str, max_bytes: int):
+        self.file_field = file_field
+        self.max_bytes = max_bytes
+        self.fields: Dict[str, str] = {}
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        self.filename: Optional[str] = None
+        self._header_field = b""
+        self._header_value = b""
+        self._name: Optional[str] = None
+        self._is_file = False
+        self._value = bytearray()
+
+    def on_part_begin(self):
+        self._name = None
+        self._is_file = False
+        self._value = bytearray()
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            _, options = parse_options_header(self._header_value)
+            self._name = options.get(b"name", b"").decode("utf-8", "replace")
+            if b"filename" in options:
+                self._is_file = self._name == self.file_field
+                if self._is_file:
+                    self.filename = options[b"filename"].decode("utf-8", "replace")
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._is_file:
+            chunk = data[start:end]
+            self.size += len(chunk)
+            if self.size > self.max_bytes:
+                raise UploadError(f"Image is larger than the {self.max_bytes / 2**20:g} MB limit.", status_code=413)
+            self.hasher.update(chunk)
+            self.chunks.append(chunk)
+        elif self._name is not None:
+            self._value += data[start:end]
+            if len(self._value) > MAX_FIELD_BYTES:
+                raise UploadError(f"Form field '{self._name}' is too large.", status_code=413)
+
+    def on_part_end(self):
+        if self._name is not None and not self._is_file:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+
+    def callbacks(self) -> Dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+
+async def receive_image_upload(
+    request: Request, file_field: str = "file", max_bytes: int = int(UPLOAD_MAX_MB * 1024 * 1024)
+) -> ImageUpload:
+    """
+    Reads a multipart upload straight from the request stream.
+
+    The image part is kept in memory and hashed chunk by chunk as it arrives, and the
+    request is rejected as soon as it passes max_bytes, without spooling to a temp file
+    (as Starlette's form parser does for large files).
+
+    Raises:
+        UploadError: If the body is not multipart, has no file, or is too large.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("Expected a multipart/form-data upload.", status_code=415)
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MAX_FIELD_BYTES:
+        raise UploadError(f"Image is larger than the {max_bytes / 2**20:g} MB limit.", status_code=413)
+
+    collector = _UploadCollector(file_field, max_bytes)
+    parser = MultipartParser(params[b"boundary"], collector.callbacks())
+    async for chunk in request.stream():
+        if chunk:
+            parser.write(chunk)
+    parser.finalize()
+
+    if collector.filename is None or not collector.size:
+        raise UploadError(f"Upload an image in the '{file_field}' field.")
+    # One join of the received chunks; the chunks are released right after.
+    return ImageUpload(b"".join(collector.chunks), collector.hasher.hexdigest(), collector.filename, collector.fields)
+
+
+def open_upload(data: bytes) -> Image.Image:
+    """
+    Opens uploaded bytes as an image without decoding the pixels.
+
+    Raises:
+        UploadError: 413 if the image has more than UPLOAD_MAX_PIXELS pixels, 415 if it is not an image.
+    """
+    try:
+        return Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError:
+        raise UploadError("Image is too large to process.", status_code=413)
+    except Exception:
+        raise UploadError("The uploaded file is not a supported image.", status_code=415)
+
+
+def prepare_image(data: bytes, max_side: int = UPLOAD_MAX_SIDE, for_vision: bool = False) -> PreparedImage:
+    """
+    Identifies an uploaded image and makes it small enough to analyze, all in memory.
+
+    Images in a format the model accepts and within max_side are passed through
+    untouched. Others are decoded (JPEGs at a reduced DCT scale where possible),
+    rotated per EXIF, downscaled and re-encoded as JPEG. With for_vision, the view sent
+    to the vision model (VISION_*) is encoded from the same decoded pixels, so the image
+    is decoded once and never re-encoded from a lossy copy of itself.
+
+    Raises:
+        UploadError: If the bytes are not a supported image or are too large to decode.
+    """
+    image = open_upload(data)
+    width, height = image.size
+    if width * height > UPLOAD_MAX_PIXELS:
+        raise UploadError(f"Image is too large to process ({width}x{height}).", status_code=413)
+
+    mime_type = NATIVE_MIME_TYPES.get(image.format)
+    passthrough = bool(mime_type) and max(width, height) <= max_side
+    if passthrough and not for_vision:
+        return PreparedImage(data, mime_type, width, height, width, height, resized=False)
+
+    try:
+        image = fit_image(image, max_side)
+        if not passthrough:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=UPLOAD_JPEG_QUALITY, optimize=True)
+            data, mime_type = buffer.getvalue(), "image/jpeg"
+    except Exception as e:
+        raise UploadError(f"Could not decode the uploaded image: {e}", status_code=415)
+
+    vision = vision_from_image(image, data, mime_type) if for_vision else None
+    if passthrough:
+        return PreparedImage(data, mime_type, width, height, width, height, resized=False, vision=vision)
+    return PreparedImage(
+        data, mime_type, image.width, image.height, width, height,
+        resized=(image.width, image.height) != (width, height), vision=vision,
+    )
@@ -0,0 +1,84 @@
+import time
+import asyncio
+import importlib
+import threading
+from typing import Callable, Dict, Optional
+
+from executor import run_blocking
+from settings import get_settings
+
+# Modules deferred at import time so the server starts quickly; warm-up loads them
+# before the first request that needs them.
+HEAVY_MODULES = ("google.generativeai", "langchain_core.prompts", "requests", "httpx")
+
+_lock = threading.Lock()
+_state: Dict = {"status": "pending", "seconds": None, "steps": {}, "error": None}
+
+
+def _step(name: str, func: Callable):
+    started = time.perf_counter()
+    func()
+    with _lock:
+        _state["steps"][name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def _build_models():
+    settings = get_settings()
+    if not settings.google_api_key:
+        return
+    from clients import get_genai_model
+    from step1 import COVERAGE_MODEL
+    from step2 import get_plant_system
+
+    get_genai_model(COVERAGE_MODEL, settings.google_api_key)
+    if settings.weatherapi_key:
+        get_plant_system()
+
+
+def warm_up():
+    """
+    Does the one-off work the first requests would otherwise pay for: heavy imports,
+    configured Gemini models, the shared HTTP session, the gazetteer and the plant
+    catalog. Makes no network calls.
+    """
+    from clients import get_http_session
+    from gazetteer import get_gazetteer
+    from plant_catalog import get_plant_catalog
+
+    for module in HEAVY_MODULES:
+        _step(f"import {module}", lambda: importlib.import_module(module))
+    _step("gemini models", _build_models)
+    _step("http session", get_http_session)
+    _step("gazetteer", get_gazetteer)
+    _step("plant catalog", get_plant_catalog)
+
+
+async def _run_warm_up():
+    started = time.perf_counter()
+    with _lock:
+        _state["status"] = "running"
+    try:
+        await run_blocking(warm_up)
+        # The async client is bound to the event loop, so it is created here rather than in the thread.
+        from clients import get_async_client
+        get_async_client()
+        status, error = "ready", None
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        status, error = "failed", str(e)
+    with _lock:
+        _state.update(status=status, error=error, seconds=round(time.perf_counter() - started, 3))
+
+
+def start_warm_up() -> Optional[asyncio.Task]:
+    """Starts warm-up in the background so startup does not wait for it; WARMUP=0 disables it."""
+    if not get_settings().warmup:
+        with _lock:
+            _state["status"] = "disabled"
+        return None
+    return asyncio.create_task(_run_warm_up())
+
+
+def warm_up_state() -> Dict:
+    with _lock:
+        return {**_state, "steps": dict(_state["steps"])}
@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from storage import get_connection
+
+WEATHER_CACHE_TTL_SECONDS = float(os.getenv("WEATHER_CACHE_TTL_SECONDS", "600"))
+# Share entries between worker processes through the SQLite database.
+WEATHER_CACHE_SHARED = os.getenv("WEATHER_CACHE_SHARED", "0").lower() in ("1", "true", "yes")
+# How long past its bucket an entry may still be served when a fetch fails.
+WEATHER_STALE_SECONDS = float(os.getenv("WEATHER_STALE_SECONDS", "3600"))
+
+
+class WeatherCache:
+    """
+    Time-bucketed cache of current weather per city, with single-flight fetching.
+
+    Time is split into fixed buckets of ttl_seconds; an entry is valid for the bucket it
+    was fetched in, so every process refreshes a city at the same boundary. Concurrent
+    misses for the same city and bucket share one upstream call; callers that wait for
+    another's call are counted as coalesced, not as hits. Failed lookups (None)
+    are not cached; instead the previous entry for the city is returned if it is less
+    than stale_seconds past its bucket.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[..., Any],
+        ttl_seconds: float = WEATHER_CACHE_TTL_SECONDS,
+        shared: bool = WEATHER_CACHE_SHARED,
+        db_path: Optional[str] = None,
+        stale_seconds: float = WEATHER_STALE_SECONDS,
+        on_stale: Optional[Callable[[], None]] = None,
+    ):
+        self.factory = factory
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self.db_path = db_path
+        self.stale_seconds = stale_seconds
+        self.on_stale = on_stale
+        self.hits = 0
+        self.misses = 0
+        self.upstream_calls = 0
+        self.stale_served = 0
+        # Lookups that waited for another caller's fetch; neither hits nor misses.
+        self.coalesced = 0
+        self._entries: Dict[str, Tuple[int, Any]] = {}
+        self._lock = threading.Lock()
+        self._inflight_async: Dict[Tuple[str, int], asyncio.Task] = {}
+        self._inflight_sync: Dict[Tuple[str, int], threading.Event] = {}
+        self._schema_ready = False
+
+    @staticmethod
+    def normalize(city: str) -> str:
+        return " ".join(city.lower().split())
+
+    def _bucket(self) -> int:
+        return int(time.time() // self.ttl_seconds)
+
+    def _conn(self):
+        conn = get_connection(self.db_path)
+        if not self._schema_ready:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS weather_cache (
+                    city TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (city, bucket)
+                )
+            """)
+            self._schema_ready = True
+        return conn
+
+    def _lookup(self, city: str, bucket: int):
+        with self._lock:
+            entry = self._entries.get(city)
+        if entry is not None and entry[0] == bucket:
+            return entry[1]
+        if self.shared:
+            row = self._conn().execute(
+                "SELECT payload FROM weather_cache WHERE city = ? AND bucket = ?", (city, bucket)
+            ).fetchone()
+            if row is not None:
+                value = self.factory(**json.loads(row["payload"]))
+                with self._lock:
+                    self._entries[city] = (bucket, value)
+                return value
+        return None
+
+    def _store(self, city: str, bucket: int, value):
+        with self._lock:
+            self._entries[city] = (bucket, value)
+        if self.shared:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO weather_cache(city, bucket, payload, created_at) VALUES(?, ?, ?, ?)",
+                (city, bucket, json.dumps(value.__dict__), time.time()),
+            )
+            conn.execute("DELETE FROM weather_cache WHERE bucket < ?", (bucket - 1,))
+
+    def _stale(self, city: str):
+        """Returns the last fetched value for city if it is recent enough to stand in for a failed fetch."""
+        with self._lock:
+            entry = self._entries.get(city)
+            if entry is None or time.time() - (entry[0] + 1) * self.ttl_seconds > self.stale_seconds:
+                return None
+            self.stale_served += 1
+        if self.on_stale is not None:
+            self.on_stale()
+        return entry[1]
+
+    def _record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, city: str):
+        """Returns the cached value for the current bucket without fetching, or None."""
+        return self._lookup(self.normalize(city), self._bucket())
+
+    def get_or_fetch(self, city: str, fetch: Callable[[str], Any]):
+        """Blocking lookup; on a miss exactly one thread per city calls fetch(city)."""
+        key = (self.normalize(city), self._bucket())
+        while True:
+            value = self._lookup(*key)
+            if value is not None:
+                self._record(hit=True)
+                return value
+            with self._lock:
+                event = self._inflight_sync.get(key)
+                leader = event is None
+                if leader:
+                    event = self._inflight_sync[key] = threading.Event()
+            if not leader:
+                event.wait()
+                value = self._lookup(*key)
+                if value is not None:
+                    with self._lock:
+                        self.coalesced += 1
+                    return value
+                # The leader's fetch failed; try again as a new leader.
+                continue
+            try:
+                self._record(hit=False)
+                with self._lock:
+                    self.upstream_calls += 1
+                value = fetch(city)
+                if value is None:
+                    return self._stale(key[0])
+                self._store(*key, value)
+                return value
+            finally:
+                with self._lock:
+                    del self._inflight_sync[key]
+                event.set()
+
+    async def _fetch_async(self, key: Tuple[str, int], city: str, fetch: Callable[[str], Awaitable[Any]]):
+        value = await fetch(city)
+        if value is None:
+            return self._stale(key[0])
+        self._store(*key, value)
+        return value
+
+    def _fetch_done(self, key: Tuple[str, int], task: asyncio.Task):
+        self._inflight_async.pop(key, None)
+        if not task.cancelled():
+            # Mark retrieved so a failure nobody awaited any more doesn't log a warning.
+            task.exception()
+
+    async def get_or_fetch_async(self, city: str, fetch: Callable[[str], Awaitable[Any]]):
+        """
+        Async lookup; concurrent misses for the same city await a single fetch(city).
+
+        The fetch runs in its own task that every caller shields, so a caller that is
+        cancelled (a client disconnecting) neither cancels the fetch nor the other callers.
+        """
+        key = (self.normalize(city), self._bucket())
+        value = self._lookup(*key)
+        if value is not None:
+            self._record(hit=True)
+            return value
+
+        task = self._inflight_async.get(key)
+        if task is not None:
+            with self._lock:
+                self.coalesced += 1
+        else:
+            self._record(hit=False)
+            with self._lock:
+                self.upstream_calls += 1
+            task = asyncio.ensure_future(self._fetch_async(key, city, fetch))
+            self._inflight_async[key] = task
+            task.add_done_callback(lambda done: self._fetch_done(key, done))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "ttl_seconds": self.ttl_seconds,
+            "shared": self.shared,
+            "hits": self.hits,
+            "misses": self.misses,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "stale_served": self.stale_served,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }